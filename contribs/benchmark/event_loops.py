@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+'''Compare the event loops on websocket traffic of typical Wazo events.
+
+A websocket server sends the events of json_codecs.py, encoded as protocol v2
+`event` messages, to clients connected over the loopback interface. The server
+and the clients run on the same event loop, in this process, so the loop
+overhead is paid twice for each event.
+
+Throughput is the number of events received by all the clients per second, when
+events are sent as fast as the clients read them. Latency is the delay between
+encoding an event and receiving it, when each client receives an event every
+10 ms.
+
+usage: event_loops.py [CLIENTS] [EVENTS_PER_CLIENT]
+'''
+
+import asyncio
+import statistics
+import sys
+import time
+
+import websockets.client
+import websockets.server
+from json_codecs import EVENTS
+
+from wazo_websocketd.codec import JSONCodec
+from wazo_websocketd.eventloop import EVENT_LOOPS, loop_factory
+
+LATENCY_INTERVAL = 0.01
+
+
+async def _serve_events(ws, count, interval, codec):
+    events = list(EVENTS.values())
+    for index in range(count):
+        event = events[index % len(events)]
+        message = {'op': 'event', 'code': 0, 'data': event, 'ts': time.perf_counter()}
+        await ws.send(codec.dumps(message))
+        if interval:
+            await asyncio.sleep(interval)
+    await ws.close()
+
+
+async def _receive_events(port, codec, latencies):
+    async with websockets.client.connect(
+        f'ws://127.0.0.1:{port}', compression=None, ping_interval=None
+    ) as ws:
+        async for data in ws:
+            latencies.append(time.perf_counter() - codec.loads(data)['ts'])
+
+
+async def bench(clients, count, interval=0.0):
+    codec = JSONCodec()
+    latencies: list[float] = []
+    server = await websockets.server.serve(
+        lambda ws, path: _serve_events(ws, count, interval, codec),
+        '127.0.0.1',
+        0,
+        compression=None,
+        ping_interval=None,
+    )
+    port = server.sockets[0].getsockname()[1]
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(_receive_events(port, codec, latencies) for _ in range(clients))
+    )
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+    return len(latencies) / elapsed, latencies
+
+
+def main(clients, count):
+    print(f'{clients} clients, {count} events per client')
+    print(f'{"loop":8} {"events/s":>10} {"p50 ms":>8} {"p99 ms":>8}')
+    for name in EVENT_LOOPS:
+        factory = loop_factory(name)
+        if name != 'asyncio' and factory is asyncio.new_event_loop:
+            continue  # not installed
+        with asyncio.Runner(loop_factory=factory) as runner:
+            throughput, _ = runner.run(bench(clients, count))
+            _, latencies = runner.run(
+                bench(clients, count // 10 or 1, LATENCY_INTERVAL)
+            )
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(
+            f'{name:8} {throughput:10.0f} '
+            f'{percentiles[49] * 1e3:8.2f} {percentiles[98] * 1e3:8.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+    )
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+'''Compare the JSON codecs on typical Wazo events.
+
+Decoding measures what BusConsumer does for each delivery (UTF-8 decoding and
+parsing), encoding measures a command response sent to a client.
+
+usage: json_codecs.py [ITERATIONS]
+'''
+
+import sys
+import timeit
+
+from wazo_websocketd.codec import JSONCodec, OrjsonCodec
+
+TENANT_UUID = '2c34c282-433e-4bb8-8d56-fec14ff7e1e9'
+USER_UUID = '8b4c1e23-4d7f-4a8e-9e0b-7a6f1c2b3d4e'
+CALL = {
+    'call_id': '1672253456.123',
+    'conversation_id': '1672253456.120',
+    'caller_id_name': 'Alice',
+    'caller_id_number': '1001',
+    'peer_caller_id_name': 'Bob',
+    'peer_caller_id_number': '1002',
+    'creation_time': '2026-10-19T10:15:30.123+0000',
+    'answer_time': '2026-10-19T10:15:33.456+0000',
+    'status': 'Up',
+    'bridges': ['0b3b8e4c-1b1a-4f3c-9e5d-2f6a7b8c9d0e'],
+    'talking_to': {'1672253456.124': USER_UUID},
+    'user_uuid': USER_UUID,
+    'is_caller': True,
+    'is_video': False,
+    'on_hold': False,
+    'muted': False,
+    'record_state': 'inactive',
+    'sip_call_id': '5a6b7c8d9e0f@10.0.0.1',
+    'line_id': 12,
+    'direction': 'internal',
+    'dialed_extension': '1002',
+}
+EVENTS = {
+    'call_updated': {
+        'name': 'call_updated',
+        'origin_uuid': '3a1e5c9b-6d2f-4e8a-b7c0-1d2e3f4a5b6c',
+        'timestamp': '2026-10-19T10:15:33.789+00:00',
+        'tenant_uuid': TENANT_UUID,
+        'required_acl': f'events.calls.{USER_UUID}',
+        'required_access': f'event.call_updated.{USER_UUID}',
+        'data': CALL,
+    },
+    'user_status_update': {
+        'name': 'user_status_update',
+        'origin_uuid': '3a1e5c9b-6d2f-4e8a-b7c0-1d2e3f4a5b6c',
+        'timestamp': '2026-10-19T10:15:33.789+00:00',
+        'tenant_uuid': TENANT_UUID,
+        'required_acl': 'events.statuses.users',
+        'data': {'user_uuid': USER_UUID, 'tenant_uuid': TENANT_UUID, 'status': 'away'},
+    },
+    'chatd_presence_updated': {
+        'name': 'chatd_presence_updated',
+        'origin_uuid': '3a1e5c9b-6d2f-4e8a-b7c0-1d2e3f4a5b6c',
+        'timestamp': '2026-10-19T10:15:33.789+00:00',
+        'tenant_uuid': TENANT_UUID,
+        'required_acl': 'events.chatd.users.*.presences.updated',
+        'data': {
+            'uuid': USER_UUID,
+            'tenant_uuid': TENANT_UUID,
+            'state': 'available',
+            'status': '',
+            'last_activity': '2026-10-19T10:15:30.000000+00:00',
+            'line_state': 'talking',
+            'mobile': False,
+            'do_not_disturb': False,
+            'connected': True,
+            'lines': [{'id': 12, 'state': 'talking'}, {'id': 13, 'state': 'available'}],
+        },
+    },
+    'queue_log': {
+        'name': 'queue_log',
+        'origin_uuid': '3a1e5c9b-6d2f-4e8a-b7c0-1d2e3f4a5b6c',
+        'timestamp': '2026-10-19T10:15:33.789+00:00',
+        'tenant_uuid': TENANT_UUID,
+        'required_acl': 'events.queue_log',
+        'data': {
+            'queue_id': 3,
+            'queue_name': 'support',
+            'event': 'CONNECT',
+            'agent_id': 7,
+            'call_id': '1672253456.123',
+            'data1': '12',
+            'data2': '1672253456.125',
+            'data3': '3',
+        },
+    },
+}
+
+
+def _codecs():
+    yield JSONCodec()
+    try:
+        yield OrjsonCodec()
+    except ImportError:
+        print('orjson is not installed, skipping')
+
+
+def main(iterations):
+    stdlib = JSONCodec()
+    payloads = {name: stdlib.dumps(event).encode() for name, event in EVENTS.items()}
+    response = {'op': 'init', 'code': 0, 'data': {'version': 3}}
+
+    print(f'{"codec":8} {"event":24} {"decode µs":>10} {"encode µs":>10}')
+    for codec in _codecs():
+        for name, payload in payloads.items():
+            decode = timeit.timeit(
+                lambda: codec.loads(payload.decode('utf-8')), number=iterations
+            )
+            encode = timeit.timeit(lambda: codec.dumps(response), number=iterations)
+            print(
+                f'{codec.name:8} {name:24} '
+                f'{decode / iterations * 1e6:10.2f} {encode / iterations * 1e6:10.2f}'
+            )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+'''Measure the asyncio tasks and memory used by idle websocket sessions.
+
+The websocket, wazo-auth and the bus are replaced by minimal in-memory fakes,
+so mostly the cost of wazo_websocketd.session.Session itself is measured.
+
+usage: session_footprint.py [SESSIONS]
+'''
+
+import asyncio
+import gc
+import sys
+import tracemalloc
+from unittest.mock import patch
+
+from wazo_websocketd.keepalive import KeepaliveScheduler
+from wazo_websocketd.resume import StreamRegistry
+from wazo_websocketd.session import Session
+
+_TOKEN = {
+    'token': 'token',
+    'utc_expires_at': '2100-01-01T00:00:00',
+    'metadata': {'uuid': 'user', 'tenant_uuid': 'tenant'},
+}
+
+
+class FakeWebsocket:
+    remote_address = ('127.0.0.1', 0)
+
+    async def recv(self):
+        await asyncio.Event().wait()
+
+    async def send(self, data):
+        pass
+
+    async def close(self, *args):
+        pass
+
+
+class FakeConsumer:
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def set_handler(self, handler):
+        self._handler = handler
+
+    def get_token(self):
+        return _TOKEN
+
+
+class FakeBusService:
+    async def create_consumer(self, token):
+        return FakeConsumer()
+
+
+class FakeAuthenticator:
+    async def get_token(self, token_id):
+        return _TOKEN
+
+    async def run_check(self, token_getter):
+        await asyncio.Event().wait()
+
+    def schedule_check(self, token_getter, on_error):
+        return asyncio.get_event_loop().call_later(3600, on_error, None)
+
+
+class FakeEncoder:
+    def encode_init(self, version=2, session_id=None, resumed=False):
+        return ''
+
+
+async def main(count):
+    config = {
+        'websocket': {
+            'batch_max_events': 100,
+            'batch_max_bytes': 65536,
+            'batch_flush_interval': 0.01,
+            'max_queued_bytes': 1048576,
+        }
+    }
+    authenticator = FakeAuthenticator()
+    bus_service = FakeBusService()
+    keepalive = KeepaliveScheduler(60, 20)
+    streams = StreamRegistry({'enabled': False, 'max_age': 30, 'max_bytes': 0})
+
+    with patch('wazo_websocketd.session.MasterTenantProxy'):
+        gc.collect()
+        tasks_before = len(asyncio.all_tasks())
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+
+        runs = []
+        for _ in range(count):
+            session = Session(
+                config,
+                authenticator,
+                bus_service,
+                FakeEncoder(),
+                None,
+                keepalive,
+                streams,
+                None,
+                FakeWebsocket(),
+                '/?token=token',
+                None,
+            )
+            runs.append(asyncio.create_task(session.run()))
+        await asyncio.sleep(0.5)
+
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+        tasks = len(asyncio.all_tasks()) - tasks_before
+
+    # each run() task stands for the handler task created by websockets
+    print(f'sessions: {count}')
+    print(f'tasks per session: {tasks / count:.2f}')
+    print(f'memory per session: {(after - before) / count / 1024:.2f} KiB')
+    for run in runs:
+        run.cancel()
+    await asyncio.gather(*runs, return_exceptions=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+'''Compare the start methods of the worker processes.
+
+Each worker is started like ProcessPool does, and reports when it has imported
+the worker code, before it would start serving. The first start with the
+`forkserver` method includes the start of the fork server; the following ones
+are the respawns and rolling restarts.
+
+usage: worker_startup.py [WORKERS]
+'''
+
+import statistics
+import sys
+import time
+from multiprocessing import get_context
+
+from wazo_websocketd.process import _FORKSERVER_PRELOAD, START_METHODS
+
+
+def _report(conn):
+    import wazo_websocketd.process  # noqa: F401
+
+    conn.send(time.monotonic())
+    conn.close()
+
+
+def _start(context):
+    receiver, sender = context.Pipe(duplex=False)
+    start = time.monotonic()
+    process = context.Process(target=_report, args=(sender,))
+    process.start()
+    sender.close()
+    started = receiver.recv()
+    process.join()
+    return started - start
+
+
+def main(workers):
+    print(f'{"method":12} {"first ms":>10} {"next ms":>10}')
+    for method in START_METHODS:
+        context = get_context(method)
+        if method == 'forkserver':
+            context.set_forkserver_preload(_FORKSERVER_PRELOAD)
+        first = _start(context)
+        durations = [_start(context) for _ in range(workers)]
+        print(
+            f'{method:12} {first * 1e3:10.1f} '
+            f'{statistics.median(durations) * 1e3:10.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -84,7 +84,7 @@ class TestBus(IntegrationTest):
         self.event = {'name': 'foo', 'required_acl': 'event.foo'}
         await self._prepare(version=2)
         event = await self.websocketd_client.recv_msg()
-        self.assertEqual({"op": "event", "code": 0, "data": self.event}, event)
+        self.assertEqual({"op": "event", "code": 0, "id": 1, "data": self.event}, event)
 
         with self.auth_client.token(acl=['websocketd']) as token:
             await self.websocketd_client.op_token(token)
@@ -96,7 +96,7 @@ class TestBus(IntegrationTest):
             await self.websocketd_client.op_token(token)
             await self.bus_client.publish(self.event, self.tenant_uuid, self.user_uuid)
             event = await self.websocketd_client.recv_msg()
-        self.assertEqual({"op": "event", "code": 0, "data": self.event}, event)
+        self.assertEqual({"op": "event", "code": 0, "id": 2, "data": self.event}, event)
 
     async def test_user_receives_user_events(self):
         event = {'name': 'foo', 'required_acl': 'event.foo'}
@@ -0,0 +1,127 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+
+from .exception import AdmissionRejectedError
+from .stats import Timing
+
+
+class Admission:
+    '''Slots held by an admitted session.
+
+    The handshake slot is held until the session is initialized (token
+    validated, bus consumer created), the session slot until the session ends.
+    '''
+
+    __slots__ = ('_control', '_handshaking', '_closed')
+
+    def __init__(self, control: AdmissionControl):
+        self._control = control
+        self._handshaking = True
+        self._closed = False
+
+    def handshake_done(self) -> None:
+        if self._handshaking:
+            self._handshaking = False
+            self._control._end_handshake()
+
+    def close(self) -> None:
+        self.handshake_done()
+        if not self._closed:
+            self._closed = True
+            self._control._sessions -= 1
+
+
+class AdmissionControl:
+    '''Admission of the sessions of a worker.
+
+    At most `max_handshakes` sessions may be initializing at once, others wait
+    for their turn in order, for at most `wait_timeout` seconds. Sessions are
+    rejected when `max_waiting` sessions are already waiting, or when the worker
+    has `max_sessions` sessions (0 for no limit), so that a burst of reconnections
+    reaches wazo-auth and the bus at the pace they can serve.
+    '''
+
+    def __init__(self, config: dict):
+        self._max_handshakes: int = config['max_handshakes']
+        self._max_waiting: int = config['max_waiting']
+        self._wait_timeout: float = config['wait_timeout']
+        self._max_sessions: int = config['max_sessions']
+        self._handshakes = 0
+        self._sessions = 0
+        self._waiting = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._rejected = 0
+        self._wait_time = Timing()
+
+    async def admit(self) -> Admission:
+        '''Wait for a handshake slot.
+
+        Raises AdmissionRejectedError when the session is rejected.
+        '''
+        self._check_sessions()
+        if self._handshakes >= self._max_handshakes:
+            if self._waiting >= self._max_waiting:
+                self._reject(f'too many waiting sessions ({self._waiting})')
+            started_at = time.monotonic()
+            await self._wait_turn()
+            self._wait_time.add(time.monotonic() - started_at)
+            try:
+                self._check_sessions()
+            except AdmissionRejectedError:
+                self._end_handshake()
+                raise
+        else:
+            self._handshakes += 1
+        self._sessions += 1
+        return Admission(self)
+
+    def stats(self) -> dict:
+        rejected, self._rejected = self._rejected, 0
+        return {
+            'sessions': self._sessions,
+            'handshakes': self._handshakes,
+            'waiting': self._waiting,
+            'rejected': rejected,
+            **self._wait_time.collect('wait'),
+        }
+
+    def _check_sessions(self) -> None:
+        if self._max_sessions and self._sessions >= self._max_sessions:
+            self._reject(f'too many sessions ({self._sessions})')
+
+    def _reject(self, reason: str) -> None:
+        self._rejected += 1
+        raise AdmissionRejectedError(reason)
+
+    async def _wait_turn(self) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self._wait_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over meanwhile
+                self._end_handshake()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(f'no handshake slot after {self._wait_timeout}s')
+            raise
+        finally:
+            self._waiting -= 1
+
+    def _end_handshake(self) -> None:
+        # the slot is handed over to the next waiting session, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._handshakes -= 1
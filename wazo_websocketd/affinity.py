@@ -0,0 +1,112 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import logging
+import os
+from collections.abc import Iterable
+from itertools import zip_longest
+
+logger = logging.getLogger(__name__)
+
+_SYSFS_CPU = '/sys/devices/system/cpu'
+
+
+def parse_cpu_list(value: str | int) -> set[int]:
+    '''Parse a CPU list such as `0-7,16-23` (see cpuset(7)).
+
+    Raises a ValueError when the list is malformed.
+    '''
+    cpus: set[int] = set()
+    for part in str(value).split(','):
+        first, sep, last = part.strip().partition('-')
+        if sep:
+            start, end = int(first), int(last)
+            if start > end:
+                raise ValueError(f'invalid CPU range `{part}`')
+            cpus.update(range(start, end + 1))
+        else:
+            cpus.add(int(first))
+    return cpus
+
+
+def _read_int(path: str, default: int) -> int:
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return default
+
+
+def _topology(cpu: int) -> tuple[int, tuple[int, int]]:
+    '''Return the NUMA node and the physical core of a CPU.'''
+    path = f'{_SYSFS_CPU}/cpu{cpu}'
+    try:
+        names = os.listdir(path)
+    except OSError:
+        names = []
+    nodes = [
+        int(name[4:]) for name in names if name[:4] == 'node' and name[4:].isdigit()
+    ]
+    package = _read_int(f'{path}/topology/physical_package_id', 0)
+    core = _read_int(f'{path}/topology/core_id', cpu)
+    return (nodes[0] if nodes else 0), (package, core)
+
+
+def placement(cpus: Iterable[int]) -> list[int]:
+    '''Order the CPUs on which the workers are pinned, one CPU per worker.
+
+    Consecutive workers alternate between the NUMA nodes, and go to distinct
+    physical cores before sharing a core with a sibling hyper-thread.
+    '''
+    cores = set()
+    tiers: tuple[dict[int, list[int]], dict[int, list[int]]] = ({}, {})
+    for cpu in sorted(cpus):
+        node, core = _topology(cpu)
+        tier = tiers[1] if core in cores else tiers[0]
+        tier.setdefault(node, []).append(cpu)
+        cores.add(core)
+    return [
+        cpu
+        for tier in tiers
+        for group in zip_longest(*(tier[node] for node in sorted(tier)))
+        for cpu in group
+        if cpu is not None
+    ]
+
+
+def worker_cpus(config: dict) -> list[int]:
+    '''Return the CPUs of the workers, in placement order.
+
+    `cpus` is `auto`, for all the CPUs wazo-websocketd may run on, or a CPU list;
+    the CPUs of the list wazo-websocketd may not run on are ignored.
+    '''
+    available = os.sched_getaffinity(0)
+    if config['cpus'] == 'auto':
+        cpus = available
+    else:
+        configured = parse_cpu_list(config['cpus'])
+        cpus = configured & available
+        if ignored := configured - available:
+            logger.warning(
+                'ignoring unavailable CPUs: %s', ','.join(map(str, sorted(ignored)))
+            )
+        if not cpus:
+            raise ValueError('configuration key `cpu_affinity.cpus` has no usable CPU')
+    return placement(cpus)
+
+
+def pin(cpu: int) -> None:
+    '''Pin the calling process to a CPU.
+
+    Memory allocated from then on is placed on the NUMA node of the CPU, by the
+    default (local) memory policy of the kernel.
+    '''
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except OSError as e:
+        logger.warning('unable to pin worker to CPU %d: %s', cpu, e)
+        return
+    node, _ = _topology(cpu)
+    logger.debug('worker pinned to CPU %d (NUMA node %d)', cpu, node)
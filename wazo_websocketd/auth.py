@@ -5,50 +5,226 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import hashlib
+import json
 import logging
+import struct
+import time
 from abc import ABC, abstractmethod
 from collections import namedtuple
 from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from ctypes import Array as CArray
-from ctypes import c_wchar
+from ctypes import addressof, c_char, c_wchar, memmove, string_at
 from functools import partial
 from itertools import chain, repeat
+from multiprocessing import get_context
 from multiprocessing.sharedctypes import RawArray
 
 import requests
 from wazo_auth_client import Client as AuthClient
 from wazo_auth_client.types import TokenDict
 
-from .exception import AuthenticationError, AuthenticationExpiredError
+from .exception import (
+    AuthenticationError,
+    AuthenticationExpiredError,
+    AuthenticationOverloadedError,
+    AuthenticationUnavailableError,
+)
+from .stats import Timing
 
 logger = logging.getLogger(__name__)
 
 
+class _CircuitBreaker:
+    '''Stop calling wazo-auth for a while once it failed too many times in a row.
+
+    After `reset_timeout` seconds, a single trial request is let through: the
+    circuit closes again if it succeeds and stays open otherwise.
+    '''
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_pending = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow_request(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._trial_pending:
+            return False
+        if time.monotonic() - self._opened_at < self._reset_timeout:
+            return False
+        self._trial_pending = True
+        return True
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info('wazo-auth is reachable again, closing circuit')
+        self._failures = 0
+        self._opened_at = None
+        self._trial_pending = False
+
+    def release_trial(self) -> None:
+        # the trial request ended without an answer, e.g. it was cancelled
+        self._trial_pending = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_pending = False
+        if self._opened_at is not None:
+            self._opened_at = time.monotonic()
+        elif self._failures >= self._failure_threshold:
+            logger.warning(
+                'wazo-auth failed %d times in a row, opening circuit for %s seconds',
+                self._failures,
+                self._reset_timeout,
+            )
+            self._opened_at = time.monotonic()
+
+
+class _AuthExecutor:
+    '''Thread pool dedicated to the blocking wazo-auth requests.
+
+    At most `max_pending` requests may be waiting or running at once, further
+    requests are refused instead of piling up behind a slow wazo-auth.
+    '''
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix='wazo-websocketd-auth'
+        )
+        self._max_pending = max_pending
+        self._pending = 0
+        self._rejected = 0
+        self._wait_time = Timing()
+        self._run_time = Timing()
+
+    def check_capacity(self) -> None:
+        if self._pending >= self._max_pending:
+            self._rejected += 1
+            raise AuthenticationOverloadedError(
+                f'too many pending wazo-auth requests ({self._pending})'
+            )
+
+    async def run(self, func, *args):
+        self.check_capacity()
+        loop = asyncio.get_event_loop()
+        submitted_at = time.monotonic()
+        started_at = None
+
+        def job():
+            nonlocal started_at
+            started_at = time.monotonic()
+            return func(*args)
+
+        self._pending += 1
+        try:
+            return await loop.run_in_executor(self._executor, job)
+        finally:
+            self._pending -= 1
+            if started_at is not None:
+                self._wait_time.add(started_at - submitted_at)
+                self._run_time.add(time.monotonic() - started_at)
+
+    def stats(self) -> dict:
+        rejected, self._rejected = self._rejected, 0
+        return {
+            'pending': self._pending,
+            'rejected': rejected,
+            **self._wait_time.collect('wait'),
+            **self._run_time.collect('run'),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _is_service_failure(exc: requests.RequestException) -> bool:
+    # a response below 500 means wazo-auth answered: the token itself is refused
+    response = getattr(exc, 'response', None)
+    return response is None or response.status_code >= 500
+
+
+def _is_expired(token: dict) -> bool:
+    expires_at = datetime.datetime.fromisoformat(token['utc_expires_at'])
+    return expires_at <= datetime.datetime.utcnow()
+
+
 class AsyncAuthClient:
     _ACL = 'websocketd'
 
     def __init__(self, config):
         self._auth_client = AuthClient(**config['auth'])
+        self._breaker = _CircuitBreaker(
+            config['auth_circuit_breaker']['failure_threshold'],
+            config['auth_circuit_breaker']['reset_timeout'],
+        )
+        self._executor = _AuthExecutor(
+            config['auth_executor']['max_workers'],
+            config['auth_executor']['max_pending'],
+        )
+
+    def stats(self) -> dict:
+        return self._executor.stats()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    async def _call(self, func, *args):
+        self._executor.check_capacity()
+        if not self._breaker.allow_request():
+            raise AuthenticationUnavailableError('wazo-auth circuit is open')
+
+        try:
+            result = await self._executor.run(func, *args)
+        except requests.RequestException as e:
+            if _is_service_failure(e):
+                self._breaker.record_failure()
+                raise AuthenticationUnavailableError(e)
+            self._breaker.record_success()
+            raise
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        except BaseException:
+            self._breaker.release_trial()
+            raise
+        self._breaker.record_success()
+        return result
 
     async def get_token(self, token_id):
+        token = TokenCacheProxy.get(token_id)
+        if token is not None:
+            logger.debug('token found in shared token cache')
+            return token
+
         logger.debug('getting token from wazo-auth')
-        loop = asyncio.get_event_loop()
         try:
-            return await loop.run_in_executor(
-                None, self._auth_client.token.get, token_id, self._ACL
-            )
+            token = await self._call(self._auth_client.token.get, token_id, self._ACL)
         except requests.RequestException as e:
             # there's currently no clean way with wazo_auth_client to know if the
             # error was caused because the token is unauthorized, or unknown
             # or something else
             raise AuthenticationError(e)
+        TokenCacheProxy.put(token_id, token)
+        return token
 
     async def is_valid_token(self, token_id, acl=_ACL):
         logger.debug('checking token validity from wazo-auth')
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None, self._auth_client.token.is_valid, token_id, acl
-        )
+        try:
+            is_valid = await self._call(self._auth_client.token.is_valid, token_id, acl)
+        except requests.RequestException as e:
+            raise AuthenticationError(e)
+        if not is_valid:
+            TokenCacheProxy.invalidate(token_id)
+        return is_valid
 
 
 class _AuthChecker(ABC):
@@ -57,44 +233,59 @@ class _AuthChecker(ABC):
         ...
 
     @abstractmethod
-    async def run(self, token_getter: Callable[[], dict]) -> None:
+    def next_check(self, token: dict) -> float:
         ...
 
+    @abstractmethod
+    async def check(self, token: dict) -> None:
+        ...
+
+    async def run(self, token_getter: Callable[[], dict]) -> None:
+        while True:
+            await asyncio.sleep(self.next_check(token_getter()))
+            await self.check(token_getter())
+
 
 class _StaticIntervalAuthChecker(_AuthChecker):
     def __init__(self, async_auth_client, config):
         self._async_auth_client = async_auth_client
         self._interval = config['auth_check_static_interval']
 
-    async def run(self, token_getter):
-        while True:
-            await asyncio.sleep(self._interval)
-            logger.debug('static auth check: testing token validity')
-            token_id = token_getter()['token']
-            is_valid = await self._async_auth_client.is_valid_token(token_id)
-            if not is_valid:
+    def next_check(self, token):
+        return self._interval
+
+    async def check(self, token):
+        logger.debug('static auth check: testing token validity')
+        try:
+            is_valid = await self._async_auth_client.is_valid_token(token['token'])
+        except AuthenticationUnavailableError as e:
+            if _is_expired(token):
                 raise AuthenticationExpiredError()
+            logger.info('static auth check: keeping last known token (%s)', e)
+            return
+        if not is_valid:
+            raise AuthenticationExpiredError()
 
 
 class _DynamicIntervalAuthChecker(_AuthChecker):
     def __init__(self, async_auth_client, config):
         self._async_auth_client = async_auth_client
 
-    async def run(self, token_getter):
-        while True:
-            token = token_getter()
-            token_id = token['token']
-            now = datetime.datetime.utcnow()
-            expires_at = datetime.datetime.fromisoformat(token['utc_expires_at'])
-            next_check = self._calculate_next_check(now, expires_at)
-            await asyncio.sleep(next_check)
-            token = token_getter()
-            token_id = token['token']
-            logger.debug('dynamic auth check: testing token validity')
-            try:
-                await self._async_auth_client.get_token(token_id)
-            except AuthenticationError:
+    def next_check(self, token):
+        now = datetime.datetime.utcnow()
+        expires_at = datetime.datetime.fromisoformat(token['utc_expires_at'])
+        return self._calculate_next_check(now, expires_at)
+
+    async def check(self, token):
+        logger.debug('dynamic auth check: testing token validity')
+        try:
+            await self._async_auth_client.get_token(token['token'])
+        except AuthenticationUnavailableError as e:
+            if _is_expired(token):
                 raise AuthenticationExpiredError()
+            logger.info('dynamic auth check: keeping last known token (%s)', e)
+        except AuthenticationError:
+            raise AuthenticationExpiredError()
 
     def _calculate_next_check(self, now, expires_at):
         delta = expires_at - now
@@ -110,6 +301,52 @@ class _DynamicIntervalAuthChecker(_AuthChecker):
         return 43200
 
 
+class _ScheduledAuthCheck:
+    '''Check a session token periodically using a timer instead of a task.
+
+    A task only exists while the token is being checked. Any exception raised by
+    the check, most likely AuthenticationExpiredError, is given to `on_error`.
+    '''
+
+    def __init__(
+        self,
+        checker: _AuthChecker,
+        token_getter: Callable[[], dict],
+        on_error: Callable[[Exception], None],
+    ):
+        self._checker = checker
+        self._token_getter = token_getter
+        self._on_error = on_error
+        self._loop = asyncio.get_event_loop()
+        self._timer: asyncio.TimerHandle | None = None
+        self._task: asyncio.Task | None = None
+        self._schedule()
+
+    def cancel(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+        if self._task:
+            self._task.cancel()
+
+    def _schedule(self) -> None:
+        delay = self._checker.next_check(self._token_getter())
+        self._timer = self._loop.call_later(delay, self._start_check)
+
+    def _start_check(self) -> None:
+        self._timer = None
+        self._task = self._loop.create_task(self._check())
+
+    async def _check(self) -> None:
+        try:
+            await self._checker.check(self._token_getter())
+        except Exception as e:
+            self._task = None
+            self._on_error(e)
+        else:
+            self._task = None
+            self._schedule()
+
+
 STRATEGIES = {
     'static': _StaticIntervalAuthChecker,
     'dynamic': _DynamicIntervalAuthChecker,
@@ -136,10 +373,16 @@ class Authenticator:
         # This function returns a coroutine.
         return self._async_auth_client.is_valid_token(token_id, acl)
 
-    def run_check(self, token_getter):
-        # This function returns a coroutine that raise an AuthenticationExpiredError exception
-        # when the token expires.
-        return self._auth_check.run(token_getter)
+    def stats(self) -> dict:
+        return self._async_auth_client.stats()
+
+    def close(self) -> None:
+        self._async_auth_client.close()
+
+    def schedule_check(self, token_getter, on_error):
+        # Returns a handle to cancel the checks. `on_error` is called with an
+        # AuthenticationExpiredError exception when the token expires.
+        return _ScheduledAuthCheck(self._auth_check, token_getter, on_error)
 
 
 StringSharedBuffer = CArray[c_wchar]
@@ -167,6 +410,105 @@ class MasterTenantProxy:
         return cls.proxy.value is not None
 
 
+class SharedTokenCache:
+    '''Token validity cache shared by all the worker processes.
+
+    Entries are stored in a direct-mapped table allocated in shared memory: each
+    slot holds the SHA-256 digest of a token id, the time until which the entry
+    may be trusted and the JSON serialized token (metadata and ACL included).
+    Tokens that don't fit in a slot are simply not cached.
+    '''
+
+    _HEADER = struct.Struct('32sdI')  # token id digest, valid until, data length
+
+    def __init__(self, size: int, max_token_size: int, ttl: float):
+        if size < 1 or max_token_size < 1:
+            raise ValueError('token cache size must be a positive integer')
+        self._size = size
+        self._max_token_size = max_token_size
+        self._stride = self._HEADER.size + max_token_size
+        self._ttl = ttl
+        self._buffer: CArray[c_char] = RawArray(c_char, size * self._stride)
+        self._lock = get_context('spawn').Lock()
+
+    @classmethod
+    def from_config(cls, config: dict) -> SharedTokenCache | None:
+        cache_config = config['token_cache']
+        if not cache_config['enabled']:
+            return None
+        return cls(
+            cache_config['size'], cache_config['max_token_size'], cache_config['ttl']
+        )
+
+    def get(self, token_id: str) -> TokenDict | None:
+        digest, offset = self._locate(token_id)
+        with self._lock:
+            stored_digest, valid_until, length = self._HEADER.unpack_from(
+                self._buffer, offset
+            )
+            if stored_digest != digest or valid_until <= time.time():
+                return None
+            data = string_at(self._data_address(offset), length)
+        return json.loads(data)
+
+    def put(self, token_id: str, token: TokenDict) -> None:
+        data = json.dumps(token).encode('utf-8')
+        if len(data) > self._max_token_size:
+            logger.debug('token too large to be cached (%d bytes)', len(data))
+            return
+
+        try:
+            expires_at = datetime.datetime.fromisoformat(token['utc_expires_at'])
+        except (KeyError, TypeError, ValueError):
+            return
+        valid_until = min(
+            time.time() + self._ttl,
+            expires_at.replace(tzinfo=datetime.timezone.utc).timestamp(),
+        )
+        if valid_until <= time.time():
+            return
+
+        digest, offset = self._locate(token_id)
+        with self._lock:
+            memmove(self._data_address(offset), data, len(data))
+            self._HEADER.pack_into(self._buffer, offset, digest, valid_until, len(data))
+
+    def invalidate(self, token_id: str) -> None:
+        digest, offset = self._locate(token_id)
+        with self._lock:
+            stored_digest, _, _ = self._HEADER.unpack_from(self._buffer, offset)
+            if stored_digest == digest:
+                self._HEADER.pack_into(self._buffer, offset, bytes(32), 0.0, 0)
+
+    def _data_address(self, offset: int) -> int:
+        return addressof(self._buffer) + offset + self._HEADER.size
+
+    def _locate(self, token_id: str) -> tuple[bytes, int]:
+        digest = hashlib.sha256(token_id.encode('utf-8')).digest()
+        slot = int.from_bytes(digest[:8], 'little') % self._size
+        return digest, slot * self._stride
+
+
+class TokenCacheProxy:
+    proxy: SharedTokenCache | None = None
+
+    @classmethod
+    def get(cls, token_id: str) -> TokenDict | None:
+        if cls.proxy is None:
+            return None
+        return cls.proxy.get(token_id)
+
+    @classmethod
+    def put(cls, token_id: str, token: TokenDict) -> None:
+        if cls.proxy is not None:
+            cls.proxy.put(token_id, token)
+
+    @classmethod
+    def invalidate(cls, token_id: str) -> None:
+        if cls.proxy is not None:
+            cls.proxy.invalidate(token_id)
+
+
 class ServiceTokenRenewer:
     DEFAULT_EXPIRATION = 21600  # 6h
     DEFAULT_LEEWAY_FACTOR = 0.85
@@ -0,0 +1,345 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import socket
+from collections.abc import Callable
+from ctypes import Array as CArray
+from ctypes import c_uint64
+from hashlib import blake2b
+from multiprocessing.sharedctypes import RawArray
+from ssl import SSLContext
+
+from wazo_auth_client.types import TokenDict
+from websockets.server import WebSocketServerProtocol
+
+from .auth import AsyncAuthClient, SharedTokenCache
+from .exception import AuthenticationError, SessionProtocolError
+from .resume import stream_slot
+from .session import (
+    _extract_resume_from_path,
+    _extract_token_id_from_headers,
+    _extract_token_id_from_path,
+)
+
+logger = logging.getLogger(__name__)
+
+BALANCING_MODES = ('reuse_port', 'least_sessions', 'tenant_affinity')
+
+_MAX_REQUEST_SIZE = 8192
+_REQUEST_TIMEOUT = 5
+
+
+def _weight(key: str, slot: int) -> int:
+    digest = blake2b(f'{slot}:{key}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _parse_request(request: bytes) -> tuple[str, list[tuple[str, str]]]:
+    lines = request.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    path = parts[1] if len(parts) == 3 else ''
+    headers = [
+        (name.strip(), value.strip())
+        for name, sep, value in (line.partition(':') for line in lines[1:])
+        if sep
+    ]
+    return path, headers
+
+
+def _parse_token_id(request: bytes) -> str | None:
+    path, headers = _parse_request(request)
+    return _extract_token_id_from_path(path) or _extract_token_id_from_headers(headers)
+
+
+def _parse_stream_slot(request: bytes) -> int | None:
+    path, _ = _parse_request(request)
+    try:
+        session_id, _ = _extract_resume_from_path(path)
+    except SessionProtocolError:
+        return None
+    return stream_slot(session_id) if session_id else None
+
+
+async def _wait_readable(connection: socket.socket) -> None:
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+
+    def on_readable():
+        if not readable.done():
+            readable.set_result(None)
+
+    loop.add_reader(connection.fileno(), on_readable)
+    try:
+        await readable
+    finally:
+        loop.remove_reader(connection.fileno())
+
+
+class SessionCounts:
+    '''Connections opened and closed by each worker process, in shared memory.
+
+    Each slot is only written by its worker (and reset by the main process before
+    the worker starts), so no lock is needed.
+    '''
+
+    def __init__(self, slots: int):
+        self._opened: CArray[c_uint64] = RawArray(c_uint64, slots)
+        self._closed: CArray[c_uint64] = RawArray(c_uint64, slots)
+
+    def on_open(self, slot: int) -> None:
+        self._opened[slot] += 1
+
+    def on_close(self, slot: int) -> None:
+        self._closed[slot] += 1
+
+    def closed(self, slot: int) -> int:
+        return self._closed[slot]
+
+    def sessions(self, slot: int) -> int:
+        return self._opened[slot] - self._closed[slot]
+
+    def reset(self, slot: int) -> None:
+        self._opened[slot] = 0
+        self._closed[slot] = 0
+
+
+class CountingServerProtocol(WebSocketServerProtocol):
+    def __init__(self, *args, counts: SessionCounts, slot: int, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._counts = counts
+        self._slot = slot
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        self._counts.on_open(self._slot)
+
+    def connection_lost(self, exc):
+        super().connection_lost(exc)
+        self._counts.on_close(self._slot)
+
+
+class ConnectionBalancer:
+    '''Accept the connections in the main process and hand each one to a worker.
+
+    Each worker has a Unix socket pair over which the accepted sockets are passed
+    (SCM_RIGHTS). A connection goes to the serving worker with the fewest
+    connections: those passed to it, minus those it has closed.
+
+    With tenant affinity, the HTTP request of the connection is peeked to find
+    its token, and the connection goes to the worker selected by rendezvous
+    hashing of the tenant of the token. A token missing from the shared token
+    cache is fetched from wazo-auth and cached, so that the worker finds it; the
+    token itself is hashed when its tenant can't be found.
+
+    When sessions can be resumed, the HTTP request is peeked as well, and a
+    connection resuming a session goes to the worker of the session, found in its
+    `session_id`.
+    '''
+
+    def __init__(
+        self,
+        config: dict,
+        counts: SessionCounts,
+        ready: Callable[[int], bool],
+        token_cache: SharedTokenCache | None = None,
+        auth_client: AsyncAuthClient | None = None,
+    ):
+        self._address = (config['websocket']['listen'], config['websocket']['port'])
+        self._affinity = config['load_balancing'] == 'tenant_affinity'
+        self._resume = config['websocket']['resume']['enabled']
+        if config['websocket']['ssl'] is not None:
+            if self._affinity:
+                logger.warning('tenant affinity is not supported with TLS, ignoring it')
+            if self._resume:
+                logger.warning(
+                    'resumed sessions are not routed to their worker with TLS'
+                )
+            self._affinity = self._resume = False
+        self._counts = counts
+        self._ready = ready
+        self._token_cache = token_cache
+        self._auth_client = auth_client
+        self._routing: set[asyncio.Task] = set()
+        self._channels: dict[int, socket.socket] = {}
+        self._dispatched: dict[int, int] = {}
+        self._listener: socket.socket | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._listener = socket.create_server(self._address)
+        self._listener.setblocking(False)
+        self._task = asyncio.create_task(self._accept(self._listener))
+        logger.info('balancing connections on %s:%s', *self._address)
+
+    async def stop(self) -> None:
+        tasks = [*self._routing, self._task] if self._task else list(self._routing)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._listener is not None:
+            self._listener.close()
+        for slot in list(self._channels):
+            self.detach(slot)
+
+    def attach(self, slot: int, channel: socket.socket) -> None:
+        channel.setblocking(False)
+        self._channels[slot] = channel
+        self._dispatched[slot] = 0
+
+    def detach(self, slot: int) -> None:
+        channel = self._channels.pop(slot, None)
+        if channel is not None:
+            channel.close()
+
+    def load(self, slot: int) -> int:
+        return self._dispatched[slot] - self._counts.closed(slot)
+
+    async def _accept(self, listener: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                connection, _ = await loop.sock_accept(listener)
+            except OSError as e:
+                # e.g. too many open files, let some connections close
+                logger.error('unable to accept connection: %s', e)
+                await asyncio.sleep(0.1)
+                continue
+            if self._affinity or self._resume:
+                task = asyncio.create_task(self._route(connection))
+                self._routing.add(task)
+                task.add_done_callback(self._routing.discard)
+                continue
+            with connection:
+                self._dispatch(connection)
+
+    async def _route(self, connection: socket.socket) -> None:
+        with connection:
+            try:
+                request = await asyncio.wait_for(
+                    self._peek_request(connection), _REQUEST_TIMEOUT
+                )
+            except (asyncio.TimeoutError, OSError) as e:
+                logger.debug('unable to read request: %s', e)
+                request = b''
+            owner = _parse_stream_slot(request) if self._resume and request else None
+            key = await self._affinity_key(request) if self._affinity else None
+            self._dispatch(connection, key, owner)
+
+    @staticmethod
+    async def _peek_request(connection: socket.socket) -> bytes:
+        # the request stays in the socket buffer for the worker
+        while True:
+            await _wait_readable(connection)
+            request = connection.recv(_MAX_REQUEST_SIZE, socket.MSG_PEEK)
+            if not request or b'\r\n\r\n' in request:
+                return request
+            if len(request) >= _MAX_REQUEST_SIZE:
+                return request
+            await asyncio.sleep(0.01)
+
+    async def _affinity_key(self, request: bytes) -> str | None:
+        token_id = _parse_token_id(request) if request else None
+        if not token_id:
+            return None
+        token = self._token_cache.get(token_id) if self._token_cache else None
+        if token is None and self._auth_client is not None:
+            token = await self._fetch_token(self._auth_client, token_id)
+        if token is not None:
+            tenant_uuid = token['metadata'].get('tenant_uuid')
+            if tenant_uuid:
+                return tenant_uuid
+        return token_id
+
+    async def _fetch_token(
+        self, auth_client: AsyncAuthClient, token_id: str
+    ) -> TokenDict | None:
+        try:
+            token = await auth_client.get_token(token_id)
+        except AuthenticationError as e:
+            logger.debug('unable to find the tenant of the connection: %s', e)
+            return None
+        if self._token_cache is not None:
+            self._token_cache.put(token_id, token)
+        return token
+
+    def _dispatch(
+        self,
+        connection: socket.socket,
+        key: str | None = None,
+        owner: int | None = None,
+    ) -> None:
+        slots = sorted(self._channels, key=self.load)
+        candidates = [slot for slot in slots if self._ready(slot)] or slots
+        if owner in candidates:
+            # a resumed session goes back to the worker of its stream
+            candidates.remove(owner)
+            candidates.insert(0, owner)
+        elif key is not None and candidates:
+            preferred = max(candidates, key=lambda slot: _weight(key, slot))
+            candidates.remove(preferred)
+            candidates.insert(0, preferred)
+        for slot in candidates:
+            try:
+                socket.send_fds(self._channels[slot], [b'\0'], [connection.fileno()])
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                logger.warning('unable to pass connection to worker %d: %s', slot, e)
+                self.detach(slot)
+                continue
+            self._dispatched[slot] += 1
+            return
+        logger.warning('no worker available, connection dropped')
+
+
+async def receive_connections(
+    channel: socket.socket,
+    protocol_factory: Callable[[], asyncio.Protocol],
+    ssl: SSLContext | None,
+    counts: SessionCounts,
+    slot: int,
+) -> None:
+    '''Serve the connections passed by the ConnectionBalancer until cancelled.'''
+    loop = asyncio.get_running_loop()
+    closed = loop.create_future()
+    connecting: set[asyncio.Task] = set()
+
+    async def connect(sock: socket.socket) -> None:
+        try:
+            await loop.connect_accepted_socket(protocol_factory, sock, ssl=ssl)
+        except Exception as e:
+            logger.debug('unable to serve passed connection: %s', e)
+            sock.close()
+            counts.on_open(slot)
+            counts.on_close(slot)
+
+    def on_readable() -> None:
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(channel, 1, 1)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                message, fds = b'', []
+                logger.debug('connection channel error: %s', e)
+            if not message and not fds:
+                if not closed.done():
+                    closed.set_result(None)
+                return
+            for fd in fds:
+                task = loop.create_task(connect(socket.socket(fileno=fd)))
+                connecting.add(task)
+                task.add_done_callback(connecting.discard)
+
+    channel.setblocking(False)
+    loop.add_reader(channel.fileno(), on_readable)
+    try:
+        await closed
+        logger.info('connection channel closed by the main process')
+    finally:
+        loop.remove_reader(channel.fileno())
+        channel.close()
@@ -1,15 +1,15 @@
-# Copyright 2016-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2016-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from __future__ import annotations
 
 import asyncio
-import json
 import logging
+from collections.abc import Callable
 from itertools import chain, cycle, repeat
 from multiprocessing import Value
 from secrets import token_hex
-from typing import NamedTuple
+from typing import TYPE_CHECKING, NamedTuple
 
 import aioamqp
 from aioamqp import AmqpProtocol
@@ -21,6 +21,7 @@ from wazo_auth_client.types import TokenDict
 from xivo.auth_verifier import AccessCheck
 
 from .auth import MasterTenantProxy
+from .codec import JSONCodec, load_codec
 from .exception import (
     BusConnectionError,
     BusConnectionLostError,
@@ -28,6 +29,10 @@ from .exception import (
     InvalidEvent,
     InvalidTokenError,
 )
+from .subscription import EventFilter, Subscriptions, is_pattern
+
+if TYPE_CHECKING:
+    from .fanout import EventFanout
 
 logger = logging.getLogger(__name__)
 
@@ -174,8 +179,10 @@ class _BusConnection:
                 f'[connection {self._id}] failed to create a new channel'
             )
 
-    def spawn_consumer(self, config: dict, token: TokenDict) -> BusConsumer:
-        consumer = BusConsumer(self, config, token)
+    def spawn_consumer(
+        self, config: dict, token: TokenDict, codec: JSONCodec
+    ) -> BusConsumer:
+        consumer = BusConsumer(self, config, token, codec)
         self._consumers.append(consumer)
         return consumer
 
@@ -237,8 +244,15 @@ class _BusConnectionPool:
 
 
 class BusConsumer:
-    def __init__(self, connection: _BusConnection, config: dict, token: TokenDict):
+    def __init__(
+        self,
+        connection: _BusConnection,
+        config: dict,
+        token: TokenDict,
+        codec: JSONCodec | None = None,
+    ):
         self.set_token(token)
+        self._codec: JSONCodec = codec or JSONCodec()
         self._amqp_queue: str | None = None
         self._bound_exchange: str | None = None
         self._channel: Channel = None
@@ -247,23 +261,23 @@ class BusConsumer:
         self._exchange_name: str = config['bus']['exchange_name']
         self._prefetch: int = config['bus']['consumer_prefetch']
         self._origin_uuid: str = config['uuid']
-        self._queue: asyncio.Queue = asyncio.Queue()
+        self._handler: Callable[[BusMessage | Exception], None] = self._discard
+        self._subscriptions = Subscriptions()
 
     async def __aenter__(self):
-        await self._start_consuming()
+        await self.start()
         return self
 
     async def __aexit__(self, *args):
-        await self._stop_consuming()
+        await self.stop()
 
-    def __aiter__(self):
-        return self
+    def set_handler(self, handler: Callable[[BusMessage | Exception], None]) -> None:
+        # the handler receives each event, or the exception ending the consumption
+        self._handler = handler
 
-    async def __anext__(self) -> BusMessage:
-        payload = await self._queue.get()
-        if isinstance(payload, Exception):
-            raise payload
-        return payload
+    @staticmethod
+    def _discard(payload: BusMessage | Exception) -> None:
+        logger.debug('no handler set, discarding %r', payload)
 
     async def _consume_queue(self, channel: Channel, queue_name: str) -> str:
         response = await channel.basic_consume(
@@ -303,42 +317,19 @@ class BusConsumer:
         return response['queue']
 
     def _decode_content(self, content: bytes, properties: Properties) -> BusMessage:
-        headers = properties.headers
-        try:
-            decoded = content.decode('utf-8')
-            message = json.loads(decoded)
-        except (UnicodeDecodeError, json.JSONDecodeError):
-            raise InvalidEvent('unable to decode message')
-
-        if not isinstance(message, dict):
-            raise InvalidEvent('invalid message format (not a dict)')
-
-        event_name = headers.get('name') or message.get('name')
-        if not event_name:
-            raise InvalidEvent('event is missing `name` field')
-
-        if 'required_acl' not in headers:
-            raise EventPermissionError(f'event `{event_name}` doesn\'t contain ACLs`')
-        acl = headers.get('required_acl')
-
-        if isinstance(acl, bytes):
-            acl = acl.decode('utf-8')
-        if acl and not isinstance(acl, str):
-            raise InvalidEvent(
-                'event ACL is not a string (type: %s)', type(acl).__name__
-            )
-
-        if not self._has_access(acl):
+        event = decode_event(self._codec, content, properties.headers)
+        if not self._has_access(event.acl):  # type: ignore[arg-type]
             raise EventPermissionError(
                 f'user `{self._user.uuid}` doesn\'t have '
-                f'the required ACL for event `{event_name}` (missing: {acl})'
+                f'the required ACL for event `{event.name}` (missing: {event.acl})'
             )
-
-        return BusMessage(event_name, headers, acl, message, decoded)
+        return event
 
     def _generate_bindings(self, event_name: str) -> list[dict]:
+        # headers exchanges can't match patterns: `*` and prefixes such as
+        # `call_*` are bound to every event name and matched on delivery
         binding = {}
-        if event_name != '*':
+        if not is_pattern(event_name):
             binding['name'] = event_name
 
         if self._user.is_admin():
@@ -354,6 +345,19 @@ class BusConsumer:
     def _has_access(self, acl: str) -> bool:
         return self._access.matches_required_access(acl)
 
+    def can_receive(self, message: BusMessage) -> bool:
+        # same checks as the bindings of this consumer and the decoding of events
+        user, headers = self._user, message.headers
+        if not user.is_master_tenant():
+            if headers.get('tenant_uuid') != user.tenant_uuid:
+                return False
+        if not user.is_admin():
+            if not (
+                headers.get(f'user_uuid:{user.uuid}') or headers.get('user_uuid:*')
+            ):
+                return False
+        return self._has_access(message.acl)  # type: ignore[arg-type]
+
     async def _on_message(
         self,
         channel: Channel,
@@ -368,11 +372,12 @@ class BusConsumer:
         except EventPermissionError as exc:
             logger.debug('discarding event (reason: %s)', exc)
         else:
-            self._queue.put_nowait(event)
+            if self._subscriptions.accepts(event.name, event.content):
+                self._handler(event)
         finally:
             await channel.basic_client_ack(envelope.delivery_tag, multiple=True)
 
-    async def _start_consuming(self) -> None:
+    async def start(self) -> None:
         channel = self._channel = await self._connection.get_channel(wait=False)
         exchange = self._exchange_name
 
@@ -380,12 +385,9 @@ class BusConsumer:
             exchange = await self._create_tenant_exchange(channel, self._exchange_name)
         self._bound_exchange = exchange
 
-        # Create exclusive queue on exchange
+        # Create exclusive queue on exchange, bound and consumed by `consume`
         self._amqp_queue = await self._create_queue(channel, self._prefetch)
 
-        # Start consuming on queue
-        self._consumer_tag = await self._consume_queue(channel, self._amqp_queue)
-
         if self._user.is_master_tenant():
             logger.debug('user `%s` connected as global admin', self._user.uuid)
         elif self._user.is_admin():
@@ -393,23 +395,51 @@ class BusConsumer:
         else:
             logger.debug('user `%s` connected as user', self._user.uuid)
 
-    async def _stop_consuming(self) -> None:
-        if self._channel.is_open:
+    async def stop(self) -> None:
+        if self._channel is not None and self._channel.is_open:
             if self._consumer_tag is not None:
                 await self._channel.basic_cancel(self._consumer_tag)
             await self._channel.close()
         self._connection.remove_consumer(self)
 
-    async def bind(self, event_name: str) -> None:
+    @property
+    def is_consuming(self) -> bool:
+        return self._consumer_tag is not None
+
+    async def consume(self) -> None:
+        # events are neither bound nor delivered until the session starts, so the
+        # broker doesn't route, and this worker doesn't decode, discarded events
+        if self.is_consuming:
+            return
+        for event_name in self._subscriptions:
+            await self._bind(event_name)
+        self._consumer_tag = await self._consume_queue(
+            self._channel, self._amqp_queue  # type: ignore[arg-type]
+        )
+
+    async def bind(
+        self, event_name: str, event_filter: EventFilter | None = None
+    ) -> None:
+        self._subscriptions.add(event_name, event_filter)
+        if self.is_consuming:
+            await self._bind(event_name)
+
+    async def _bind(self, event_name: str) -> None:
         for binding in self._generate_bindings(event_name):
             await self._channel.queue_bind(
                 self._amqp_queue, self._bound_exchange, '', arguments=binding
             )
 
     async def connection_lost(self) -> None:
-        self._queue.put_nowait(BusConnectionLostError())
+        self._handler(BusConnectionLostError())
 
     async def unbind(self, event_name: str) -> None:
+        self._subscriptions.remove(event_name)
+        if not self.is_consuming:
+            return
+        if is_pattern(event_name) and self._subscriptions.has_patterns():
+            # the remaining patterns still need the same bindings
+            return
         for binding in self._generate_bindings(event_name):
             await self._channel.queue_unbind(
                 self._amqp_queue, self._bound_exchange, '', arguments=binding
@@ -438,26 +468,63 @@ class BusMessage(NamedTuple):
     raw: str
 
 
+def decode_event(codec: JSONCodec, content: bytes, headers: dict) -> BusMessage:
+    try:
+        decoded = content.decode('utf-8')
+        message = codec.loads(decoded)
+    except ValueError:  # includes UnicodeDecodeError
+        raise InvalidEvent('unable to decode message')
+
+    if not isinstance(message, dict):
+        raise InvalidEvent('invalid message format (not a dict)')
+
+    event_name = headers.get('name') or message.get('name')
+    if not event_name:
+        raise InvalidEvent('event is missing `name` field')
+
+    if 'required_acl' not in headers:
+        raise EventPermissionError(f'event `{event_name}` doesn\'t contain ACLs`')
+    acl = headers.get('required_acl')
+
+    if isinstance(acl, bytes):
+        acl = acl.decode('utf-8')
+    if acl and not isinstance(acl, str):
+        raise InvalidEvent('event ACL is not a string (type: %s)', type(acl).__name__)
+
+    return BusMessage(event_name, headers, acl, message, decoded)
+
+
 class BusService:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, fanout: EventFanout | None = None):
         poolsize: int = config.get('worker_connections', 1)
         url: str = 'amqp://{username}:{password}@{host}:{port}//'.format(
             **config['bus']
         )
 
         self._config = config
+        self._codec = load_codec(config['json_codec'])
         self._connection_pool = _BusConnectionPool(url, poolsize)
+        # with a fanout, events are consumed by the main process and relayed
+        self._fanout = fanout
 
     async def __aenter__(self):
-        await self._connection_pool.start()
+        if self._fanout is None:
+            await self._connection_pool.start()
         return self
 
     async def __aexit__(self, *args):
-        await self._connection_pool.stop()
+        if self._fanout is None:
+            await self._connection_pool.stop()
+
+    async def get_channel(self) -> Channel:
+        connection = self._connection_pool.get_connection()
+        return await connection.get_channel(wait=True)
 
     async def create_consumer(self, token: TokenDict) -> BusConsumer:
+        if self._fanout is not None:
+            return self._fanout.create_consumer(token)
         connection = self._connection_pool.get_connection()
-        return connection.spawn_consumer(self._config, token)
+        return connection.spawn_consumer(self._config, token, self._codec)
 
     async def initialize_exchanges(self):
         async def create_exchange(config: dict, channel: Channel):
@@ -0,0 +1,138 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import json
+import logging
+from functools import cache
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'wazo_websocketd.json_codecs'
+
+
+class JSONCodec:
+    '''JSON codec of the standard library, used when no other codec is available.
+
+    Codecs raise a ValueError when the document can't be decoded.
+    '''
+
+    name = 'json'
+
+    def loads(self, data: str) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    '''orjson codec, falling back to the standard library for the documents
+    orjson rejects but `json` accepts: NaN and Infinity, lone surrogates, and
+    integers beyond 64 bits when encoding.
+
+    Unlike `json`, integers beyond 64 bits are decoded as floats, and NaN and
+    Infinity floats are encoded as `null`.
+    '''
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def loads(self, data: str) -> Any:
+        try:
+            return self._orjson.loads(data)
+        except ValueError:
+            return json.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        try:
+            return self._orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            return json.dumps(obj)
+
+
+class BinaryCodec:
+    '''Base class of the codecs of the binary session protocols.
+
+    Codecs raise a ValueError when the document can't be decoded or encoded.
+    '''
+
+    name: str
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError()
+
+    def dumps(self, obj: Any) -> bytes:
+        raise NotImplementedError()
+
+
+class MsgpackCodec(BinaryCodec):
+    name = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+
+        self._msgpack = msgpack
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return self._msgpack.unpackb(data)
+        except Exception as e:
+            raise ValueError(e)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._msgpack.packb(obj)
+        except Exception as e:
+            # e.g. integers beyond 64 bits
+            raise ValueError(e)
+
+
+class CborCodec(BinaryCodec):
+    name = 'cbor'
+
+    def __init__(self):
+        import cbor2
+
+        self._cbor2 = cbor2
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return self._cbor2.loads(data)
+        except Exception as e:
+            raise ValueError(e)
+
+    def dumps(self, obj: Any) -> bytes:
+        try:
+            return self._cbor2.dumps(obj)
+        except Exception as e:
+            raise ValueError(e)
+
+
+BINARY_CODECS: dict[str, type[BinaryCodec]] = {
+    'msgpack': MsgpackCodec,
+    'cbor': CborCodec,
+}
+
+
+@cache
+def load_codec(name: str) -> JSONCodec:
+    if name == JSONCodec.name:
+        return JSONCodec()
+
+    # stevedore scans the installed entry points, only when a plugin is needed
+    from stevedore import DriverManager
+
+    try:
+        manager = DriverManager(NAMESPACE, name, invoke_on_load=True)
+    except Exception as e:
+        logger.warning('unable to load JSON codec `%s` (%s), using `json`', name, e)
+        return JSONCodec()
+    logger.debug('using JSON codec `%s`', name)
+    return manager.driver
@@ -0,0 +1,116 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+from time import thread_time
+
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import CTRL_OPCODES, OP_CONT, Frame
+
+
+class CompressionStats:
+    __slots__ = ('messages', 'skipped', 'bytes_in', 'bytes_out', 'cpu_time')
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        self.messages = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_time = 0.0
+
+    def collect(self) -> dict:
+        ratio = self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+        values = {
+            'messages': self.messages,
+            'skipped': self.skipped,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'ratio': round(ratio, 3),
+            'cpu_ms': round(self.cpu_time * 1000, 3),
+        }
+        self._reset()
+        return values
+
+
+class MeteredPerMessageDeflate(PerMessageDeflate):
+    '''Per-message deflate that sends small messages uncompressed.
+
+    Messages smaller than `min_size` bytes are sent as is (RFC 7692 allows
+    uncompressed messages on a compressed connection); the other ones are
+    compressed and accounted in the worker compression stats.
+    '''
+
+    def __init__(self, *args, min_size: int, stats: CompressionStats, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._min_size = min_size
+        self._stats = stats
+        self._skip_cont = False
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+
+        if frame.opcode is not OP_CONT:
+            self._skip_cont = len(frame.data) < self._min_size
+            if self._skip_cont:
+                self._stats.skipped += 1
+            else:
+                self._stats.messages += 1
+        if self._skip_cont:
+            return frame
+
+        start = thread_time()
+        encoded = super().encode(frame)
+        self._stats.cpu_time += thread_time() - start
+        self._stats.bytes_in += len(frame.data)
+        self._stats.bytes_out += len(encoded.data)
+        return encoded
+
+
+class CompressionFactory(ServerPerMessageDeflateFactory):
+    '''Negotiate permessage-deflate with the clients that offer it.
+
+    All the sessions of a worker share the compression settings and stats.
+    '''
+
+    def __init__(self, config: dict, stats: CompressionStats):
+        super().__init__(
+            server_no_context_takeover=config['server_no_context_takeover'],
+            client_no_context_takeover=config['client_no_context_takeover'],
+            server_max_window_bits=config['server_max_window_bits'],
+            client_max_window_bits=config['client_max_window_bits'],
+            compress_settings={
+                'level': config['level'],
+                'memLevel': config['memory_level'],
+            },
+        )
+        self._min_size = config['min_size']
+        self._stats = stats
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(
+            params, accepted_extensions
+        )
+        metered = MeteredPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            min_size=self._min_size,
+            stats=self._stats,
+        )
+        return response_params, metered
+
+
+def create_extensions(config: dict, stats: CompressionStats) -> list:
+    if not config['enabled']:
+        return []
+    return [CompressionFactory(config, stats)]
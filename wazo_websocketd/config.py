@@ -6,6 +6,7 @@ from __future__ import annotations
 import argparse
 import logging
 import ssl
+from collections.abc import Mapping
 from typing import Any
 
 from xivo.chain_map import ChainMap
@@ -28,6 +29,27 @@ _DEFAULT_CONFIG = {
         'key_file': '/var/lib/wazo-auth-keys/wazo-websocketd-key.yml',
     },
     'auth_check_strategy': 'dynamic',
+    'auth_circuit_breaker': {
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    },
+    'auth_executor': {
+        'max_workers': 10,
+        'max_pending': 100,
+    },
+    'admission': {
+        'max_handshakes': 50,
+        'max_waiting': 5000,
+        'wait_timeout': 10,
+        'max_sessions': 0,
+        'retry_max_delay': 10000,
+    },
+    'token_cache': {
+        'enabled': True,
+        'size': 1024,
+        'max_token_size': 16384,
+        'ttl': 30,
+    },
     'bus': {
         'host': 'localhost',
         'port': 5672,
@@ -37,16 +59,69 @@ _DEFAULT_CONFIG = {
         'exchange_name': 'wazo-headers',
         'exchange_type': 'headers',
         'consumer_prefetch': 250,
+        'fanout': {
+            'enabled': False,
+            'buffer_size': 16777216,
+        },
     },
     'websocket': {
         'listen': '127.0.0.1',
         'port': 9502,
         'certificate': None,
         'private_key': None,
-        'ping_interval': 60,
+        'ping_interval': 10,
+        'ping_timeout': 20,
+        'batch_max_events': 100,
+        'batch_max_bytes': 65536,
+        'batch_flush_interval': 0.01,
+        'max_queued_bytes': 1048576,
+        'compression': {
+            'enabled': True,
+            'level': 6,
+            'memory_level': 5,
+            'server_max_window_bits': 12,
+            'client_max_window_bits': 12,
+            'server_no_context_takeover': False,
+            'client_no_context_takeover': False,
+            'min_size': 256,
+        },
+        'resume': {
+            'enabled': False,
+            'max_age': 30,
+            'max_bytes': 262144,
+        },
     },
+    'last_value_cache': {
+        'enabled': False,
+        'max_entries': 10000,
+        'max_age': 3600,
+        'events': {
+            'chatd_presence_updated': 'data.uuid',
+            'agent_status_update': 'data.agent_id',
+            'user_status_update': 'data.user_uuid',
+        },
+    },
+    'drain': {
+        'window': 10,
+        'batches': 10,
+        'reconnect_max_delay': 5000,
+    },
+    'json_codec': 'json',
+    'event_loop': 'asyncio',
     'process_workers': 'auto',
+    'worker_start_method': 'forkserver',
+    'cpu_affinity': {
+        'enabled': False,
+        'cpus': 'auto',
+    },
+    'load_balancing': 'reuse_port',
+    'supervisor': {
+        'heartbeat_interval': 5,
+        'liveness_timeout': 30,
+        'respawn_max_delay': 30,
+    },
     'worker_connections': 1,
+    'stats_log_interval': 300,
 }
 
 
@@ -62,6 +137,18 @@ def load_config():
     )
 
 
+def resolve_config(config: Mapping) -> dict:
+    '''Return the values of a configuration as plain nested dicts.
+
+    Lookups in plain dicts are cheaper than in the layered ChainMap, and the
+    result is smaller to pickle when it is passed to the worker processes.
+    '''
+    return {
+        key: resolve_config(value) if isinstance(value, Mapping) else value
+        for key, value in config.items()
+    }
+
+
 def _parse_cli_args():
     parser = argparse.ArgumentParser()
     parser.add_argument(
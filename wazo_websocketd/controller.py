@@ -1,13 +1,14 @@
-# Copyright 2016-2025 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2016-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import asyncio
 import logging
 from asyncio import FIRST_COMPLETED, Future
-from signal import SIGINT, SIGTERM
+from signal import SIGHUP, SIGINT, SIGTERM
 
 from .auth import MasterTenantProxy, ServiceTokenRenewer
 from .bus import BusService
+from .eventloop import run
 from .process import ProcessPool
 
 logger = logging.getLogger(__name__)
@@ -41,10 +42,12 @@ class Controller:
                     MasterTenantProxy.set_master_tenant, details=True, oneshot=True
                 )
 
-                async with ProcessPool(self._config):
+                async with ProcessPool(self._config) as pool:
+                    loop.add_signal_handler(SIGHUP, pool.rolling_restart)
                     await tombstone  # wait for SIGTERM or SIGINT
+                    loop.remove_signal_handler(SIGHUP)
 
         logger.info('wazo-websocketd stopped')
 
     def run(self):
-        asyncio.run(self._run())
+        run(self._run(), self._config['event_loop'])
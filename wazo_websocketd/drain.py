@@ -0,0 +1,60 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from itertools import islice
+from math import ceil
+
+from websockets.server import WebSocketServer
+
+logger = logging.getLogger(__name__)
+
+_CLOSE_CODE_GOING_AWAY = 1001
+
+
+def reconnect_reason(max_delay: int) -> str:
+    return f'reconnect after {random.randint(0, max_delay)} ms'
+
+
+async def drain(ws_server: WebSocketServer, config: dict) -> None:
+    '''Stop accepting connections, then close the sessions in randomized batches.
+
+    The sessions are closed over `window` seconds, in `batches` batches, with a
+    close reason asking the client to wait a random delay of at most
+    `reconnect_max_delay` milliseconds before reconnecting, so that clients don't
+    all come back at once.
+    '''
+    window: float = config['window']
+    batches: int = config['batches']
+    max_delay: int = config['reconnect_max_delay']
+
+    ws_server.server.close()
+    connections = list(ws_server.websockets)
+    if not connections or window <= 0 or batches < 1:
+        return
+
+    random.shuffle(connections)
+    batch_size = ceil(len(connections) / batches)
+    interval = window / ceil(len(connections) / batch_size)
+    logger.info(
+        'draining %d sessions over %s seconds (%d per batch)',
+        len(connections),
+        window,
+        batch_size,
+    )
+
+    closing: list[asyncio.Task] = []
+    iterator = iter(connections)
+    while batch := list(islice(iterator, batch_size)):
+        if closing:
+            await asyncio.sleep(interval)
+        for ws in batch:
+            reason = reconnect_reason(max_delay)
+            closing.append(
+                asyncio.create_task(ws.close(_CLOSE_CODE_GOING_AWAY, reason))
+            )
+    await asyncio.gather(*closing, return_exceptions=True)
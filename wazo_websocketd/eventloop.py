@@ -0,0 +1,38 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOPS = ('asyncio', 'uvloop')
+
+
+def loop_factory(name: str) -> Callable[[], asyncio.AbstractEventLoop]:
+    '''Return the factory of the event loop `name`.
+
+    Falls back to the event loop of the standard library when the implementation
+    is unknown or not installed.
+    '''
+    if name == 'uvloop':
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning('event loop `uvloop` is not installed, using `asyncio`')
+        else:
+            return uvloop.new_event_loop
+    elif name != 'asyncio':
+        logger.warning('unknown event loop `%s`, using `asyncio`', name)
+    return asyncio.new_event_loop
+
+
+def run(main: Coroutine[Any, Any, Any], name: str) -> Any:
+    '''Like asyncio.run, on the event loop `name`.'''
+    with asyncio.Runner(loop_factory=loop_factory(name)) as runner:
+        logger.debug('running on %s', type(runner.get_loop()).__module__)
+        return runner.run(main)
@@ -1,4 +1,4 @@
-# Copyright 2016-2022 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2016-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 
@@ -18,6 +18,14 @@ class AuthenticationExpiredError(AuthenticationError):
     pass
 
 
+class AuthenticationUnavailableError(AuthenticationError):
+    pass
+
+
+class AuthenticationOverloadedError(AuthenticationUnavailableError):
+    pass
+
+
 class SessionProtocolError(Exception):
     pass
 
@@ -34,9 +42,17 @@ class UnsupportedVersionError(Exception):
     pass
 
 
+class EventsLostError(Exception):
+    pass
+
+
 class InvalidEvent(Exception):
     pass
 
 
 class EventPermissionError(Exception):
     pass
+
+
+class AdmissionRejectedError(Exception):
+    pass
@@ -0,0 +1,373 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import socket
+import struct
+from collections.abc import Callable, Iterable
+from ctypes import Array as CArray
+from ctypes import addressof, c_char, c_uint64, memmove, string_at
+from itertools import chain, repeat
+from multiprocessing.sharedctypes import RawArray, RawValue
+from secrets import token_hex
+from typing import Any
+
+from aioamqp.channel import Channel
+from aioamqp.envelope import Envelope
+from aioamqp.exceptions import AmqpClosedConnection, ChannelClosed
+from aioamqp.properties import Properties
+from wazo_auth_client.types import TokenDict
+
+from .bus import BusConsumer, BusMessage, BusService, decode_event
+from .codec import JSONCodec
+from .exception import (
+    BusConnectionError,
+    BusConnectionLostError,
+    EventPermissionError,
+    InvalidEvent,
+)
+from .subscription import is_pattern
+
+logger = logging.getLogger(__name__)
+
+_LENGTH = struct.Struct('I')
+_EVENT = b'E'
+_RESET = b'R'  # events were lost, the sessions must resync
+
+
+def _retry_delays():
+    return chain((1, 2, 4, 8, 16), repeat(32))
+
+
+def _encode_header(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+class EventRing:
+    '''Records written by the main process and read by all the worker processes.
+
+    A ring buffer in shared memory with a single writer. `head` is the number of
+    bytes written since the start, and each reader keeps its own cursor. The
+    writer announces the bytes it is about to overwrite in `reserved` before
+    copying a record, so that a reader lapped by the writer, even while reading,
+    knows that it lost records.
+    '''
+
+    def __init__(self, size: int):
+        if size < 1024:
+            raise ValueError('event ring size must be at least 1024 bytes')
+        self._size = size
+        self._buffer: CArray[c_char] = RawArray(c_char, size)
+        self._head = RawValue(c_uint64, 0)
+        self._reserved = RawValue(c_uint64, 0)
+
+    @property
+    def head(self) -> int:
+        return self._head.value
+
+    def write(self, record: bytes) -> bool:
+        data = _LENGTH.pack(len(record)) + record
+        if len(data) > self._size:
+            return False
+        head = self._head.value
+        self._reserved.value = head + len(data)
+        self._copy_in(head, data)
+        self._head.value = head + len(data)
+        return True
+
+    def read(self, cursor: int) -> tuple[list[bytes], int] | None:
+        '''Return the records written since `cursor` and the next cursor.
+
+        Returns None when records following `cursor` were overwritten.
+        '''
+        head = self._head.value
+        records = []
+        position = cursor
+        while position < head and not self._lapped(cursor):
+            (length,) = _LENGTH.unpack(self._copy_out(position, _LENGTH.size))
+            if length > self._size:
+                break
+            records.append(self._copy_out(position + _LENGTH.size, length))
+            position += _LENGTH.size + length
+        if self._lapped(cursor):
+            return None
+        return records, position
+
+    def _lapped(self, cursor: int) -> bool:
+        return self._reserved.value - cursor > self._size
+
+    def _copy_in(self, position: int, data: bytes) -> None:
+        offset = position % self._size
+        first = min(len(data), self._size - offset)
+        address = addressof(self._buffer)
+        memmove(address + offset, data, first)
+        if first < len(data):
+            memmove(address, data[first:], len(data) - first)
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        offset = position % self._size
+        first = min(length, self._size - offset)
+        address = addressof(self._buffer)
+        data = string_at(address + offset, first)
+        if first < length:
+            data += string_at(address, length - first)
+        return data
+
+
+class EventRelay:
+    '''Consume the events of this host from the bus once, for all the workers.
+
+    Runs in the main process: each event is written in the EventRing, and the
+    workers are woken up by a datagram on their wakeup socket, at most once per
+    iteration of the event loop.
+    '''
+
+    def __init__(self, config: dict, ring: EventRing):
+        self._exchange_name: str = config['bus']['exchange_name']
+        self._origin_uuid: str = config['uuid']
+        self._ring = ring
+        self._wakeups: dict[int, socket.socket] = {}
+        self._wakeup_pending = False
+
+    def attach(self, slot: int, wakeup: socket.socket) -> None:
+        wakeup.setblocking(False)
+        self._wakeups[slot] = wakeup
+
+    def detach(self, slot: int) -> None:
+        wakeup = self._wakeups.pop(slot, None)
+        if wakeup is not None:
+            wakeup.close()
+
+    async def run(self, service: BusService) -> None:
+        delays = _retry_delays()
+        while True:
+            try:
+                channel = await service.get_channel()
+                await self._consume(channel)
+            except (AmqpClosedConnection, BusConnectionError, ChannelClosed) as e:
+                logger.debug('event relay: unable to consume events: %s', e)
+                await asyncio.sleep(next(delays))
+                continue
+            delays = _retry_delays()
+            await channel.close_event.wait()
+            logger.info('event relay: bus channel closed, reconnecting...')
+            self._publish(_RESET)
+
+    async def _consume(self, channel: Channel) -> None:
+        response = await channel.queue(
+            f'wazo-websocketd.fanout.{token_hex(3)}',
+            durable=False,
+            exclusive=True,
+            auto_delete=True,
+        )
+        queue_name = response['queue']
+        await channel.queue_bind(
+            queue_name,
+            self._exchange_name,
+            '',
+            arguments={'origin_uuid': self._origin_uuid},
+        )
+        await channel.basic_consume(self._on_message, queue_name, no_ack=True)
+        logger.info('event relay: consuming events for the workers')
+
+    async def _on_message(
+        self,
+        channel: Channel,
+        content: bytes,
+        envelope: Envelope,
+        properties: Properties,
+    ) -> None:
+        headers = json.dumps(properties.headers or {}, default=_encode_header)
+        self._publish(_EVENT + headers.encode() + b'\n' + content)
+
+    def _publish(self, record: bytes) -> None:
+        if not self._ring.write(record):
+            logger.warning('event relay: event of %d bytes dropped', len(record))
+            return
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            asyncio.get_running_loop().call_soon(self._wake_up)
+
+    def _wake_up(self) -> None:
+        self._wakeup_pending = False
+        for slot, wakeup in list(self._wakeups.items()):
+            try:
+                wakeup.send(b'\0')
+            except BlockingIOError:
+                pass  # the worker has wakeups pending already
+            except OSError as e:
+                logger.debug('event relay: unable to wake up worker %d: %s', slot, e)
+                self.detach(slot)
+
+
+class RelayedConsumer(BusConsumer):
+    '''Consumer of the events relayed to the worker, instead of a bus queue.'''
+
+    def __init__(
+        self, fanout: EventFanout, config: dict, token: TokenDict, codec: JSONCodec
+    ):
+        super().__init__(None, config, token, codec)  # type: ignore[arg-type]
+        self._fanout = fanout
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        self._fanout.unregister(self)
+        self._consumer_tag = None
+
+    async def consume(self) -> None:
+        if self.is_consuming:
+            return
+        self._consumer_tag = 'fanout'
+        self._fanout.register(self)
+
+    async def _bind(self, event_name: str) -> None:
+        self._fanout.subscribe(self, event_name)
+
+    async def unbind(self, event_name: str) -> None:
+        self._subscriptions.remove(event_name)
+        if self.is_consuming:
+            self._fanout.unsubscribe(self, event_name)
+
+    def deliver(self, payload: BusMessage | Exception) -> None:
+        if isinstance(payload, Exception):
+            self._handler(payload)
+        elif self._subscriptions.accepts(payload.name, payload.content):
+            if self.can_receive(payload):
+                self._handler(payload)
+
+
+class EventFanout:
+    '''Deliver the events relayed by the main process to the sessions of a worker.
+
+    Each event is read from the EventRing and decoded once per worker, unless
+    nothing is subscribed to its name, then delivered to the consumers subscribed
+    to its name (or to a pattern), as long as their token may receive it. When
+    events are lost, because the relay lost its bus connection or because this
+    worker was lapped, all the consumers are notified as if their bus connection
+    was lost.
+    '''
+
+    def __init__(
+        self, config: dict, ring: EventRing, wakeup: socket.socket, codec: JSONCodec
+    ):
+        self._config = config
+        self._ring = ring
+        self._wakeup = wakeup
+        self._codec = codec
+        self._cursor = ring.head
+        self._consumers: set[RelayedConsumer] = set()
+        self._names: dict[str, set[RelayedConsumer]] = {}
+        self._patterns: set[RelayedConsumer] = set()
+        self._listeners: dict[str, list[Callable[[BusMessage], None]]] = {}
+
+    def create_consumer(self, token: TokenDict) -> RelayedConsumer:
+        return RelayedConsumer(self, self._config, token, self._codec)
+
+    def add_listener(
+        self, listener: Callable[[BusMessage], None], event_names: Iterable[str]
+    ) -> None:
+        # listeners receive the events of their names, e.g. the last value cache
+        for event_name in event_names:
+            self._listeners.setdefault(event_name, []).append(listener)
+
+    def register(self, consumer: RelayedConsumer) -> None:
+        self._consumers.add(consumer)
+        for event_name in consumer._subscriptions:
+            self.subscribe(consumer, event_name)
+
+    def unregister(self, consumer: RelayedConsumer) -> None:
+        self._consumers.discard(consumer)
+        self._patterns.discard(consumer)
+        for event_name in consumer._subscriptions:
+            self._unsubscribe_name(consumer, event_name)
+
+    def subscribe(self, consumer: RelayedConsumer, event_name: str) -> None:
+        if is_pattern(event_name):
+            self._patterns.add(consumer)
+        else:
+            self._names.setdefault(event_name, set()).add(consumer)
+
+    def unsubscribe(self, consumer: RelayedConsumer, event_name: str) -> None:
+        if not is_pattern(event_name):
+            self._unsubscribe_name(consumer, event_name)
+        elif not consumer._subscriptions.has_patterns():
+            self._patterns.discard(consumer)
+
+    def _unsubscribe_name(self, consumer: RelayedConsumer, event_name: str) -> None:
+        consumers = self._names.get(event_name)
+        if consumers is None:
+            return
+        consumers.discard(consumer)
+        if not consumers:
+            del self._names[event_name]
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._cursor = self._ring.head
+        loop.add_reader(self._wakeup.fileno(), self._on_wakeup)
+        try:
+            await loop.create_future()
+        finally:
+            loop.remove_reader(self._wakeup.fileno())
+            self._wakeup.close()
+
+    def _on_wakeup(self) -> None:
+        try:
+            while self._wakeup.recv(64, socket.MSG_DONTWAIT):
+                pass
+        except BlockingIOError:
+            pass
+        result = self._ring.read(self._cursor)
+        if result is None:
+            logger.error('worker lagged behind the event relay, events were lost')
+            self._cursor = self._ring.head
+            self._lost()
+            return
+        records, self._cursor = result
+        for record in records:
+            self._dispatch(record)
+
+    def _dispatch(self, record: bytes) -> None:
+        if record[:1] == _RESET:
+            self._lost()
+            return
+        encoded_headers, _, content = record[1:].partition(b'\n')
+        headers = json.loads(encoded_headers)
+        name = headers.get('name')
+        # don't decode the events nobody would receive; without a name header,
+        # the name is only known once the payload is decoded
+        if (
+            name
+            and name not in self._names
+            and name not in self._listeners
+            and not self._patterns
+        ):
+            return
+        try:
+            message = decode_event(self._codec, content, headers)
+        except InvalidEvent as exc:
+            logger.error('error during message decoding (reason: %s)', exc)
+            return
+        except EventPermissionError as exc:
+            logger.debug('discarding event (reason: %s)', exc)
+            return
+
+        for listener in self._listeners.get(message.name, ()):
+            listener(message)
+        consumers = self._names.get(message.name, ())
+        if self._patterns:
+            consumers = self._patterns.union(consumers)
+        for consumer in tuple(consumers):
+            consumer.deliver(message)
+
+    def _lost(self) -> None:
+        for consumer in tuple(self._consumers):
+            consumer.deliver(BusConnectionLostError())
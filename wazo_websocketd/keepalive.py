@@ -0,0 +1,137 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from math import ceil
+
+from websockets.exceptions import ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+
+class KeepaliveEntry:
+    __slots__ = ('ws', 'bucket', 'last_activity', 'ping', 'ping_tick')
+
+    def __init__(self, ws, bucket: int, now: float):
+        self.ws = ws
+        self.bucket = bucket
+        self.last_activity = now
+        # sends the ping and waits for its pong
+        self.ping: asyncio.Task | None = None
+        self.ping_tick = 0
+
+    def touch(self) -> None:
+        self.last_activity = asyncio.get_event_loop().time()
+
+
+class KeepaliveScheduler:
+    '''Ping the websockets of a worker, spread evenly over the ping interval.
+
+    Sessions are split in one bucket per tick. Each tick, the sessions of one
+    bucket that didn't receive anything during the last interval are pinged and
+    the sessions pinged `ping_timeout` seconds ago that didn't answer are failed.
+    A dead peer is thus detected at most 2 * `ping_interval` + `ping_timeout`
+    seconds after the last data it sent.
+
+    Each ping runs in its own task, so that a client that doesn't read (e.g. a
+    half-open connection with a full send buffer) doesn't delay the others; its
+    ping is then never answered and the session is failed.
+    '''
+
+    _TICK = 1.0
+
+    def __init__(self, ping_interval: float, ping_timeout: float):
+        slots = max(1, ceil(ping_interval / self._TICK))
+        self._interval = ping_interval
+        self._tick = ping_interval / slots
+        self._timeout_ticks = max(1, ceil(ping_timeout / self._tick))
+        self._buckets: list[set[KeepaliveEntry]] = [set() for _ in range(slots)]
+        self._position = 0
+        self._ticks = 0
+        self._pings = 0
+        self._skipped = 0
+        self._reaped = 0
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def register(self, ws) -> KeepaliveEntry:
+        bucket = min(range(len(self._buckets)), key=lambda i: len(self._buckets[i]))
+        entry = KeepaliveEntry(ws, bucket, asyncio.get_event_loop().time())
+        self._buckets[bucket].add(entry)
+        return entry
+
+    def unregister(self, entry: KeepaliveEntry) -> None:
+        self._buckets[entry.bucket].discard(entry)
+        if entry.ping is not None:
+            entry.ping.cancel()
+            entry.ping = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        next_tick = loop.time()
+        while True:
+            next_tick += self._tick
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            try:
+                self.process_tick()
+            except Exception:
+                logger.exception('unexpected error during keepalive tick')
+
+    def process_tick(self) -> None:
+        self._ticks += 1
+        slots = len(self._buckets)
+        position, self._position = self._position, (self._position + 1) % slots
+        self._reap((position - self._timeout_ticks) % slots)
+        self._ping(position)
+
+    def stats(self) -> dict:
+        values = {
+            'sessions': len(self),
+            'pings': self._pings,
+            'skipped': self._skipped,
+            'reaped': self._reaped,
+        }
+        self._pings = self._skipped = self._reaped = 0
+        return values
+
+    def _reap(self, bucket: int) -> None:
+        for entry in list(self._buckets[bucket]):
+            ping = entry.ping
+            if ping is None:
+                continue
+            if ping.done():
+                entry.ping = None
+                continue
+            if self._ticks - entry.ping_tick < self._timeout_ticks:
+                # a timeout longer than the interval spans several rounds
+                continue
+            logger.debug('no pong received from %s, closing', entry.ws.remote_address)
+            self._reaped += 1
+            self.unregister(entry)
+            entry.ws.fail_connection(1011, 'keepalive ping timeout')
+
+    def _ping(self, bucket: int) -> None:
+        now = asyncio.get_event_loop().time()
+        for entry in self._buckets[bucket]:
+            if entry.ping is not None and not entry.ping.done():
+                # still waiting for the pong of the previous round
+                continue
+            if now - entry.last_activity < self._interval:
+                self._skipped += 1
+                continue
+            entry.ping = asyncio.create_task(self._send_ping(entry.ws))
+            entry.ping_tick = self._ticks
+
+    async def _send_ping(self, ws) -> None:
+        try:
+            pong_waiter = await ws.ping()
+            self._pings += 1
+            await pong_waiter
+        except ConnectionClosed:
+            pass
+        except Exception:
+            logger.exception('unable to ping %s', ws.remote_address)
@@ -5,99 +5,658 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, suppress
+from ctypes import Array as CArray
+from ctypes import c_double
+from functools import partial
 from multiprocessing import get_context
-from os import chdir, getpid, sched_getaffinity
+from multiprocessing.process import BaseProcess
+from multiprocessing.sharedctypes import RawArray
+from os import chdir, getpid, sched_getaffinity, unlink
 from signal import SIGINT, SIGTERM
+from socket import AF_UNIX, SOCK_DGRAM, SOCK_SEQPACKET, socket, socketpair
+from ssl import SSLContext
 from tempfile import TemporaryDirectory
+from time import monotonic
+from typing import NamedTuple
 
-import websockets.server
 from setproctitle import setproctitle
-from websockets.server import WebSocketServer as Serve
+from websockets.server import WebSocketServer, WebSocketServerProtocol
 from xivo.xivo_logging import setup_logging, silence_loggers
 
-from .auth import Authenticator, MasterTenantProxy, StringSharedBuffer
+from .admission import AdmissionControl
+from .affinity import pin, worker_cpus
+from .auth import (
+    AsyncAuthClient,
+    Authenticator,
+    MasterTenantProxy,
+    SharedTokenCache,
+    StringSharedBuffer,
+    TokenCacheProxy,
+)
+from .balancer import (
+    BALANCING_MODES,
+    ConnectionBalancer,
+    CountingServerProtocol,
+    SessionCounts,
+    receive_connections,
+)
 from .bus import BusService
+from .codec import load_codec
+from .compression import CompressionStats, create_extensions
+from .config import resolve_config
+from .drain import drain
+from .eventloop import run
+from .fanout import EventFanout, EventRelay, EventRing
+from .keepalive import KeepaliveScheduler
 from .protocol import SessionProtocolDecoder, SessionProtocolEncoder
+from .resume import StreamRegistry
 from .session import SessionFactory
+from .snapshot import LastValueCache
+from .stats import StatsReporter
 
 logger = logging.getLogger(__name__)
 
+START_METHODS = ('forkserver', 'spawn')
+
+# imported once by the fork server, instead of by each worker
+_FORKSERVER_PRELOAD = [__name__]
+
+
+class WorkerContext(NamedTuple):
+    slot: int
+    heartbeats: WorkerHeartbeats
+    counts: SessionCounts
+    # connections passed by the ConnectionBalancer
+    channel: socket | None = None
+    # events relayed by the EventRelay
+    events: EventRing | None = None
+    wakeup: socket | None = None
+    spawned_at: float = 0.0
+    cpu: int | None = None
+
 
 class WebsocketServer:
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, worker: WorkerContext | None = None):
         self._config = config
+        self._worker = worker
+        self._fanout: EventFanout | None = None
         self._tombstone: asyncio.Future = asyncio.Future()
+        self._stats = StatsReporter(config['stats_log_interval'])
+        self._keepalive = KeepaliveScheduler(
+            config['websocket']['ping_interval'], config['websocket']['ping_timeout']
+        )
+        self._stats.register('keepalive', self._keepalive.stats)
+        self._compression = CompressionStats()
+        self._stats.register('compression', self._compression.collect)
+        self._streams = StreamRegistry(
+            config['websocket']['resume'], worker.slot if worker else None
+        )
+        self._protocol_factory: Callable[[], WebSocketServerProtocol] | None = None
 
-    def _create_server(self) -> tuple[BusService, Serve]:
+    def _create_server(
+        self,
+    ) -> tuple[
+        Authenticator,
+        BusService,
+        LastValueCache,
+        AbstractAsyncContextManager[WebSocketServer],
+    ]:
         config = self._config
         authenticator: Authenticator = Authenticator(config)
-        service: BusService = BusService(config)
+        self._stats.register('auth executor', authenticator.stats)
+        codec = load_codec(config['json_codec'])
+        worker = self._worker
+        if worker and worker.events is not None and worker.wakeup is not None:
+            self._fanout = EventFanout(config, worker.events, worker.wakeup, codec)
+        service: BusService = BusService(config, self._fanout)
+        last_value_cache = LastValueCache(config, codec)
+        if last_value_cache.enabled:
+            self._stats.register('last value cache', last_value_cache.stats)
+            if self._fanout is not None:
+                self._fanout.add_listener(
+                    last_value_cache.put, last_value_cache.event_names
+                )
+        admission = AdmissionControl(config['admission'])
+        self._stats.register('admission', admission.stats)
         factory: SessionFactory = SessionFactory(
             config,
             authenticator,
             service,
-            SessionProtocolEncoder(),
-            SessionProtocolDecoder(),
+            SessionProtocolEncoder(codec),
+            SessionProtocolDecoder(codec),
+            self._keepalive,
+            self._streams,
+            last_value_cache,
+            admission,
         )
 
-        host = config['websocket']['listen']
-        port = config['websocket']['port']
         ssl = config['websocket']['ssl']
-
-        server = websockets.server.serve(
-            factory.ws_handler, host=host, port=port, ssl=ssl, reuse_port=True
+        extensions = create_extensions(
+            config['websocket']['compression'], self._compression
         )
+        protocol_class: Callable[..., WebSocketServerProtocol]
+        if worker is None:
+            protocol_class = WebSocketServerProtocol
+        else:
+            protocol_class = partial(
+                CountingServerProtocol, counts=worker.counts, slot=worker.slot
+            )
+        ws_server = WebSocketServer()
+        loop = asyncio.get_running_loop()
+        create_server: Callable[[], Awaitable[asyncio.Server]]
+        if worker is None or worker.channel is None:
+            host = config['websocket']['listen']
+            port = config['websocket']['port']
+            self._protocol_factory = self._make_protocol_factory(
+                protocol_class, factory, ws_server, ssl, extensions, host, port
+            )
+            create_server = partial(
+                loop.create_server,
+                self._protocol_factory,
+                host,
+                port,
+                ssl=ssl,
+                reuse_port=True,
+            )
+        else:
+            # connections are accepted by the main process and passed to the
+            # worker, the server only listens on a private Unix socket
+            path = f'worker-{worker.slot}.sock'
+            with suppress(FileNotFoundError):
+                unlink(path)
+            self._protocol_factory = self._make_protocol_factory(
+                protocol_class, factory, ws_server, ssl, extensions
+            )
+            create_server = partial(
+                loop.create_unix_server, self._protocol_factory, path, ssl=ssl
+            )
+        server = _listening(ws_server, create_server)
 
-        return service, server
+        return authenticator, service, last_value_cache, server
+
+    @staticmethod
+    def _make_protocol_factory(
+        protocol_class: Callable[..., WebSocketServerProtocol],
+        factory: SessionFactory,
+        ws_server: WebSocketServer,
+        ssl: SSLContext | None,
+        extensions: list,
+        host: str | None = None,
+        port: int | None = None,
+    ) -> Callable[[], WebSocketServerProtocol]:
+        # the same protocol serves the listening socket and the connections
+        # passed by the ConnectionBalancer; keepalive pings are sent by the
+        # KeepaliveScheduler for all sessions
+        return partial(
+            protocol_class,
+            factory.ws_handler,
+            ws_server,
+            host=host,
+            port=port,
+            secure=ssl is not None,
+            ping_interval=None,
+            extensions=extensions,
+        )
 
     async def serve(self):
         logger.info('starting websocket server on pid: %s', getpid())
-        service, server = self._create_server()
-        async with service, server:
+        authenticator, service, last_value_cache, server = self._create_server()
+        stats_task = asyncio.create_task(self._stats.run())
+        keepalive_task = asyncio.create_task(self._keepalive.run())
+        # detached streams are closed once the sessions are, before the bus
+        async with service, self._streams, server as ws_server:
+            if self._worker is not None:
+                logger.info(
+                    'worker %d started in %.2fs',
+                    self._worker.slot,
+                    monotonic() - self._worker.spawned_at,
+                )
+            tasks = [self._start_events(service, last_value_cache)]
+            tasks += self._start_worker_tasks()
+            receive_task = self._start_receiving()
             await self._tombstone
+            if receive_task:
+                receive_task.cancel()
+            await drain(ws_server, self._config['drain'])
+            for task in tasks:
+                task.cancel()
+        keepalive_task.cancel()
+        stats_task.cancel()
+        authenticator.close()
         logger.info('stopping websocket server on pid: %s', getpid())
 
+    def _start_events(
+        self, service: BusService, last_value_cache: LastValueCache
+    ) -> asyncio.Task:
+        if self._fanout is not None:
+            return asyncio.create_task(self._fanout.run())
+        return asyncio.create_task(last_value_cache.run(service))
+
+    def _start_worker_tasks(self) -> list[asyncio.Task]:
+        if self._worker is None:
+            return []
+        interval = self._config['supervisor']['heartbeat_interval']
+        heartbeats, slot = self._worker.heartbeats, self._worker.slot
+        return [asyncio.create_task(heartbeats.run(slot, interval))]
+
+    def _start_receiving(self) -> asyncio.Task | None:
+        worker = self._worker
+        if worker is None or worker.channel is None:
+            return None
+        if self._protocol_factory is None:
+            return None
+        return asyncio.create_task(
+            receive_connections(
+                worker.channel,
+                self._protocol_factory,
+                self._config['websocket']['ssl'],
+                worker.counts,
+                worker.slot,
+            )
+        )
+
     def stop(self):
-        self._tombstone.set_result(True)
+        if not self._tombstone.done():
+            self._tombstone.set_result(True)
+
+
+@asynccontextmanager
+async def _listening(
+    ws_server: WebSocketServer,
+    create_server: Callable[[], Awaitable[asyncio.Server]],
+) -> AsyncIterator[WebSocketServer]:
+    # same as the context manager returned by websockets.server.serve()
+    ws_server.wrap(await create_server())
+    try:
+        yield ws_server
+    finally:
+        ws_server.close()
+        await ws_server.wait_closed()
+
+
+def _respawn_delay(failures: int, max_delay: float) -> float:
+    # the first crash is respawned right away, repeated crashes back off
+    if failures < 1:
+        return 0
+    return min(2 ** (failures - 1), max_delay)
+
+
+class WorkerHeartbeats:
+    '''Last time the event loop of each worker process was seen running.
+
+    Each worker writes the monotonic time in its slot of a shared memory array
+    every `heartbeat_interval` seconds, from its event loop.
+    '''
+
+    def __init__(self, slots: int):
+        self._times: CArray[c_double] = RawArray(c_double, slots)
+
+    def beat(self, slot: int) -> None:
+        self._times[slot] = monotonic()
+
+    def reset(self, slot: int) -> None:
+        self._times[slot] = 0.0
+
+    def last(self, slot: int) -> float:
+        return self._times[slot]
+
+    async def run(self, slot: int, interval: float) -> None:
+        while True:
+            self.beat(slot)
+            await asyncio.sleep(interval)
+
+
+class _Worker:
+    __slots__ = ('slot', 'process', 'started_at', 'restarts', 'retiring')
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.process: BaseProcess | None = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.retiring = False
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.exitcode is None
 
 
 class ProcessPool:
+    '''Start the worker processes and keep them running.
+
+    Each worker is supervised: a worker that exits is respawned, right away the
+    first time and then with an exponential backoff of at most
+    `respawn_max_delay` seconds while it keeps crashing, and a worker whose
+    heartbeat is older than `liveness_timeout` seconds is killed and respawned.
+    `rolling_restart` restarts the workers one at a time, waiting for each new
+    worker to serve before stopping the next one.
+
+    With `cpu_affinity` enabled, each worker is pinned to its own CPU, spread
+    across the NUMA nodes (see affinity.placement).
+
+    With the `forkserver` start method, workers are forked from a server process
+    that imported this module once, instead of each importing it in a new
+    interpreter.
+
+    With the `least_sessions` and `tenant_affinity` load balancing, connections
+    are accepted by this process and passed to the workers (see
+    ConnectionBalancer), instead of being spread by the kernel across the workers
+    listening with SO_REUSEPORT.
+
+    With `bus.fanout` enabled, the events are consumed from the bus by this
+    process and relayed to the workers through shared memory (see EventRelay).
+    '''
+
     def __init__(self, config: dict):
+        self._cpus: list[int] = []
+        if config['cpu_affinity']['enabled']:
+            self._cpus = worker_cpus(config['cpu_affinity'])
         workers: int | str = config['process_workers']
         if workers == 'auto':
-            workers = len(sched_getaffinity(0))
+            workers = len(self._cpus or sched_getaffinity(0))
 
         if not isinstance(workers, int) or workers < 1:
             raise ValueError(
                 'configuration key `process_workers` must be a positive integer or `auto`'
             )
-        self._workers = workers
-        self._config = config
+        if self._cpus and workers > len(self._cpus):
+            logger.warning('%d workers share %d CPUs', workers, len(self._cpus))
+        if config['worker_start_method'] not in START_METHODS:
+            raise ValueError(
+                'configuration key `worker_start_method` must be one of: '
+                + ', '.join(START_METHODS)
+            )
+        if config['load_balancing'] not in BALANCING_MODES:
+            raise ValueError(
+                'configuration key `load_balancing` must be one of: '
+                + ', '.join(BALANCING_MODES)
+            )
+        if (
+            config['load_balancing'] == 'tenant_affinity'
+            and not config['token_cache']['enabled']
+        ):
+            raise ValueError(
+                '`load_balancing: tenant_affinity` requires `token_cache` to be enabled'
+            )
+        supervisor_config = config['supervisor']
+        self._heartbeat_interval: float = supervisor_config['heartbeat_interval']
+        self._liveness_timeout: float = supervisor_config['liveness_timeout']
+        self._respawn_max_delay: float = supervisor_config['respawn_max_delay']
+        self._stop_timeout: float = (
+            config['drain']['window'] + supervisor_config['liveness_timeout']
+        )
+        # the configuration is pickled for each worker, and looked up on each
+        # session
+        self._config = config = resolve_config(config)
         self._dir = TemporaryDirectory(prefix="wazo-websocketd-")
 
-        context = get_context('spawn')
+        self._context = get_context(config['worker_start_method'])
+        if config['worker_start_method'] == 'forkserver':
+            self._context.set_forkserver_preload(_FORKSERVER_PRELOAD)
         chdir(self._dir.name)
-        self._pool = context.Pool(
-            workers, self._init_worker, (config, MasterTenantProxy.proxy)
-        )
+        self._token_cache = SharedTokenCache.from_config(config)
+        self._heartbeats = WorkerHeartbeats(workers)
+        self._counts = SessionCounts(workers)
+        self._balancer: ConnectionBalancer | None = None
+        # finds the tenant of the tokens missing from the token cache
+        self._auth_client: AsyncAuthClient | None = None
+        if config['load_balancing'] == 'tenant_affinity':
+            self._auth_client = AsyncAuthClient(config)
+        if config['load_balancing'] != 'reuse_port':
+            self._balancer = ConnectionBalancer(
+                config,
+                self._counts,
+                lambda slot: self._serving(self._workers[slot]),
+                self._token_cache,
+                self._auth_client,
+            )
+        self._ring: EventRing | None = None
+        self._relay: EventRelay | None = None
+        self._relay_task: asyncio.Task | None = None
+        self._bus: BusService | None = None
+        if config['bus']['fanout']['enabled']:
+            self._ring = EventRing(config['bus']['fanout']['buffer_size'])
+            self._relay = EventRelay(config, self._ring)
+            self._bus = BusService(config)
+        self._workers = [_Worker(slot) for slot in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+        self._restart_task: asyncio.Task | None = None
+        self._stopping = False
+        self._stats = StatsReporter(config['stats_log_interval'])
+        self._stats.register('workers', self.status)
 
     async def __aenter__(self):
-        logger.info('starting %d worker process(es)', self._workers)
-        for _ in range(self._workers):
-            self._pool.apply_async(self._run, (self._config,))
+        logger.info('starting %d worker process(es)', len(self._workers))
+        if self._balancer is not None:
+            await self._balancer.start()
+        if self._relay is not None and self._bus is not None:
+            await self._bus.__aenter__()
+            self._relay_task = asyncio.create_task(self._relay.run(self._bus))
+        self._tasks = [
+            asyncio.create_task(self._supervise(worker)) for worker in self._workers
+        ]
+        self._tasks.append(asyncio.create_task(self._check_liveness()))
+        self._tasks.append(asyncio.create_task(self._stats.run()))
         return self
 
     async def __aexit__(self, *args):
-        self._pool.close()
-        self._pool.join()
+        self._stopping = True
+        if self._restart_task is not None:
+            self._tasks.append(self._restart_task)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._balancer is not None:
+            await self._balancer.stop()
+        if self._auth_client is not None:
+            self._auth_client.close()
+        await self._stop_workers()
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            await asyncio.gather(self._relay_task, return_exceptions=True)
+        if self._bus is not None:
+            await self._bus.__aexit__(None, None, None)
         self._dir.cleanup()
 
+    def rolling_restart(self) -> None:
+        if self._stopping:
+            return
+        if self._restart_task is not None and not self._restart_task.done():
+            logger.info('a rolling restart of the workers is already in progress')
+            return
+        self._restart_task = asyncio.create_task(self._rolling_restart())
+
+    def status(self) -> dict:
+        now = monotonic()
+        values = {}
+        for worker in self._workers:
+            heartbeat = self._heartbeats.last(worker.slot)
+            if not worker.alive:
+                state = 'down'
+            elif worker.retiring:
+                state = 'draining'
+            elif heartbeat < worker.started_at:
+                state = 'starting'
+            elif now - heartbeat > 2 * self._heartbeat_interval:
+                state = 'late'
+            else:
+                state = 'alive'
+            pid = worker.process.pid if worker.process else None
+            age = f'{now - heartbeat:.1f}s' if heartbeat else '-'
+            sessions = self._counts.sessions(worker.slot)
+            values[f'worker{worker.slot}'] = (
+                f'{state}(pid={pid},sessions={sessions},'
+                f'restarts={worker.restarts},heartbeat={age})'
+            )
+        return values
+
+    def _spawn(self, worker: _Worker) -> BaseProcess:
+        self._heartbeats.reset(worker.slot)
+        self._counts.reset(worker.slot)
+        channel = worker_channel = wakeup = worker_wakeup = None
+        if self._balancer is not None:
+            channel, worker_channel = socketpair(AF_UNIX, SOCK_SEQPACKET)
+        if self._relay is not None:
+            wakeup, worker_wakeup = socketpair(AF_UNIX, SOCK_DGRAM)
+        context = WorkerContext(
+            worker.slot,
+            self._heartbeats,
+            self._counts,
+            worker_channel,
+            self._ring,
+            worker_wakeup,
+            monotonic(),
+            self._cpus[worker.slot % len(self._cpus)] if self._cpus else None,
+        )
+        process = self._context.Process(
+            target=self._main,
+            args=(self._config, context, MasterTenantProxy.proxy, self._token_cache),
+            name=f'wazo-websocketd-worker-{worker.slot}',
+            daemon=True,
+        )
+        process.start()
+        # the worker ends of the socket pairs were duplicated in the worker
+        for sock in (worker_channel, worker_wakeup):
+            if sock is not None:
+                sock.close()
+        if self._balancer is not None and channel is not None:
+            self._balancer.attach(worker.slot, channel)
+        if self._relay is not None and wakeup is not None:
+            self._relay.attach(worker.slot, wakeup)
+        worker.process = process
+        worker.started_at = monotonic()
+        worker.retiring = False
+        logger.debug('worker %d started (pid %s)', worker.slot, process.pid)
+        return process
+
+    def _detach(self, worker: _Worker) -> None:
+        if self._balancer is not None:
+            self._balancer.detach(worker.slot)
+        if self._relay is not None:
+            self._relay.detach(worker.slot)
+
+    async def _supervise(self, worker: _Worker) -> None:
+        failures = 0
+        while True:
+            process = self._spawn(worker)
+            exitcode = await self._wait_exit(process)
+            self._detach(worker)
+            if worker.retiring:
+                logger.info('worker %d (pid %s) restarted', worker.slot, process.pid)
+                failures = 0
+                continue
+
+            if monotonic() - worker.started_at >= self._respawn_max_delay:
+                failures = 0
+            delay = _respawn_delay(failures, self._respawn_max_delay)
+            failures += 1
+            worker.restarts += 1
+            logger.error(
+                'worker %d (pid %s) exited with code %s, respawning in %ss',
+                worker.slot,
+                process.pid,
+                exitcode,
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+    async def _check_liveness(self) -> None:
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            now = monotonic()
+            for worker in self._workers:
+                process = worker.process
+                if process is None or not worker.alive:
+                    continue
+                last_seen = max(self._heartbeats.last(worker.slot), worker.started_at)
+                if now - last_seen > self._liveness_timeout:
+                    logger.error(
+                        'worker %d (pid %s) missed its heartbeats for %.0fs, killing it',
+                        worker.slot,
+                        process.pid,
+                        now - last_seen,
+                    )
+                    process.kill()
+
+    async def _rolling_restart(self) -> None:
+        logger.info('rolling restart of %d worker(s)', len(self._workers))
+        for worker in self._workers:
+            process = worker.process
+            if process is None or not worker.alive:
+                continue
+            worker.retiring = True
+            if self._balancer is not None:
+                self._balancer.detach(worker.slot)
+            process.terminate()
+            # the worker drains its sessions while the others accept connections
+            while worker.process is process or not self._serving(worker):
+                await asyncio.sleep(0.1)
+        logger.info('rolling restart completed')
+
+    def _serving(self, worker: _Worker) -> bool:
+        return worker.alive and self._heartbeats.last(worker.slot) >= worker.started_at
+
+    async def _stop_workers(self) -> None:
+        processes = [
+            worker.process
+            for worker in self._workers
+            if worker.process is not None and worker.alive
+        ]
+        if not processes:
+            return
+        for process in processes:
+            process.terminate()
+        waiters = [asyncio.create_task(self._wait_exit(p)) for p in processes]
+        _, pending = await asyncio.wait(waiters, timeout=self._stop_timeout)
+        for process in processes:
+            if process.exitcode is None:
+                logger.error('worker (pid %s) did not stop, killing it', process.pid)
+                process.kill()
+        if pending:
+            await asyncio.wait(pending)
+
+    @staticmethod
+    async def _wait_exit(process: BaseProcess) -> int | None:
+        loop = asyncio.get_running_loop()
+        exited = loop.create_future()
+
+        def on_exit():
+            if not exited.done():
+                exited.set_result(None)
+
+        loop.add_reader(process.sentinel, on_exit)
+        try:
+            await exited
+        finally:
+            loop.remove_reader(process.sentinel)
+        process.join()
+        return process.exitcode
+
+    @classmethod
+    def _main(
+        cls,
+        config: dict,
+        worker: WorkerContext,
+        master_tenant_proxy: StringSharedBuffer,
+        token_cache: SharedTokenCache | None,
+    ):
+        cls._init_worker(config, master_tenant_proxy, token_cache)
+        if worker.cpu is not None:
+            # before the worker allocates its memory, on the node of its CPU
+            pin(worker.cpu)
+        cls._run(config, worker)
+
     @staticmethod
-    def _init_worker(config: dict, master_tenant_proxy: StringSharedBuffer):
+    def _init_worker(
+        config: dict,
+        master_tenant_proxy: StringSharedBuffer,
+        token_cache: SharedTokenCache | None,
+    ):
         setproctitle('wazo-websocketd: worker')
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         MasterTenantProxy.proxy = master_tenant_proxy
+        TokenCacheProxy.proxy = token_cache
 
         setup_logging(
             config['log_file'], debug=config['debug'], log_level=config['log_level']
@@ -105,12 +664,12 @@ class ProcessPool:
         silence_loggers(['aioamqp', 'urllib3', 'stevedore.extension'], logging.WARNING)
 
     @staticmethod
-    def _run(config: dict):
+    def _run(config: dict, worker: WorkerContext):
         async def serve(config: dict):
             loop = asyncio.get_event_loop()
-            server = WebsocketServer(config)
+            server = WebsocketServer(config, worker)
             loop.add_signal_handler(SIGINT, server.stop)
             loop.add_signal_handler(SIGTERM, server.stop)
             await server.serve()
 
-        asyncio.run(serve(config))
+        run(serve(config), config['event_loop'])
@@ -1,4 +1,4 @@
-# Copyright 2016-2024 The Wazo Authors  (see the AUTHORS file)
+# Copyright 2016-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from __future__ import annotations
@@ -6,18 +6,43 @@ from __future__ import annotations
 import collections
 import json
 import logging
+from collections import OrderedDict
+from functools import cache
+from typing import TYPE_CHECKING
 
+from .codec import BINARY_CODECS, BinaryCodec, JSONCodec
 from .exception import SessionProtocolError
+from .subscription import compile_filter
+
+if TYPE_CHECKING:
+    from .bus import BusMessage
 
 logger = logging.getLogger(__name__)
 
 
+def _envelope(operation, code=0):
+    # "data" is serialized last, so the envelope can be split around the event
+    # "id" and the value of "data"
+    encoded = json.dumps({'op': operation, 'code': code, 'id': None, 'data': None})
+    prefix, infix, suffix = encoded.split('null')
+    return prefix, infix, suffix
+
+
 class SessionProtocolEncoder:
     _CODE_SUCCESS = 0
     _CODE_FAILURE = 1
 
-    def encode_init(self, version=2):
-        return self._encode('init', {"version": version})
+    _EVENT_ENVELOPE = _envelope('event')
+    _EVENTS_ENVELOPE = _envelope('events')
+
+    def __init__(self, codec: JSONCodec | None = None):
+        self._codec = codec or JSONCodec()
+
+    def encode_init(self, version=2, session_id=None, resumed=False):
+        data = {"version": version}
+        if session_id is not None:
+            data.update(session_id=session_id, resumed=resumed)
+        return self._encode('init', data)
 
     def encode_subscribe(self):
         return self._encode('subscribe')
@@ -28,26 +53,83 @@ class SessionProtocolEncoder:
     def encode_token(self):
         return self._encode('token')
 
-    def encode_event(self, event):
-        return self._encode("event", event)
+    def encode_event(self, message: BusMessage, event_id: int) -> str:
+        # the event is already serialized: splice it instead of encoding it again
+        prefix, infix, suffix = self._EVENT_ENVELOPE
+        return f'{prefix}{event_id}{infix}{message.raw}{suffix}'
+
+    def encode_events(self, messages: list[BusMessage], last_id: int) -> str:
+        # the events are consecutive, only the id of the last one is sent
+        events = ', '.join(message.raw for message in messages)
+        prefix, infix, suffix = self._EVENTS_ENVELOPE
+        return f'{prefix}{last_id}{infix}[{events}]{suffix}'
+
+    def encode_gap(self, first_id, last_id):
+        return self._encode('gap', {'first_id': first_id, 'last_id': last_id})
 
     def encode_pong(self, data):
         return self._encode("pong", data={"payload": data})
 
     def _encode(self, operation, data=None, code=_CODE_SUCCESS):
-        return json.dumps({'op': operation, 'code': code, 'data': data})
+        return self._codec.dumps({'op': operation, 'code': code, 'data': data})
+
+
+class BinarySessionProtocolEncoder(SessionProtocolEncoder):
+    # events recently encoded, shared by the sessions of the worker using this codec
+    _PAYLOAD_CACHE_SIZE = 256
+
+    def __init__(self, codec: BinaryCodec):
+        super().__init__()
+        self._binary_codec = codec
+        self._null = codec.dumps(None)
+        self._payloads: OrderedDict[int, tuple[BusMessage, bytes]] = OrderedDict()
+
+    def encode_event(  # type: ignore[override]
+        self, message: BusMessage, event_id: int
+    ) -> bytes:
+        return self._envelope('event', event_id) + self._payload(message)
+
+    def encode_events(  # type: ignore[override]
+        self, messages: list[BusMessage], last_id: int
+    ) -> bytes:
+        return self._envelope('events', last_id) + b''.join(
+            [self._array_header(len(messages))]
+            + [self._payload(message) for message in messages]
+        )
+
+    def _envelope(self, operation, event_id) -> bytes:
+        # "data" is serialized last, so the envelope ends with its null value
+        envelope = {'op': operation, 'code': self._CODE_SUCCESS, 'id': event_id}
+        return self._binary_codec.dumps({**envelope, 'data': None})[: -len(self._null)]
+
+    def _array_header(self, length: int) -> bytes:
+        return self._binary_codec.dumps([None] * length)[: -length * len(self._null)]
+
+    def _payload(self, message: BusMessage) -> bytes:
+        # each event is encoded once, however many sessions receive it
+        key = id(message)
+        cached = self._payloads.get(key)
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        payload = self._binary_codec.dumps(message.content)
+        # the message is kept with its payload, so that its id is not reused
+        self._payloads[key] = (message, payload)
+        if len(self._payloads) > self._PAYLOAD_CACHE_SIZE:
+            self._payloads.popitem(last=False)
+        return payload
+
+    def _encode(  # type: ignore[override]
+        self, operation, data=None, code=SessionProtocolEncoder._CODE_SUCCESS
+    ) -> bytes:
+        return self._binary_codec.dumps({'op': operation, 'code': code, 'data': data})
 
 
 class SessionProtocolDecoder:
+    def __init__(self, codec: JSONCodec | None = None):
+        self._codec = codec or JSONCodec()
+
     def decode(self, data):
-        if not isinstance(data, str):
-            raise SessionProtocolError(
-                f'expected text frame: got data with type {type(data)}'
-            )
-        try:
-            deserialized_data = json.loads(data)
-        except ValueError:
-            raise SessionProtocolError('not a valid json document')
+        deserialized_data = self._deserialize(data)
         if not isinstance(deserialized_data, dict):
             raise SessionProtocolError('json document root is not an object')
         if 'op' not in deserialized_data:
@@ -60,6 +142,16 @@ class SessionProtocolDecoder:
         func = getattr(self, func_name, self._decode)
         return func(operation, deserialized_data)
 
+    def _deserialize(self, data):
+        if not isinstance(data, str):
+            raise SessionProtocolError(
+                f'expected text frame: got data with type {type(data)}'
+            )
+        try:
+            return self._codec.loads(data)
+        except ValueError:
+            raise SessionProtocolError('not a valid json document')
+
     def _decode(self, operation, deserialized_data):
         return _Message(operation, None)
 
@@ -67,7 +159,15 @@ class SessionProtocolDecoder:
         return self._get("token", operation, deserialized_data)
 
     def _decode_subscribe(self, operation, deserialized_data):
-        return self._get("event_name", operation, deserialized_data)
+        message = self._get("event_name", operation, deserialized_data)
+        filters = deserialized_data['data'].get('filters')
+        if filters is None:
+            return message
+        try:
+            event_filter = compile_filter(filters)
+        except ValueError as e:
+            raise SessionProtocolError(f'invalid subscription filters: {e}')
+        return message._replace(filter=event_filter)
 
     def _decode_ping(self, operation, deserialized_data):
         return self._get("payload", operation, deserialized_data)
@@ -90,4 +190,38 @@ class SessionProtocolDecoder:
         return _Message(operation, value)
 
 
-_Message = collections.namedtuple('_Message', ['op', 'value'])
+class BinarySessionProtocolDecoder(SessionProtocolDecoder):
+    def __init__(self, codec: BinaryCodec):
+        super().__init__()
+        self._binary_codec = codec
+
+    def _deserialize(self, data):
+        if not isinstance(data, bytes):
+            raise SessionProtocolError(
+                f'expected binary frame: got data with type {type(data)}'
+            )
+        try:
+            return self._binary_codec.loads(data)
+        except ValueError:
+            raise SessionProtocolError(
+                f'not a valid {self._binary_codec.name} document'
+            )
+
+
+@cache
+def binary_protocol(
+    encoding: str,
+) -> tuple[BinarySessionProtocolEncoder, BinarySessionProtocolDecoder]:
+    codec_class = BINARY_CODECS.get(encoding)
+    if codec_class is None:
+        raise SessionProtocolError(f'unknown encoding "{encoding}"')
+    try:
+        codec = codec_class()
+    except ImportError:
+        raise SessionProtocolError(f'encoding "{encoding}" is not available')
+    return BinarySessionProtocolEncoder(codec), BinarySessionProtocolDecoder(codec)
+
+
+_Message = collections.namedtuple(
+    '_Message', ['op', 'value', 'filter'], defaults=[None]
+)
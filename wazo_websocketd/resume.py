@@ -0,0 +1,198 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from itertools import islice
+from secrets import token_urlsafe
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .bus import BusConsumer, BusMessage
+
+logger = logging.getLogger(__name__)
+
+
+def stream_slot(stream_id: str) -> int | None:
+    '''Return the worker slot encoded in a stream id, if any.'''
+    slot, sep, _ = stream_id.partition('.')
+    return int(slot) if sep and slot.isdigit() else None
+
+
+class ReplayBuffer:
+    '''Numbered events recently delivered to a session, bounded in age and size.'''
+
+    __slots__ = ('_events', '_bytes', '_max_bytes', '_max_age', 'last_id')
+
+    def __init__(self, max_bytes: int, max_age: float):
+        self._events: deque[tuple[int, float, BusMessage]] = deque()
+        self._bytes = 0
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self.last_id = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def append(self, message: BusMessage, now: float) -> int:
+        self.last_id += 1
+        self._events.append((self.last_id, now, message))
+        self._bytes += len(message.raw)
+        self._trim(now)
+        return self.last_id
+
+    def since(self, event_id: int) -> list[tuple[int, BusMessage]] | None:
+        '''Return the events following `event_id`, or None when some were evicted.'''
+        if not 0 <= event_id <= self.last_id:
+            return None
+        first_id = self._events[0][0] if self._events else self.last_id + 1
+        if event_id + 1 < first_id:
+            return None
+        events = islice(self._events, event_id + 1 - first_id, None)
+        return [(id_, message) for id_, _, message in events]
+
+    def _trim(self, now: float) -> None:
+        deadline = now - self._max_age
+        events = self._events
+        while events and (self._bytes > self._max_bytes or events[0][1] < deadline):
+            _, _, message = events.popleft()
+            self._bytes -= len(message.raw)
+
+
+class ResumableStream:
+    __slots__ = ('id', 'user_uuid', 'consumer', 'buffer', '_expiry')
+
+    def __init__(
+        self,
+        stream_id: str,
+        user_uuid: str,
+        consumer: BusConsumer,
+        buffer: ReplayBuffer,
+    ):
+        self.id = stream_id
+        self.user_uuid = user_uuid
+        self.consumer = consumer
+        self.buffer = buffer
+        self._expiry: asyncio.TimerHandle | None = None
+
+    @property
+    def detached(self) -> bool:
+        return self._expiry is not None
+
+    def record(self, message: BusMessage) -> int:
+        return self.buffer.append(message, asyncio.get_event_loop().time())
+
+
+class StreamRegistry:
+    '''Event streams of the sessions of a worker that can be resumed.
+
+    When the connection of a session is lost, its bus consumer is kept for
+    `max_age` seconds and the events it receives are buffered. A client
+    reconnecting to the same worker with the `session_id` and the `last_event_id`
+    it received gets the stream back, and the events it missed are replayed.
+
+    The ids of the streams of a worker start with its slot, so that the
+    ConnectionBalancer passes the resumed connections to the worker of the stream.
+    '''
+
+    def __init__(self, config: dict, slot: int | None = None):
+        self._slot = slot
+        self._enabled: bool = config['enabled']
+        self._max_age: float = config['max_age']
+        self._max_bytes: int = config['max_bytes']
+        self._streams: dict[str, ResumableStream] = {}
+        self._stopping: set[asyncio.Task] = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __len__(self):
+        return len(self._streams)
+
+    def create(self, user_uuid: str, consumer: BusConsumer) -> ResumableStream | None:
+        if not self._enabled:
+            return None
+        stream_id = token_urlsafe(16)
+        if self._slot is not None:
+            stream_id = f'{self._slot}.{stream_id}'
+        buffer = ReplayBuffer(self._max_bytes, self._max_age)
+        stream = ResumableStream(stream_id, user_uuid, consumer, buffer)
+        self._streams[stream.id] = stream
+        return stream
+
+    def resume(
+        self, stream_id: str, user_uuid: str, last_event_id: int
+    ) -> tuple[ResumableStream, list[tuple[int, BusMessage]]] | None:
+        '''Reattach a detached stream, with the events following `last_event_id`.'''
+        stream = self._streams.get(stream_id)
+        owner = stream_slot(stream_id)
+        if stream is None and owner is not None and owner != self._slot:
+            # the kernel picked the worker: `load_balancing: reuse_port` or TLS
+            logger.info(
+                'unable to resume stream %s: it belongs to worker %s, not %s',
+                stream_id,
+                owner,
+                self._slot,
+            )
+            return None
+        if stream is None or not stream.detached or stream.user_uuid != user_uuid:
+            logger.debug('unable to resume stream %s: unknown stream', stream_id)
+            return None
+        missed = stream.buffer.since(last_event_id)
+        if missed is None:
+            logger.debug('unable to resume stream %s: events were lost', stream_id)
+            self._expire(stream)
+            return None
+        stream._expiry.cancel()  # type: ignore[union-attr]
+        stream._expiry = None
+        logger.debug('resuming stream %s, replaying %d events', stream_id, len(missed))
+        return stream, missed
+
+    def detach(self, stream: ResumableStream) -> None:
+        stream.consumer.set_handler(lambda message: self._on_message(stream, message))
+        stream._expiry = asyncio.get_event_loop().call_later(
+            self._max_age, self._expire, stream
+        )
+        logger.debug('stream %s detached, kept for %ss', stream.id, self._max_age)
+
+    def discard(self, stream: ResumableStream) -> None:
+        # the consumer of a discarded stream is stopped by its owner
+        if stream._expiry is not None:
+            stream._expiry.cancel()
+            stream._expiry = None
+        self._streams.pop(stream.id, None)
+
+    async def close(self) -> None:
+        for stream in list(self._streams.values()):
+            if stream.detached:
+                self._expire(stream)
+        if self._stopping:
+            await asyncio.wait(self._stopping)
+
+    def _on_message(self, stream: ResumableStream, message: BusMessage | Exception):
+        if isinstance(message, Exception):
+            logger.debug('stream %s lost its bus consumer: %s', stream.id, message)
+            self._expire(stream)
+            return
+        stream.record(message)
+
+    def _expire(self, stream: ResumableStream) -> None:
+        self.discard(stream)
+        task = asyncio.create_task(self._stop_consumer(stream))
+        self._stopping.add(task)
+        task.add_done_callback(self._stopping.discard)
+
+    @staticmethod
+    async def _stop_consumer(stream: ResumableStream) -> None:
+        try:
+            await stream.consumer.stop()
+        except Exception as e:
+            logger.debug(
+                'error while stopping the consumer of stream %s: %s', stream.id, e
+            )
@@ -5,26 +5,37 @@ from __future__ import annotations
 
 import asyncio
 import logging
+from collections import deque
 from urllib.parse import parse_qsl, urlparse
 
 import websockets
 
+from .admission import Admission, AdmissionControl
 from .auth import MasterTenantProxy
-from .bus import BusConsumer, BusService
+from .bus import BusConsumer, BusMessage, BusService
+from .drain import reconnect_reason
 from .exception import (
+    AdmissionRejectedError,
     AuthenticationError,
     AuthenticationExpiredError,
+    AuthenticationOverloadedError,
+    AuthenticationUnavailableError,
     BusConnectionError,
     BusConnectionLostError,
+    EventsLostError,
     NoTokenError,
     SessionProtocolError,
     UnsupportedVersionError,
 )
+from .keepalive import KeepaliveEntry, KeepaliveScheduler
+from .protocol import binary_protocol
+from .resume import ResumableStream, StreamRegistry
+from .snapshot import LastValueCache
 
 logger = logging.getLogger(__name__)
 
 
-SUPPORTED_VERSION = (1, 2)
+SUPPORTED_VERSION = (1, 2, 3)
 
 
 class SessionFactory:
@@ -35,15 +46,35 @@ class SessionFactory:
         bus_service,
         protocol_encoder,
         protocol_decoder,
+        keepalive,
+        streams,
+        last_value_cache,
+        admission,
     ):
         self._config = config
         self._authenticator = authenticator
         self._bus_service = bus_service
         self._protocol_encoder = protocol_encoder
         self._protocol_decoder = protocol_decoder
+        self._keepalive = keepalive
+        self._streams = streams
+        self._last_value_cache = last_value_cache
+        self._admission: AdmissionControl = admission
+        self._retry_max_delay = config['admission']['retry_max_delay']
 
     async def ws_handler(self, ws, path):
         remote_address = ws.request_headers.get('X-Forwarded-For', ws.remote_address)
+        try:
+            admission = await self._admission.admit()
+        except AdmissionRejectedError as e:
+            logger.info(
+                'websocket connection rejected from "%s": %s', remote_address, e
+            )
+            await ws.close(
+                Session._CLOSE_CODE_TRY_AGAIN_LATER,
+                reconnect_reason(self._retry_max_delay),
+            )
+            return
         logger.info('websocket connection accepted from "%s"', remote_address)
         session = Session(
             self._config,
@@ -51,12 +82,17 @@ class SessionFactory:
             self._bus_service,
             self._protocol_encoder,
             self._protocol_decoder,
+            self._keepalive,
+            self._streams,
+            self._last_value_cache,
             ws,
             path,
+            admission,
         )
         try:
             await session.run()
         finally:
+            admission.close()
             user_uuid, tenant_uuid = session.user_identity()
             logger.info(
                 'websocket session terminated %s (user=%s tenant=%s)',
@@ -71,6 +107,7 @@ class Session:
     _CLOSE_CODE_AUTH_FAILED = 4002
     _CLOSE_CODE_AUTH_EXPIRED = 4003
     _CLOSE_CODE_PROTOCOL_ERROR = 4004
+    _CLOSE_CODE_TRY_AGAIN_LATER = 1013
 
     def __init__(
         self,
@@ -79,26 +116,52 @@ class Session:
         bus_service,
         protocol_encoder,
         protocol_decoder,
+        keepalive,
+        streams,
+        last_value_cache,
         ws,
         path,
+        admission: Admission | None = None,
     ):
-        self._ws_ping_interval = config['websocket']['ping_interval']
+        self._batch_max_events = config['websocket']['batch_max_events']
+        self._batch_max_bytes = config['websocket']['batch_max_bytes']
+        self._batch_flush_interval = config['websocket']['batch_flush_interval']
+        self._max_queued_bytes = config['websocket']['max_queued_bytes']
         self._authenticator = authenticator
+        self._keepalive: KeepaliveScheduler = keepalive
+        self._keepalive_entry: KeepaliveEntry = None  # type: ignore[assignment]
+        self._streams: StreamRegistry = streams
+        self._stream: ResumableStream | None = None
+        self._last_value_cache: LastValueCache = last_value_cache
+        # cached events of the subscriptions, sent when the session starts
+        self._snapshot: dict[int, BusMessage] = {}
         self._protocol_version = 1
         self._protocol_encoder = protocol_encoder
         self._protocol_decoder = protocol_decoder
         self._ws = ws
         self._path = path
+        self._admission = admission
         self._started = False
         self._bus_service: BusService = bus_service
         self._consumer: BusConsumer = None  # type: ignore[assignment]
         self._user_uuid: str | None = None
         self._tenant_uuid: str | None = None
+        self._task: asyncio.Task | None = None
+        self._error: Exception | None = None
+        # events waiting to be sent, with their id
+        self._outgoing: deque[tuple[int, BusMessage]] = deque()
+        self._outgoing_bytes = 0
+        self._transmit_task: asyncio.Task | None = None
+        self._initialized = False
+        # events of protocol version 2+ carry their id, and lost ones are announced
+        self._last_id = 0
+        self._sent_id = 0
 
     def user_identity(self) -> tuple[str | None, str | None]:
         return self._user_uuid, self._tenant_uuid
 
     async def run(self):
+        self._keepalive_entry = self._keepalive.register(self._ws)
         try:
             await self._run()
         except NoTokenError:
@@ -117,6 +180,26 @@ class Session:
             await self._ws.close(
                 self._CLOSE_CODE_AUTH_EXPIRED, 'authentication expired'
             )
+        except AuthenticationOverloadedError as e:
+            logger.info(
+                'closing websocket connection: authentication overloaded: %s (user=%s tenant=%s)',
+                e,
+                self._user_uuid,
+                self._tenant_uuid,
+            )
+            await self._ws.close(
+                self._CLOSE_CODE_TRY_AGAIN_LATER, 'authentication overloaded'
+            )
+        except AuthenticationUnavailableError as e:
+            logger.info(
+                'closing websocket connection: authentication unavailable: %s (user=%s tenant=%s)',
+                e,
+                self._user_uuid,
+                self._tenant_uuid,
+            )
+            await self._ws.close(
+                self._CLOSE_CODE_TRY_AGAIN_LATER, 'authentication unavailable'
+            )
         except AuthenticationError as e:
             logger.info(
                 'closing websocket connection: authentication failed: %s (user=%s tenant=%s)',
@@ -154,6 +237,14 @@ class Session:
                 self._tenant_uuid,
             )
             await self._ws.close(1011, 'bus connection error')
+        except EventsLostError as e:
+            logger.info(
+                'closing websocket connection: %s (user=%s tenant=%s)',
+                e,
+                self._user_uuid,
+                self._tenant_uuid,
+            )
+            await self._ws.close(1011, 'events lost')
         except websockets.ConnectionClosed as e:
             # also raised when the ws_server is closed
             logger.info(
@@ -169,58 +260,110 @@ class Session:
                 self._tenant_uuid,
             )
             await self._ws.close(1011)
+        finally:
+            self._keepalive.unregister(self._keepalive_entry)
 
     async def _run(self):
+        # Background failures (bus, auth check, transmission) are reported by
+        # cancelling this task, then raised from here to close the session.
+        task = self._task = asyncio.current_task()
+        try:
+            await self._serve()
+        except asyncio.CancelledError:
+            if self._error is None or task is None:
+                raise
+            task.uncancel()
+            raise self._error from None
+        finally:
+            self._task = None
+            if self._transmit_task:
+                self._transmit_task.cancel()
+
+    async def _serve(self):
         if not MasterTenantProxy.has_master_tenant():
             raise AuthenticationError('unable to determine master tenant')
 
         self._protocol_version = _extract_version_from_path(self._path)
+        encoding = _extract_encoding_from_path(self._path)
+        if encoding:
+            if self._protocol_version < 2:
+                raise SessionProtocolError('binary encodings require version 2+')
+            self._protocol_encoder, self._protocol_decoder = binary_protocol(encoding)
 
         token_id = _extract_token_id(self._ws, self._path)
         token = await self._authenticator.get_token(token_id)
         self._user_uuid = token['metadata'].get('uuid')
         self._tenant_uuid = token['metadata'].get('tenant_uuid')
 
-        async with await self._bus_service.create_consumer(token) as self._consumer:
+        missed = None
+        session_id, last_event_id = _extract_resume_from_path(self._path)
+        if session_id is not None and self._protocol_version >= 2:
+            resumed = self._streams.resume(session_id, self._user_uuid, last_event_id)
+            if resumed is not None:
+                self._stream, missed = resumed
+        if self._stream is None:
+            consumer = await self._bus_service.create_consumer(token)
+        else:
+            consumer = self._stream.consumer
+        self._consumer = consumer
+
+        detached = False
+        try:
+            # the consumer is stopped even if it fails to start
+            if self._stream is None:
+                await consumer.start()
+                if self._protocol_version >= 2:
+                    self._stream = self._streams.create(self._user_uuid, consumer)
+            else:
+                consumer.set_token(token)
+                # the previous connection may have been lost before `start`
+                await consumer.consume()
+            consumer.set_handler(self._on_bus_message)
+            if missed is not None:
+                # a resumed session is already started
+                self._started = True
+                self._sent_id = last_event_id
+                for event_id, message in missed:
+                    self._enqueue(event_id, message)
             await self._ws.send(
-                self._protocol_encoder.encode_init(version=self._protocol_version)
+                self._protocol_encoder.encode_init(
+                    version=self._protocol_version,
+                    session_id=self._stream.id if self._stream else None,
+                    resumed=missed is not None,
+                )
             )
+            self._initialized = True
+            if self._admission is not None:
+                self._admission.handshake_done()
+            self._schedule_transmit()
 
-            ping_task = asyncio.create_task(self._task_send_ping())
-            receiver_task = asyncio.create_task(self._task_receive_command())
-            transmitter_task = asyncio.create_task(self._task_transmit_event())
-            auth_task = asyncio.create_task(self._task_authentification())
-
-            tasks = [ping_task, receiver_task, auth_task, transmitter_task]
-
-            # Wait for the first exception
-            done, pending = await asyncio.wait(
-                tasks, return_when=asyncio.FIRST_COMPLETED
+            auth_check = self._authenticator.schedule_check(
+                self._consumer.get_token, self._abort
             )
-
-            # Then stop other tasks
-            for task in pending:
-                task.cancel()
-
-            # Wait for all tasks to stop
-            await asyncio.wait(pending, return_when=asyncio.ALL_COMPLETED)
-
-            # raise the first exception we got
-            for task in done:
-                task.result()
-
-    async def _task_send_ping(self):
-        while True:
-            await asyncio.sleep(self._ws_ping_interval)
-            logger.debug('sending websocket ping')
             try:
-                await self._ws.ping()
-            except websockets.ConnectionClosed:
-                raise
+                await self._receive_commands()
+            finally:
+                auth_check.cancel()
+        except websockets.ConnectionClosed:
+            if self._stream is not None:
+                self._streams.detach(self._stream)
+                detached = True
+            raise
+        finally:
+            if not detached:
+                if self._stream is not None:
+                    self._streams.discard(self._stream)
+                await consumer.stop()
+
+    def _abort(self, error: Exception) -> None:
+        if self._error is None and self._task is not None:
+            self._error = error
+            self._task.cancel()
 
-    async def _task_receive_command(self):
+    async def _receive_commands(self):
         while True:
             data = await self._ws.recv()
+            self._keepalive_entry.touch()
             msg = self._protocol_decoder.decode(data)
             func_name = f'_do_ws_{msg.op}'
             func = getattr(self, func_name, None)
@@ -228,45 +371,172 @@ class Session:
                 raise SessionProtocolError(f'unknown operation "{msg.op}"')
             await func(msg)
 
-    async def _task_transmit_event(self):
-        async for message in self._consumer:
-            if not self._started:
-                logger.debug(
-                    'unable to push event to websocket as session hasn\'t started yet'
-                )
-                continue
+    def _on_bus_message(self, message: BusMessage | Exception) -> None:
+        if isinstance(message, Exception):
+            self._abort(message)
+            return
+        if self._error is not None:
+            return  # the session is closing
+        if not self._started:
+            logger.debug(
+                'unable to push event to websocket as session hasn\'t started yet'
+            )
+            return
+        if self._stream is not None:
+            event_id = self._stream.record(message)
+        else:
+            self._last_id = event_id = self._last_id + 1
+        self._enqueue(event_id, message)
+        self._schedule_transmit()
+
+    def _enqueue(self, event_id: int, message: BusMessage) -> None:
+        self._outgoing.append((event_id, message))
+        self._outgoing_bytes += len(message.raw)
+        if self._outgoing_bytes > self._max_queued_bytes:
             if self._protocol_version == 1:
-                payload = message.raw
-            else:
-                payload = self._protocol_encoder.encode_event(message.content)
+                # without event ids, the client could not tell that events were
+                # lost: close the session so that it resyncs when reconnecting
+                self._outgoing.clear()
+                self._outgoing_bytes = 0
+                self._abort(EventsLostError('too many events waiting to be sent'))
+                return
+            # the client doesn't keep up: drop the oldest events
+            dropped = 0
+            while self._outgoing_bytes > self._max_queued_bytes:
+                self._pop_outgoing()
+                dropped += 1
+            logger.debug(
+                'too many events waiting to be sent, %s dropped (user=%s tenant=%s)',
+                dropped,
+                self._user_uuid,
+                self._tenant_uuid,
+            )
+
+    def _schedule_transmit(self) -> None:
+        # events are only sent after the init message
+        if self._outgoing and self._initialized and self._transmit_task is None:
+            self._transmit_task = asyncio.create_task(self._transmit_events())
+
+    async def _transmit_events(self):
+        # only runs while there are events waiting to be sent
+        try:
+            if self._protocol_version >= 3:
+                await self._transmit_batches()
+            while self._outgoing:
+                event_id, message = self._pop_outgoing()
+                if self._protocol_version == 1:
+                    await self._ws.send(message.raw)
+                else:
+                    await self._send_event(event_id, message)
+        except websockets.ConnectionClosed:
+            pass  # the receiving side is notified as well
+        except Exception as e:
+            self._abort(e)
+        finally:
+            self._transmit_task = None
+
+    async def _transmit_batches(self):
+        while self._outgoing:
+            if (
+                len(self._outgoing) < self._batch_max_events
+                and self._outgoing_bytes < self._batch_max_bytes
+            ):
+                # give the next events of a burst a chance to join this frame
+                await asyncio.sleep(self._batch_flush_interval)
+
+            # a batch only holds consecutive events
+            first_id, message = self._pop_outgoing()
+            last_id = first_id
+            batch = [message]
+            size = len(message.raw)
+            while self._outgoing and len(batch) < self._batch_max_events:
+                event_id, message = self._outgoing[0]
+                size += len(message.raw)
+                if size > self._batch_max_bytes or event_id != last_id + 1:
+                    break
+                last_id, message = self._pop_outgoing()
+                batch.append(message)
+            try:
+                payload = self._protocol_encoder.encode_events(batch, last_id)
+            except ValueError:
+                # the events that can be encoded are sent one by one
+                for event_id, message in enumerate(batch, first_id):
+                    await self._send_event(event_id, message)
+                continue
+            await self._announce_gap(first_id)
+            self._sent_id = last_id
             await self._ws.send(payload)
 
-    async def _task_authentification(self):
-        await self._authenticator.run_check(self._consumer.get_token)
+    async def _send_event(self, event_id: int, message: BusMessage) -> None:
+        try:
+            payload = self._protocol_encoder.encode_event(message, event_id)
+        except ValueError as e:
+            # announced as lost along with the next event sent
+            logger.warning(
+                'event `%s` dropped, unable to encode it: %s (user=%s tenant=%s)',
+                message.name,
+                e,
+                self._user_uuid,
+                self._tenant_uuid,
+            )
+            return
+        await self._announce_gap(event_id)
+        self._sent_id = event_id
+        await self._ws.send(payload)
+
+    async def _announce_gap(self, event_id: int) -> None:
+        if event_id > self._sent_id + 1:
+            first_id, last_id = self._sent_id + 1, event_id - 1
+            logger.debug('events %s to %s were lost', first_id, last_id)
+            await self._ws.send(self._protocol_encoder.encode_gap(first_id, last_id))
+
+    def _pop_outgoing(self) -> tuple[int, BusMessage]:
+        event_id, message = self._outgoing.popleft()
+        self._outgoing_bytes -= len(message.raw)
+        return event_id, message
 
     async def _do_ws_subscribe(self, msg):
         event_name = msg.value
         logger.debug('subscribing to event "%s"', event_name)
-        await self._consumer.bind(event_name)
-        if not self._started or self._protocol_version == 2:
+        await self._consumer.bind(event_name, msg.filter)
+        if not self._started or self._protocol_version >= 2:
             await self._ws.send(self._protocol_encoder.encode_subscribe())
+        if self._last_value_cache.enabled:
+            self._send_snapshot(event_name, msg.filter)
 
     async def _do_ws_start(self, msg):
+        # events may be received as soon as the consumer starts consuming
         self._started = True
         await self._ws.send(self._protocol_encoder.encode_start())
+        snapshot, self._snapshot = self._snapshot, {}
+        for message in snapshot.values():
+            self._on_bus_message(message)
+        await self._consumer.consume()
+
+    def _send_snapshot(self, event_name, event_filter) -> None:
+        snapshot = self._last_value_cache.snapshot(
+            event_name, self._consumer, event_filter
+        )
+        logger.debug('%d cached events of "%s" to send', len(snapshot), event_name)
+        if self._started:
+            for message in snapshot:
+                self._on_bus_message(message)
+        else:
+            # the same event may match several subscriptions
+            self._snapshot.update((id(message), message) for message in snapshot)
 
     async def _do_ws_token(self, msg):
         token = await self._authenticator.get_token(msg.value)
         self._consumer.set_token(token)
-        if not self._started or self._protocol_version == 2:
+        if not self._started or self._protocol_version >= 2:
             await self._ws.send(self._protocol_encoder.encode_token())
 
     async def _do_ws_ping(self, msg):
-        if self._protocol_version == 2:
+        if self._protocol_version >= 2:
             logger.debug('received client ping, sending pong')
             await self._ws.send(self._protocol_encoder.encode_pong(msg.value))
         else:
-            logger.debug('received client ping, only supported in version 2')
+            logger.debug('received client ping, only supported from version 2')
 
 
 def _extract_token_id(ws, path):
@@ -290,6 +560,26 @@ def _extract_version_from_path(path):
     return 1
 
 
+def _extract_encoding_from_path(path):
+    for name, value in parse_qsl(urlparse(path).query):
+        if name == 'encoding':
+            return value if value != 'json' else None
+    return None
+
+
+def _extract_resume_from_path(path) -> tuple[str | None, int]:
+    session_id, last_event_id = None, 0
+    for name, value in parse_qsl(urlparse(path).query):
+        if name == 'session_id':
+            session_id = value
+        elif name == 'last_event_id':
+            try:
+                last_event_id = int(value)
+            except ValueError:
+                raise SessionProtocolError('last_event_id is not an integer')
+    return session_id, last_event_id
+
+
 def _extract_token_id_from_path(path):
     for name, value in parse_qsl(urlparse(path).query):
         if name == 'token':
@@ -0,0 +1,182 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from itertools import chain, repeat
+from secrets import token_hex
+from typing import TYPE_CHECKING, Any
+
+from aioamqp.channel import Channel
+from aioamqp.envelope import Envelope
+from aioamqp.exceptions import AmqpClosedConnection, ChannelClosed
+from aioamqp.properties import Properties
+
+from .bus import BusConsumer, BusMessage, BusService, decode_event
+from .codec import JSONCodec
+from .exception import BusConnectionError, EventPermissionError, InvalidEvent
+from .subscription import PatternTrie, is_pattern
+
+if TYPE_CHECKING:
+    from .subscription import EventFilter
+
+logger = logging.getLogger(__name__)
+
+_Key = tuple[str, Any, Any]  # event name, tenant uuid, entity key
+
+
+def _retry_delays():
+    return chain((1, 2, 4, 8, 16), repeat(32))
+
+
+class LastValueCache:
+    '''Last event of each entity, for the event names configured in `events`.
+
+    The cache has its own bus queue, bound to the configured event names, and
+    keeps the last event received for each entity of each tenant, the entity being
+    identified by the value found at the configured path of the event payload.
+    Entries are evicted after `max_age` seconds, or when there are more than
+    `max_entries`, least recently updated first.
+    '''
+
+    def __init__(self, config: dict, codec: JSONCodec):
+        lvc_config = config['last_value_cache']
+        self._enabled: bool = lvc_config['enabled']
+        self._max_entries: int = lvc_config['max_entries']
+        self._max_age: float = lvc_config['max_age']
+        self._paths: dict[str, tuple[str, ...]] = {
+            name: tuple(path.split('.'))
+            for name, path in lvc_config['events'].items()
+            if path
+        }
+        self._exchange_name: str = config['bus']['exchange_name']
+        self._origin_uuid: str = config['uuid']
+        self._codec = codec
+        self._entries: OrderedDict[_Key, tuple[float, BusMessage]] = OrderedDict()
+        self._names: dict[str, set[_Key]] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled and bool(self._paths)
+
+    @property
+    def event_names(self) -> frozenset[str]:
+        return frozenset(self._paths)
+
+    async def run(self, service: BusService) -> None:
+        if not self.enabled:
+            return
+        delays = _retry_delays()
+        while True:
+            try:
+                channel = await service.get_channel()
+                await self._consume(channel)
+            except (AmqpClosedConnection, BusConnectionError, ChannelClosed) as e:
+                logger.debug('last value cache: unable to consume events: %s', e)
+                await asyncio.sleep(next(delays))
+                continue
+            delays = _retry_delays()
+            await channel.close_event.wait()
+            logger.info('last value cache: bus channel closed, reconnecting...')
+
+    def snapshot(
+        self,
+        event_name: str,
+        consumer: BusConsumer,
+        event_filter: EventFilter | None = None,
+    ) -> list[BusMessage]:
+        '''Return the cached events of `event_name` that this consumer may receive.'''
+        if not self._entries:
+            return []
+        deadline = asyncio.get_event_loop().time() - self._max_age
+        messages = []
+        for key in self._keys(event_name):
+            timestamp, message = self._entries[key]
+            if timestamp < deadline:
+                continue
+            if event_filter is not None and not event_filter(message.content):
+                continue
+            if consumer.can_receive(message):
+                messages.append(message)
+        return messages
+
+    def stats(self) -> dict:
+        return {'entries': len(self)}
+
+    def put(self, message: BusMessage) -> None:
+        path = self._paths.get(message.name)
+        if path is None:
+            return
+        entity: Any = message.content
+        for part in path:
+            entity = entity.get(part) if isinstance(entity, dict) else None
+        if entity is None or isinstance(entity, (dict, list)):
+            logger.debug('last value cache: no key for event `%s`', message.name)
+            return
+
+        key = (message.name, message.headers.get('tenant_uuid'), entity)
+        self._entries[key] = (asyncio.get_event_loop().time(), message)
+        self._entries.move_to_end(key)
+        self._names.setdefault(message.name, set()).add(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        deadline = asyncio.get_event_loop().time() - self._max_age
+        entries = self._entries
+        while entries:
+            key, (timestamp, _) = next(iter(entries.items()))
+            if len(entries) <= self._max_entries and timestamp >= deadline:
+                break
+            del entries[key]
+            self._names[key[0]].discard(key)
+
+    def _keys(self, event_name: str) -> list[_Key]:
+        if not is_pattern(event_name):
+            return list(self._names.get(event_name, ()))
+        # matched like the subscriptions: only `*` is a wildcard
+        pattern = PatternTrie()
+        pattern.add(event_name)
+        return [
+            key
+            for name, keys in self._names.items()
+            if pattern.match(name)
+            for key in keys
+        ]
+
+    async def _consume(self, channel: Channel) -> None:
+        response = await channel.queue(
+            f'wazo-websocketd.last-value-cache.{token_hex(3)}',
+            durable=False,
+            exclusive=True,
+            auto_delete=True,
+        )
+        queue_name = response['queue']
+        for name in self._paths:
+            await channel.queue_bind(
+                queue_name,
+                self._exchange_name,
+                '',
+                arguments={'name': name, 'origin_uuid': self._origin_uuid},
+            )
+        await channel.basic_consume(self._on_message, queue_name, no_ack=True)
+        logger.debug('last value cache: consuming %s', ', '.join(self._paths))
+
+    async def _on_message(
+        self,
+        channel: Channel,
+        content: bytes,
+        envelope: Envelope,
+        properties: Properties,
+    ) -> None:
+        try:
+            message = decode_event(self._codec, content, properties.headers or {})
+        except (InvalidEvent, EventPermissionError) as e:
+            logger.debug('last value cache: unable to decode message: %s', e)
+            return
+        self.put(message)
@@ -0,0 +1,57 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Callable
+from os import getpid
+
+logger = logging.getLogger(__name__)
+
+
+class Timing:
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def collect(self, prefix: str) -> dict[str, int | float]:
+        average = self.total / self.count if self.count else 0.0
+        values = {
+            f'{prefix}_count': self.count,
+            f'{prefix}_avg_ms': round(average * 1000, 3),
+            f'{prefix}_max_ms': round(self.max * 1000, 3),
+        }
+        self.count, self.total, self.max = 0, 0.0, 0.0
+        return values
+
+
+class StatsReporter:
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._providers: dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, provider: Callable[[], dict]) -> None:
+        self._providers[name] = provider
+
+    async def run(self) -> None:
+        if not self._interval:
+            return
+        while True:
+            await asyncio.sleep(self._interval)
+            self.report()
+
+    def report(self) -> None:
+        for name, provider in self._providers.items():
+            values = ' '.join(f'{key}={value}' for key, value in provider().items())
+            logger.info('[pid %s] %s stats: %s', getpid(), name, values)
@@ -0,0 +1,241 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import json
+from collections.abc import Callable, Iterator
+from functools import lru_cache
+from typing import Any
+
+_MISSING = object()
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _typed(value: Any) -> tuple[bool, Any]:
+    # like in JSON, booleans are not numbers: `true` is neither `1` nor `1.0`
+    return isinstance(value, bool), value
+
+
+def _eq(value: Any, expected: Any) -> bool:
+    return _typed(value) == _typed(expected)
+
+
+def _ne(value: Any, expected: Any) -> bool:
+    return not _eq(value, expected)
+
+
+def _in(value: Any, values: frozenset) -> bool:
+    try:
+        return _typed(value) in values
+    except TypeError:  # unhashable value
+        return False
+
+
+_OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    '==': _eq,
+    '!=': _ne,
+    'in': _in,
+}
+
+
+class EventFilter:
+    '''Predicate on the payload of an event, compiled from a list of conditions.
+
+    Each condition is an object such as `{"path": "data.queue_id", "operator":
+    "==", "value": 12}`; an event matches when all of its conditions are true.
+    Filters are compiled once per worker and shared by all sessions.
+    '''
+
+    __slots__ = ('key', '_conditions')
+
+    def __init__(self, key: str, conditions: list[tuple[tuple[str, ...], str, Any]]):
+        self.key = key
+        self._conditions = [
+            (path, _OPERATORS[op], value) for path, op, value in conditions
+        ]
+
+    def __call__(self, content: dict) -> bool:
+        for path, compare, expected in self._conditions:
+            value: Any = content
+            for key in path:
+                if not isinstance(value, dict):
+                    return False
+                value = value.get(key, _MISSING)
+            if value is _MISSING or not compare(value, expected):
+                return False
+        return True
+
+    def __repr__(self):
+        return f'<EventFilter {self.key}>'
+
+
+def compile_filter(conditions: Any) -> EventFilter:
+    '''Return the shared filter of a list of conditions.
+
+    Raises a ValueError when the conditions are malformed.
+    '''
+    if not isinstance(conditions, list) or not conditions:
+        raise ValueError('filters must be a non-empty list')
+    try:
+        key = json.dumps(conditions, sort_keys=True)
+    except (TypeError, ValueError):
+        raise ValueError('filters are not serializable')
+    return _compile(key)
+
+
+@lru_cache(maxsize=1024)
+def _compile(key: str) -> EventFilter:
+    conditions = []
+    for condition in json.loads(key):
+        if not isinstance(condition, dict):
+            raise ValueError('filter is not an object')
+        path, op = condition.get('path'), condition.get('operator', '==')
+        value = condition.get('value')
+        if not isinstance(path, str) or not path:
+            raise ValueError('filter "path" must be a non-empty string')
+        if op not in _OPERATORS:
+            raise ValueError(f'unsupported filter operator "{op}"')
+        if op == 'in':
+            if not isinstance(value, list) or not all(
+                isinstance(item, _SCALARS) for item in value
+            ):
+                raise ValueError('"in" filter value must be a list of scalars')
+            value = frozenset(_typed(item) for item in value)
+        elif not isinstance(value, _SCALARS):
+            raise ValueError(f'"{op}" filter value must be a scalar')
+        conditions.append((tuple(path.split('.')), op, value))
+    return EventFilter(key, conditions)
+
+
+class PatternTrie:
+    '''Trie of event name patterns, where `*` matches any sequence of characters.'''
+
+    __slots__ = ('_children', '_pattern', '_wildcard')
+
+    def __init__(self, wildcard: bool = False):
+        self._children: dict[str, PatternTrie] = {}
+        self._pattern: str | None = None
+        self._wildcard = wildcard
+
+    def __bool__(self):
+        return self._pattern is not None or bool(self._children)
+
+    def add(self, pattern: str) -> None:
+        node = self
+        for char in pattern:
+            child = node._children.get(char)
+            if child is None:
+                child = node._children[char] = PatternTrie(char == '*')
+            node = child
+        node._pattern = pattern
+
+    def remove(self, pattern: str) -> None:
+        path = [self]
+        for char in pattern:
+            child = path[-1]._children.get(char)
+            if child is None:
+                return
+            path.append(child)
+        path[-1]._pattern = None
+        # prune the branches left without patterns
+        for depth in range(len(pattern), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1]._children[pattern[depth - 1]]
+
+    def match(self, name: str) -> set[str]:
+        matches = set()
+        end = len(name)
+        stack = [(self, 0)]
+        seen = set()
+        while stack:
+            node, index = stack.pop()
+            if (id(node), index) in seen:
+                continue
+            seen.add((id(node), index))
+            if node._wildcard and index < end:
+                # `*` consumes one more character
+                stack.append((node, index + 1))
+            wildcard = node._children.get('*')
+            if wildcard is not None:
+                stack.append((wildcard, index))
+            if index == end:
+                if node._pattern is not None:
+                    matches.add(node._pattern)
+                continue
+            child = node._children.get(name[index])
+            if child is not None:
+                stack.append((child, index + 1))
+        return matches
+
+
+def is_pattern(event_name: str) -> bool:
+    return '*' in event_name
+
+
+class Subscriptions:
+    '''Event names and patterns subscribed by a session, with their optional filters.
+
+    Patterns such as `*` or `call_*` are matched by a trie, and the patterns
+    matching each event name are cached until the subscriptions change. An event
+    is accepted when a matching subscription has no filter, or when one of the
+    filters of the matching subscriptions accepts its payload.
+    '''
+
+    __slots__ = ('_filters', '_patterns', '_matches')
+
+    def __init__(self):
+        # None means that the event is subscribed without a filter
+        self._filters: dict[str, set[EventFilter] | None] = {}
+        self._patterns = PatternTrie()
+        self._matches: dict[str, tuple[str, ...]] = {}
+
+    def __contains__(self, event_name: str) -> bool:
+        return event_name in self._filters
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._filters))
+
+    def has_patterns(self) -> bool:
+        return bool(self._patterns)
+
+    def add(self, event_name: str, event_filter: EventFilter | None = None) -> None:
+        if event_name not in self._filters:
+            if is_pattern(event_name):
+                self._patterns.add(event_name)
+            self._matches.clear()
+        if event_filter is None:
+            self._filters[event_name] = None
+            return
+        filters = self._filters.setdefault(event_name, set())
+        if filters is not None:
+            filters.add(event_filter)
+
+    def remove(self, event_name: str) -> None:
+        if event_name not in self._filters:
+            return
+        del self._filters[event_name]
+        if is_pattern(event_name):
+            self._patterns.remove(event_name)
+        self._matches.clear()
+
+    def accepts(self, event_name: str, content: dict) -> bool:
+        for name in self._matching(event_name):
+            filters = self._filters[name]
+            if filters is None:
+                return True
+            if any(event_filter(content) for event_filter in filters):
+                return True
+        return False
+
+    def _matching(self, event_name: str) -> tuple[str, ...]:
+        try:
+            return self._matches[event_name]
+        except KeyError:
+            pass
+        names = sorted(self._patterns.match(event_name)) if self._patterns else []
+        if event_name in self._filters:
+            names.insert(0, event_name)
+        self._matches[event_name] = matches = tuple(names)
+        return matches
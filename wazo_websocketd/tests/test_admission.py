@@ -0,0 +1,104 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+
+import pytest
+
+from ..admission import AdmissionControl
+from ..exception import AdmissionRejectedError
+
+
+def _control(**config):
+    config = {
+        'max_handshakes': 2,
+        'max_waiting': 2,
+        'wait_timeout': 1,
+        'max_sessions': 0,
+        **config,
+    }
+    return AdmissionControl(config)
+
+
+class TestAdmissionControl:
+    async def test_sessions_are_admitted_up_to_the_handshake_limit(self):
+        control = _control()
+
+        first = await control.admit()
+        await control.admit()
+        waiting = asyncio.create_task(control.admit())
+        await asyncio.sleep(0)
+
+        assert not waiting.done()
+        first.handshake_done()
+        await asyncio.wait_for(waiting, 1)
+        assert control.stats()['handshakes'] == 2
+
+    async def test_waiting_sessions_are_admitted_in_order(self):
+        control = _control(max_handshakes=1)
+        first = await control.admit()
+        admitted = []
+
+        async def admit(name):
+            await control.admit()
+            admitted.append(name)
+
+        tasks = [asyncio.create_task(admit(name)) for name in ('a', 'b')]
+        await asyncio.sleep(0)
+        first.close()
+        await asyncio.wait_for(tasks[0], 1)
+
+        assert admitted == ['a']
+        tasks[1].cancel()
+
+    async def test_sessions_are_rejected_when_too_many_are_waiting(self):
+        control = _control(max_handshakes=1, max_waiting=1)
+        await control.admit()
+        waiting = asyncio.create_task(control.admit())
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejectedError):
+            await control.admit()
+        waiting.cancel()
+
+    async def test_sessions_are_rejected_after_the_wait_timeout(self):
+        control = _control(max_handshakes=1, wait_timeout=0.01)
+        await control.admit()
+
+        with pytest.raises(AdmissionRejectedError):
+            await control.admit()
+
+        assert control.stats()['waiting'] == 0
+
+    async def test_sessions_are_rejected_above_the_session_limit(self):
+        control = _control(max_sessions=1)
+        admission = await control.admit()
+        admission.handshake_done()
+
+        with pytest.raises(AdmissionRejectedError):
+            await control.admit()
+        admission.close()
+        await control.admit()
+
+    async def test_cancelled_waiters_do_not_hold_a_slot(self):
+        control = _control(max_handshakes=1)
+        first = await control.admit()
+        waiting = asyncio.create_task(control.admit())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+        first.close()
+
+        assert control.stats()['handshakes'] == 0
+        await asyncio.wait_for(control.admit(), 1)
+
+    async def test_closing_twice_releases_the_slots_once(self):
+        control = _control()
+        admission = await control.admit()
+
+        admission.close()
+        admission.close()
+
+        assert control.stats()['sessions'] == 0
+        assert control.stats()['handshakes'] == 0
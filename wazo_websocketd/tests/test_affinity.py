@@ -0,0 +1,65 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from ..affinity import parse_cpu_list, placement, worker_cpus
+
+# dual socket, 2 cores per socket, 2 hyper-threads per core, numbered like Linux
+_TOPOLOGY = {
+    0: (0, (0, 0)),
+    1: (0, (0, 1)),
+    2: (1, (1, 0)),
+    3: (1, (1, 1)),
+    4: (0, (0, 0)),
+    5: (0, (0, 1)),
+    6: (1, (1, 0)),
+    7: (1, (1, 1)),
+}
+
+
+@pytest.fixture
+def topology():
+    with patch('wazo_websocketd.affinity._topology', _TOPOLOGY.__getitem__):
+        yield
+
+
+class TestParseCpuList:
+    def test_ranges_and_single_cpus(self):
+        assert parse_cpu_list('0-2,8, 10-11') == {0, 1, 2, 8, 10, 11}
+
+    def test_a_single_cpu(self):
+        assert parse_cpu_list(3) == {3}
+
+    @pytest.mark.parametrize('value', ['', '3-1', 'a', '1,', '-1'])
+    def test_malformed_lists_are_refused(self, value):
+        with pytest.raises(ValueError):
+            parse_cpu_list(value)
+
+
+class TestPlacement:
+    def test_workers_alternate_between_nodes_before_sharing_cores(self, topology):
+        assert placement(range(8)) == [0, 2, 1, 3, 4, 6, 5, 7]
+
+    def test_a_single_node(self, topology):
+        assert placement([0, 1, 4]) == [0, 1, 4]
+
+    def test_unknown_topology(self):
+        assert placement([1, 0]) == [0, 1]
+
+
+class TestWorkerCpus:
+    def test_auto_uses_the_available_cpus(self):
+        assert sorted(worker_cpus({'cpus': 'auto'})) == sorted(os.sched_getaffinity(0))
+
+    def test_unavailable_cpus_are_ignored(self):
+        available = min(os.sched_getaffinity(0))
+
+        assert worker_cpus({'cpus': f'{available},4096'}) == [available]
+
+    def test_no_usable_cpu(self):
+        with pytest.raises(ValueError):
+            worker_cpus({'cpus': '4096'})
@@ -1,8 +1,11 @@
 # Copyright 2016-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import asyncio
 import datetime
-from unittest.mock import Mock, patch, sentinel
+import threading
+import time
+from unittest.mock import AsyncMock, Mock, patch, sentinel
 
 import pytest
 import requests
@@ -10,10 +13,18 @@ import requests
 from ..auth import (
     AsyncAuthClient,
     Authenticator,
+    SharedTokenCache,
+    TokenCacheProxy,
     _DynamicIntervalAuthChecker,
+    _ScheduledAuthCheck,
     _StaticIntervalAuthChecker,
 )
-from ..exception import AuthenticationError, AuthenticationExpiredError
+from ..exception import (
+    AuthenticationError,
+    AuthenticationExpiredError,
+    AuthenticationOverloadedError,
+    AuthenticationUnavailableError,
+)
 
 
 class TestAsyncAuthClient:
@@ -23,7 +34,16 @@ class TestAsyncAuthClient:
     def auth_client(self):
         with patch('wazo_websocketd.auth.AuthClient') as factory:
             self.auth_client = factory.return_value
-            self.client = AsyncAuthClient({'auth': {}})
+            self.client = AsyncAuthClient(
+                {
+                    'auth': {},
+                    'auth_circuit_breaker': {
+                        'failure_threshold': 2,
+                        'reset_timeout': 60,
+                    },
+                    'auth_executor': {'max_workers': 1, 'max_pending': 1},
+                }
+            )
             yield
 
     async def test_get_token(self):
@@ -41,6 +61,72 @@ class TestAsyncAuthClient:
             await self.client.get_token(sentinel.token_id)
         self.auth_client.token.get.assert_called_once_with(sentinel.token_id, self._ACL)
 
+    async def test_get_token_fails_fast_once_wazo_auth_is_down(self):
+        self.auth_client.token.get.side_effect = requests.ConnectionError()
+
+        for _ in range(3):
+            with pytest.raises(AuthenticationUnavailableError):
+                await self.client.get_token(sentinel.token_id)
+
+        assert self.auth_client.token.get.call_count == 2
+
+    async def test_a_refused_token_does_not_open_the_circuit(self):
+        response = Mock(status_code=404)
+        self.auth_client.token.get.side_effect = requests.HTTPError(response=response)
+
+        for _ in range(3):
+            with pytest.raises(AuthenticationError) as exc_info:
+                await self.client.get_token(sentinel.token_id)
+            assert not isinstance(exc_info.value, AuthenticationUnavailableError)
+
+        assert self.auth_client.token.get.call_count == 3
+
+    async def _open_circuit(self):
+        self.auth_client.token.get.side_effect = requests.ConnectionError()
+        for _ in range(2):
+            with pytest.raises(AuthenticationUnavailableError):
+                await self.client.get_token(sentinel.token_id)
+        # the reset timeout is over, the next request is a trial
+        self.client._breaker._opened_at = time.monotonic() - 61
+
+    async def test_a_cancelled_trial_request_releases_the_circuit(self):
+        await self._open_circuit()
+        release = threading.Event()
+        self.auth_client.token.get.side_effect = lambda *_: release.wait(5)
+        trial = asyncio.create_task(self.client.get_token('some-token'))
+        await asyncio.sleep(0)
+
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        release.set()
+        self.auth_client.token.get.side_effect = None
+        self.auth_client.token.get.return_value = sentinel.token
+
+        assert await self.client.get_token('some-token') is sentinel.token
+
+    async def test_an_unexpected_trial_error_keeps_the_circuit_open(self):
+        await self._open_circuit()
+        self.auth_client.token.get.side_effect = ValueError()
+
+        with pytest.raises(ValueError):
+            await self.client.get_token('some-token')
+
+        assert self.client._breaker.is_open
+        assert not self.client._breaker._trial_pending
+
+    async def test_get_token_is_refused_when_too_many_requests_are_pending(self):
+        release = threading.Event()
+        self.auth_client.token.get.side_effect = lambda *_: release.wait(5)
+        pending = asyncio.create_task(self.client.get_token('some-token'))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AuthenticationOverloadedError):
+            await self.client.get_token('other-token')
+
+        release.set()
+        await pending
+        assert self.client.stats()['rejected'] == 1
+
     async def test_is_valid_token(self):
         self.auth_client.token.is_valid.return_value = True
 
@@ -49,6 +135,58 @@ class TestAsyncAuthClient:
             sentinel.token_id, self._ACL
         )
 
+    async def test_get_token_from_the_shared_cache(self):
+        token = _token('some-token')
+        with patch.object(TokenCacheProxy, 'proxy', SharedTokenCache(8, 1024, 60)):
+            self.auth_client.token.get.return_value = token
+
+            assert await self.client.get_token('some-token') == token
+            assert await self.client.get_token('some-token') == token
+
+        self.auth_client.token.get.assert_called_once_with('some-token', self._ACL)
+
+
+def _token(token_id, expires_in=datetime.timedelta(hours=1)):
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + expires_in
+    return {
+        'token': token_id,
+        'utc_expires_at': expires_at.replace(tzinfo=None).isoformat(),
+        'acl': ['websocketd'],
+        'metadata': {'uuid': 'some-user-uuid', 'tenant_uuid': 'some-tenant-uuid'},
+    }
+
+
+class TestSharedTokenCache:
+    def setup_method(self):
+        self.cache = SharedTokenCache(8, 1024, 60)
+
+    def test_a_cached_token_is_returned(self):
+        token = _token('some-token')
+
+        self.cache.put('some-token', token)
+
+        assert self.cache.get('some-token') == token
+        assert self.cache.get('other-token') is None
+
+    def test_an_expired_token_is_not_cached(self):
+        self.cache.put('some-token', _token('some-token', datetime.timedelta(0)))
+
+        assert self.cache.get('some-token') is None
+
+    def test_a_token_too_large_is_not_cached(self):
+        token = _token('some-token') | {'acl': ['websocketd'] * 1000}
+
+        self.cache.put('some-token', token)
+
+        assert self.cache.get('some-token') is None
+
+    def test_an_invalidated_token_is_forgotten(self):
+        self.cache.put('some-token', _token('some-token'))
+
+        self.cache.invalidate('some-token')
+
+        assert self.cache.get('some-token') is None
+
 
 class TestAuthenticator:
     @pytest.fixture(autouse=True)
@@ -88,7 +226,47 @@ class TestStaticIntervalAuthChecker:
         check = _StaticIntervalAuthChecker(client, {'auth_check_static_interval': 0.1})
 
         with pytest.raises(AuthenticationExpiredError):
-            await check.run(lambda: {'token': sentinel.token_id})
+            await check.run(lambda: _token(sentinel.token_id))
+
+    async def test_the_session_survives_while_wazo_auth_is_unavailable(self):
+        client = Mock()
+        calls = []
+
+        async def is_valid_token(_token_id):
+            calls.append(_token_id)
+            if len(calls) == 1:
+                raise AuthenticationUnavailableError()
+            return False
+
+        client.is_valid_token = is_valid_token
+        check = _StaticIntervalAuthChecker(client, {'auth_check_static_interval': 0.1})
+        token = _token(sentinel.token_id)
+
+        with pytest.raises(AuthenticationExpiredError):
+            await check.run(lambda: token)
+        assert len(calls) == 2
+
+
+class TestScheduledAuthCheck:
+    async def test_the_error_is_reported_once_the_token_expires(self):
+        checker = Mock(next_check=Mock(return_value=0.01))
+        checker.check = AsyncMock(side_effect=[None, AuthenticationExpiredError()])
+        on_error = Mock()
+
+        _ScheduledAuthCheck(checker, lambda: sentinel.token, on_error)
+        await asyncio.sleep(0.1)
+
+        (error,), _ = on_error.call_args
+        assert isinstance(error, AuthenticationExpiredError)
+        assert checker.check.await_count == 2
+
+    async def test_no_check_happens_once_cancelled(self):
+        checker = Mock(next_check=Mock(return_value=0.01), check=AsyncMock())
+
+        _ScheduledAuthCheck(checker, lambda: sentinel.token, Mock()).cancel()
+        await asyncio.sleep(0.05)
+
+        checker.check.assert_not_awaited()
 
 
 class TestDynamicIntervalAuthChecker:
@@ -0,0 +1,291 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import socket
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from ..balancer import (
+    ConnectionBalancer,
+    SessionCounts,
+    _parse_stream_slot,
+    _parse_token_id,
+    receive_connections,
+)
+from ..exception import AuthenticationError
+
+WEBSOCKET_CONFIG = {
+    'listen': '127.0.0.1',
+    'port': 0,
+    'ssl': None,
+    'resume': {'enabled': False},
+}
+CONFIG = {'load_balancing': 'least_sessions', 'websocket': WEBSOCKET_CONFIG}
+AFFINITY_CONFIG = dict(CONFIG, load_balancing='tenant_affinity')
+RESUME_CONFIG = dict(CONFIG, websocket=dict(WEBSOCKET_CONFIG, resume={'enabled': True}))
+
+
+def _channels():
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+
+def _received(channel):
+    channel.setblocking(False)
+    fds = []
+    while True:
+        try:
+            _, received, _, _ = socket.recv_fds(channel, 1, 1)
+        except BlockingIOError:
+            break
+        fds.extend(received)
+    for fd in fds:
+        socket.socket(fileno=fd).close()
+    return len(fds)
+
+
+@pytest.fixture
+def connection():
+    left, right = socket.socketpair()
+    yield left
+    left.close()
+    right.close()
+
+
+class TestSessionCounts:
+    def test_counts(self):
+        counts = SessionCounts(2)
+
+        counts.on_open(1)
+        counts.on_open(1)
+        counts.on_close(1)
+
+        assert counts.sessions(0) == 0
+        assert counts.sessions(1) == 1
+        assert counts.closed(1) == 1
+        counts.reset(1)
+        assert counts.sessions(1) == counts.closed(1) == 0
+
+
+class TestConnectionBalancer:
+    def setup_method(self):
+        self.counts = SessionCounts(2)
+        self.ready = {0: True, 1: True}
+        self.balancer = ConnectionBalancer(
+            CONFIG, self.counts, lambda slot: self.ready[slot]
+        )
+        self.workers = []
+        for slot in range(2):
+            channel, worker = _channels()
+            self.balancer.attach(slot, channel)
+            self.workers.append(worker)
+
+    def teardown_method(self):
+        for slot in range(2):
+            self.balancer.detach(slot)
+        for worker in self.workers:
+            worker.close()
+
+    def test_connections_are_spread_by_load(self, connection):
+        for _ in range(4):
+            self.balancer._dispatch(connection)
+
+        assert [_received(worker) for worker in self.workers] == [2, 2]
+
+    def test_closed_connections_are_accounted(self, connection):
+        for _ in range(2):
+            self.balancer._dispatch(connection)
+        self.counts.on_open(0)
+        self.counts.on_close(0)
+
+        self.balancer._dispatch(connection)
+
+        assert [_received(worker) for worker in self.workers] == [2, 1]
+
+    def test_workers_not_ready_are_skipped(self, connection):
+        self.ready[0] = False
+
+        for _ in range(2):
+            self.balancer._dispatch(connection)
+
+        assert [_received(worker) for worker in self.workers] == [0, 2]
+
+    def test_dead_worker_is_detached(self, connection):
+        self.workers[0].close()
+
+        for _ in range(2):
+            self.balancer._dispatch(connection)
+
+        assert self.balancer._channels.keys() == {1}
+        assert _received(self.workers[1]) == 2
+
+
+class TestParseTokenId:
+    def test_token_in_query(self):
+        request = b'GET /?version=2&token=abc HTTP/1.1\r\nHost: x\r\n\r\n'
+
+        assert _parse_token_id(request) == 'abc'
+
+    def test_token_in_header(self):
+        request = b'GET / HTTP/1.1\r\nHost: x\r\nX-Auth-Token:  abc \r\n\r\n'
+
+        assert _parse_token_id(request) == 'abc'
+
+    def test_no_token(self):
+        assert _parse_token_id(b'GET / HTTP/1.1\r\nHost: x\r\n\r\n') is None
+        assert _parse_token_id(b'garbage') is None
+
+
+class TestParseStreamSlot:
+    def test_slot_of_the_session_id(self):
+        request = b'GET /?token=abc&session_id=3.xyz&last_event_id=2 HTTP/1.1\r\n\r\n'
+
+        assert _parse_stream_slot(request) == 3
+
+    def test_no_slot(self):
+        assert _parse_stream_slot(b'GET /?session_id=xyz HTTP/1.1\r\n\r\n') is None
+        assert _parse_stream_slot(b'GET /?token=abc HTTP/1.1\r\n\r\n') is None
+        assert _parse_stream_slot(b'garbage') is None
+
+
+class TestResumeRouting:
+    def setup_method(self):
+        self.counts = SessionCounts(3)
+        self.ready = {0: True, 1: True, 2: True}
+        self.balancer = ConnectionBalancer(
+            RESUME_CONFIG, self.counts, lambda slot: self.ready[slot]
+        )
+        self.workers = []
+        for slot in range(3):
+            channel, worker = _channels()
+            self.balancer.attach(slot, channel)
+            self.workers.append(worker)
+
+    def teardown_method(self):
+        for slot in range(3):
+            self.balancer.detach(slot)
+        for worker in self.workers:
+            worker.close()
+
+    def _received(self):
+        return [_received(worker) for worker in self.workers]
+
+    async def test_a_resumed_session_goes_to_the_worker_of_its_stream(self):
+        client, server = socket.socketpair()
+        server.setblocking(False)
+        client.sendall(b'GET /?token=abc&session_id=2.xyz HTTP/1.1\r\n\r\n')
+
+        await self.balancer._route(server)
+
+        assert self._received() == [0, 0, 1]
+        client.close()
+
+    def test_the_worker_of_the_stream_is_skipped_when_not_ready(self, connection):
+        self.ready[2] = False
+
+        self.balancer._dispatch(connection, owner=2)
+
+        assert self._received() == [1, 0, 0]
+
+
+class TestTenantAffinity:
+    def setup_method(self):
+        self.counts = SessionCounts(4)
+        self.token_cache = Mock()
+        self.token_cache.get.return_value = None
+        self.auth_client = Mock(
+            get_token=AsyncMock(side_effect=AuthenticationError('unknown token'))
+        )
+        self.balancer = ConnectionBalancer(
+            AFFINITY_CONFIG,
+            self.counts,
+            lambda slot: True,
+            self.token_cache,
+            self.auth_client,
+        )
+        self.workers = []
+        for slot in range(4):
+            channel, worker = _channels()
+            self.balancer.attach(slot, channel)
+            self.workers.append(worker)
+
+    def teardown_method(self):
+        for slot in range(4):
+            self.balancer.detach(slot)
+        for worker in self.workers:
+            worker.close()
+
+    def _received(self):
+        return [_received(worker) for worker in self.workers]
+
+    async def _dispatch(self, connection, token):
+        request = f'GET /?token={token} HTTP/1.1\r\n\r\n'.encode()
+        self.balancer._dispatch(connection, await self.balancer._affinity_key(request))
+
+    async def test_connections_of_a_tenant_go_to_the_same_worker(self, connection):
+        self.token_cache.get.side_effect = lambda token_id: {
+            'metadata': {'tenant_uuid': 'tenant'}
+        }
+
+        for token in ('a', 'b', 'c', 'd', 'e', 'f'):
+            await self._dispatch(connection, token)
+
+        assert sorted(self._received()) == [0, 0, 0, 6]
+
+    async def test_uncached_tokens_of_a_tenant_go_to_the_same_worker(self, connection):
+        token = {'metadata': {'tenant_uuid': 'tenant'}}
+        self.auth_client.get_token.side_effect = None
+        self.auth_client.get_token.return_value = token
+
+        for token_id in ('a', 'b'):
+            await self._dispatch(connection, token_id)
+
+        assert sorted(self._received()) == [0, 0, 0, 2]
+        self.token_cache.put.assert_any_call('a', token)
+        self.token_cache.put.assert_any_call('b', token)
+
+    async def test_unknown_token_is_used_as_key(self, connection):
+        request = b'GET /?token=abc HTTP/1.1\r\n\r\n'
+
+        assert await self.balancer._affinity_key(request) == 'abc'
+        self.token_cache.get.assert_called_once_with('abc')
+        self.auth_client.get_token.assert_awaited_once_with('abc')
+
+    async def test_no_token_goes_to_the_least_loaded_worker(self, connection):
+        for _ in range(4):
+            self.balancer._dispatch(connection, await self.balancer._affinity_key(b''))
+
+        assert self._received() == [1, 1, 1, 1]
+
+    async def test_request_is_peeked(self):
+        client, server = socket.socketpair()
+        server.setblocking(False)
+        client.sendall(b'GET /?token=abc HTTP/1.1\r\n')
+        asyncio.get_running_loop().call_later(0.05, client.sendall, b'\r\n')
+
+        await self.balancer._route(server)
+
+        assert sum(self._received()) == 1
+        self.token_cache.get.assert_called_once_with('abc')
+        client.close()
+
+
+class TestReceiveConnections:
+    async def test_passed_connections_are_served(self, connection):
+        channel, worker = _channels()
+        protocol = Mock(spec=asyncio.Protocol)
+        counts = SessionCounts(1)
+        task = asyncio.create_task(
+            receive_connections(worker, lambda: protocol, None, counts, 0)
+        )
+
+        socket.send_fds(channel, [b'\0'], [connection.fileno()])
+        for _ in range(100):
+            if protocol.connection_made.called:
+                break
+            await asyncio.sleep(0.01)
+        channel.close()
+        await asyncio.wait_for(task, 1)
+
+        protocol.connection_made.assert_called_once()
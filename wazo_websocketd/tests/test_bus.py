@@ -4,7 +4,7 @@
 from __future__ import annotations
 
 from datetime import datetime
-from unittest.mock import Mock, sentinel
+from unittest.mock import AsyncMock, Mock
 from uuid import uuid4
 
 import pytest
@@ -12,7 +12,15 @@ from xivo.auth_verifier import AccessCheck
 
 from ..bus import BusConsumer, BusMessage
 from ..config import _DEFAULT_CONFIG
-from ..exception import BusConnectionLostError, EventPermissionError, InvalidEvent
+from ..exception import (
+    BusConnectionError,
+    BusConnectionLostError,
+    EventPermissionError,
+    InvalidEvent,
+)
+from ..subscription import compile_filter
+
+FILTER = [{'path': 'data.queue_id', 'operator': '==', 'value': 12}]
 
 
 def _token(**metadata):
@@ -112,24 +120,126 @@ class TestBusDispatching:
     def setup_method(self):
         self.consumer = _consumer()
         self.consumer._access = Mock(AccessCheck)
+        self.handler = Mock()
+        self.consumer.set_handler(self.handler)
+        self.consumer._subscriptions.add('foo')
 
-    async def test_a_lost_connection_is_raised_to_whoever_is_consuming(self):
+    async def test_a_lost_connection_is_handed_to_the_handler(self):
         await self.consumer.connection_lost()
 
-        with pytest.raises(BusConnectionLostError):
-            async for _ in self.consumer:
-                pass
+        (error,), _ = self.handler.call_args
+        assert isinstance(error, BusConnectionLostError)
+
+    async def test_a_received_event_is_handed_to_the_handler(self):
+        properties = _properties(name='foo', required_acl='some.acl')
+        channel = Mock(basic_client_ack=AsyncMock())
+
+        await self.consumer._on_message(channel, b'{}', Mock(), properties)
+
+        self.handler.assert_called_once_with(
+            BusMessage('foo', properties.headers, 'some.acl', {}, '{}')
+        )
+        channel.basic_client_ack.assert_awaited_once()
+
+    async def test_an_event_rejected_by_the_subscription_filter_is_dropped(self):
+        self.consumer._subscriptions.add('bar', compile_filter(FILTER))
+        properties = _properties(name='bar', required_acl='some.acl')
+        channel = Mock(basic_client_ack=AsyncMock())
+
+        await self.consumer._on_message(
+            channel, b'{"data": {"queue_id": 2}}', Mock(), properties
+        )
+        await self.consumer._on_message(
+            channel, b'{"data": {"queue_id": 12}}', Mock(), properties
+        )
+
+        (event,), _ = self.handler.call_args
+        assert self.handler.call_count == 1
+        assert event.content == {'data': {'queue_id': 12}}
+        assert channel.basic_client_ack.await_count == 2
+
+    async def test_an_event_without_subscription_is_dropped(self):
+        properties = _properties(name='bar', required_acl='some.acl')
+        channel = Mock(basic_client_ack=AsyncMock())
+
+        await self.consumer._on_message(channel, b'{}', Mock(), properties)
+
+        self.handler.assert_not_called()
+
+
+class TestBusConsume:
+    def setup_method(self):
+        self.consumer = _consumer(purpose='internal')
+        self.channel = self.consumer._channel = Mock(
+            queue_bind=AsyncMock(),
+            queue_unbind=AsyncMock(),
+            basic_consume=AsyncMock(return_value={'consumer_tag': 'tag'}),
+        )
+
+    async def test_subscriptions_are_bound_when_consuming_starts(self):
+        await self.consumer.bind('foo')
+        await self.consumer.bind('bar')
+        await self.consumer.unbind('bar')
+        self.channel.queue_bind.assert_not_awaited()
+        self.channel.queue_unbind.assert_not_awaited()
 
-    async def test_a_queued_event_is_handed_to_the_consumer(self):
-        event = BusMessage(
-            'foo', sentinel.headers, 'some.acl', sentinel.payload, sentinel.content
+        await self.consumer.consume()
+        await self.consumer.consume()
+
+        assert self.consumer.is_consuming
+        self.channel.queue_bind.assert_awaited_once()
+        assert self.channel.queue_bind.await_args.kwargs['arguments']['name'] == 'foo'
+        self.channel.basic_consume.assert_awaited_once()
+
+    async def test_subscriptions_are_bound_at_once_while_consuming(self):
+        await self.consumer.consume()
+
+        await self.consumer.bind('foo')
+
+        self.channel.queue_bind.assert_awaited_once()
+
+    async def test_a_consumer_without_channel_is_stopped(self):
+        consumer = _consumer(purpose='internal')
+        consumer._connection.get_channel = AsyncMock(side_effect=BusConnectionError)
+        with pytest.raises(BusConnectionError):
+            await consumer.start()
+
+        await consumer.stop()
+
+        consumer._connection.remove_consumer.assert_called_once_with(consumer)
+
+
+class TestBusCanReceive:
+    def _message(self, **headers):
+        return BusMessage('foo', headers, 'some.acl', {}, '{}')
+
+    def test_a_user_receives_its_own_events_and_the_broadcasts(self):
+        consumer = _consumer(purpose='user', admin=False)
+        consumer._access = Mock(AccessCheck)
+        user_uuid, tenant_uuid = consumer._user.uuid, consumer._user.tenant_uuid
+
+        assert consumer.can_receive(
+            self._message(
+                **{'tenant_uuid': tenant_uuid, f'user_uuid:{user_uuid}': True}
+            )
+        )
+        assert consumer.can_receive(
+            self._message(**{'tenant_uuid': tenant_uuid, 'user_uuid:*': True})
+        )
+        assert not consumer.can_receive(
+            self._message(**{'tenant_uuid': tenant_uuid, 'user_uuid:other': True})
+        )
+        assert not consumer.can_receive(
+            self._message(**{'tenant_uuid': 'other', 'user_uuid:*': True})
         )
 
-        await self.consumer._queue.put(event)
+    def test_the_acl_is_checked(self):
+        consumer = _consumer(purpose='internal')
+        consumer._access = Mock(AccessCheck)
+        consumer._access.matches_required_access.return_value = False
+        tenant_uuid = consumer._user.tenant_uuid
 
-        async for message in self.consumer:
-            assert message == event
-            break
+        assert not consumer.can_receive(self._message(tenant_uuid=tenant_uuid))
 
 
 class TestBusBindings:
@@ -162,3 +272,21 @@ class TestBusBindings:
             {'name': 'some_event', 'origin_uuid': origin_uuid},
         ]
         assert consumer._generate_bindings('*') == [{'origin_uuid': origin_uuid}]
+
+    def test_a_pattern_is_bound_like_a_wildcard(self):
+        consumer = _consumer(purpose='internal')
+
+        assert consumer._generate_bindings('call_*') == consumer._generate_bindings('*')
+
+    async def test_unbinding_a_pattern_keeps_the_bindings_of_other_patterns(self):
+        consumer = _consumer(purpose='internal')
+        consumer._channel = Mock(queue_bind=AsyncMock(), queue_unbind=AsyncMock())
+        consumer._consumer_tag = 'tag'
+        await consumer.bind('call_*')
+        await consumer.bind('chatd_*')
+
+        await consumer.unbind('call_*')
+        consumer._channel.queue_unbind.assert_not_awaited()
+
+        await consumer.unbind('chatd_*')
+        consumer._channel.queue_unbind.assert_awaited_once()
@@ -0,0 +1,62 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+import math
+
+import pytest
+
+from ..codec import JSONCodec, OrjsonCodec, load_codec
+
+
+def _orjson_codec():
+    pytest.importorskip('orjson')
+    return OrjsonCodec()
+
+
+@pytest.fixture(params=[JSONCodec, _orjson_codec], ids=['json', 'orjson'])
+def codec(request):
+    return request.param()
+
+
+class TestCodecs:
+    def test_a_document_survives_a_round_trip(self, codec):
+        document = {'name': 'foo', 'data': {'id': 1, 'tags': ['é', None, True]}}
+
+        assert codec.loads(codec.dumps(document)) == document
+
+    @pytest.mark.parametrize('data', ['{invalid', '', '{"a": 1,}'])
+    def test_an_invalid_document_raises_a_value_error(self, codec, data):
+        with pytest.raises(ValueError):
+            codec.loads(data)
+
+
+class TestOrjsonCodec:
+    @pytest.mark.parametrize('data', ['[NaN, Infinity, -Infinity]', '"\\ud800"'])
+    def test_documents_accepted_by_json_are_decoded(self, data):
+        codec = _orjson_codec()
+
+        assert repr(codec.loads(data)) == repr(json.loads(data))
+
+    def test_large_integers_are_decoded_as_floats(self):
+        codec = _orjson_codec()
+
+        assert codec.loads('{"id": 36893488147419103232}') == {'id': 2.0**65}
+
+    def test_large_integers_are_encoded(self):
+        codec = _orjson_codec()
+
+        assert codec.loads(codec.dumps({'id': 2**65})) == {'id': 2**65}
+
+    def test_nan_is_encoded_as_null(self):
+        codec = _orjson_codec()
+
+        assert codec.loads(codec.dumps([math.nan, math.inf])) == [None, None]
+
+
+class TestLoadCodec:
+    def test_the_standard_library_is_used_by_default(self):
+        assert isinstance(load_codec('json'), JSONCodec)
+
+    def test_an_unknown_codec_falls_back_to_the_standard_library(self):
+        assert type(load_codec('unknown')) is JSONCodec
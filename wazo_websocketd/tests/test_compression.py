@@ -0,0 +1,68 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+from unittest import TestCase
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import OP_PING, OP_TEXT, Frame
+
+from ..compression import CompressionFactory, CompressionStats, create_extensions
+
+CONFIG = {
+    'enabled': True,
+    'level': 6,
+    'memory_level': 5,
+    'server_max_window_bits': 12,
+    'client_max_window_bits': 12,
+    'server_no_context_takeover': False,
+    'client_no_context_takeover': False,
+    'min_size': 64,
+}
+
+
+class TestCompression(TestCase):
+    def setUp(self):
+        self.stats = CompressionStats()
+        factory = CompressionFactory(CONFIG, self.stats)
+        self.params, self.extension = factory.process_request_params([], [])
+        self.client = PerMessageDeflate(False, False, 12, 12)
+
+    def test_negotiated_parameters(self):
+        assert ('server_max_window_bits', '12') in self.params
+        assert self.extension.local_max_window_bits == 12
+
+    def test_large_message_is_compressed(self):
+        payload = json.dumps([{'name': 'call_updated', 'uuid': 'abc'}] * 20)
+        frame = Frame(OP_TEXT, payload.encode())
+
+        encoded = self.extension.encode(frame)
+
+        assert encoded.rsv1
+        assert len(encoded.data) < len(frame.data)
+        assert self.client.decode(encoded).data == frame.data
+        values = self.stats.collect()
+        assert values['messages'] == 1
+        assert values['bytes_in'] == len(frame.data)
+        assert values['bytes_out'] == len(encoded.data)
+        assert values['ratio'] < 1
+
+    def test_small_message_is_sent_uncompressed(self):
+        frame = Frame(OP_TEXT, b'{"op": "start"}')
+
+        encoded = self.extension.encode(frame)
+
+        assert encoded is frame
+        assert self.client.decode(encoded).data == frame.data
+        assert self.stats.collect()['skipped'] == 1
+
+    def test_control_frames_are_not_counted(self):
+        self.extension.encode(Frame(OP_PING, b''))
+
+        values = self.stats.collect()
+        assert values['messages'] == values['skipped'] == 0
+
+    def test_disabled(self):
+        config = dict(CONFIG, enabled=False)
+
+        assert create_extensions(config, self.stats) == []
@@ -0,0 +1,54 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import re
+from unittest.mock import AsyncMock, Mock
+
+from ..drain import drain
+
+CONFIG = {'window': 0.05, 'batches': 3, 'reconnect_max_delay': 100}
+
+
+def _server(count):
+    return Mock(
+        server=Mock(),
+        websockets={Mock(close=AsyncMock()) for _ in range(count)},
+    )
+
+
+class TestDrain:
+    async def test_sessions_are_closed_in_batches(self):
+        ws_server = _server(7)
+        closed = []
+        loop = asyncio.get_event_loop()
+        for ws in ws_server.websockets:
+            ws.close.side_effect = lambda *args: closed.append(loop.time())
+
+        start = loop.time()
+        await drain(ws_server, CONFIG)
+
+        ws_server.server.close.assert_called_once_with()
+        assert len(closed) == 7
+        # 3 batches of at most 3 sessions, spread over the window
+        assert max(closed) - start >= 2 * CONFIG['window'] / 3 * 0.9
+        for ws in ws_server.websockets:
+            code, reason = ws.close.await_args.args
+            assert code == 1001
+            match = re.fullmatch(r'reconnect after (\d+) ms', reason)
+            assert match and 0 <= int(match.group(1)) <= 100
+
+    async def test_no_sessions(self):
+        ws_server = _server(0)
+
+        await drain(ws_server, CONFIG)
+
+        ws_server.server.close.assert_called_once_with()
+
+    async def test_no_window_leaves_the_sessions_to_the_server(self):
+        ws_server = _server(2)
+
+        await drain(ws_server, dict(CONFIG, window=0))
+
+        for ws in ws_server.websockets:
+            ws.close.assert_not_awaited()
@@ -0,0 +1,39 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import sys
+
+import pytest
+
+from ..eventloop import loop_factory, run
+
+
+class TestLoopFactory:
+    def test_the_standard_library_is_used_by_default(self):
+        assert loop_factory('asyncio') is asyncio.new_event_loop
+
+    def test_uvloop_is_used_when_installed(self):
+        uvloop = pytest.importorskip('uvloop')
+
+        assert loop_factory('uvloop') is uvloop.new_event_loop
+
+    def test_uvloop_falls_back_to_the_standard_library(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, 'uvloop', None)  # not installed
+
+        assert loop_factory('uvloop') is asyncio.new_event_loop
+
+    def test_an_unknown_loop_falls_back_to_the_standard_library(self):
+        assert loop_factory('unknown') is asyncio.new_event_loop
+
+
+class TestRun:
+    def test_the_coroutine_runs_until_complete(self):
+        async def main():
+            await asyncio.sleep(0)
+            return asyncio.get_running_loop()
+
+        loop = run(main(), 'asyncio')
+
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+        assert loop.is_closed()
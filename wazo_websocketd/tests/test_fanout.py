@@ -0,0 +1,223 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from __future__ import annotations
+
+import json
+import socket
+from unittest.mock import Mock, patch
+
+from xivo.auth_verifier import AccessCheck
+
+from ..bus import decode_event
+from ..codec import JSONCodec
+from ..config import _DEFAULT_CONFIG
+from ..exception import BusConnectionLostError
+from ..fanout import _EVENT, _RESET, EventFanout, EventRelay, EventRing
+from .test_bus import _token
+from .test_snapshot import _cache
+
+
+def _record(name='foo', body=None, **headers):
+    headers = {'name': name, 'required_acl': 'some.acl', **headers}
+    content = json.dumps({'name': name} if body is None else body).encode()
+    return _EVENT + json.dumps(headers).encode() + b'\n' + content
+
+
+class TestEventRing:
+    def test_records_are_read_in_order(self):
+        ring = EventRing(1024)
+        cursor = ring.head
+
+        ring.write(b'one')
+        ring.write(b'two')
+
+        assert ring.read(cursor) == ([b'one', b'two'], ring.head)
+        assert ring.read(ring.head) == ([], ring.head)
+
+    def test_records_wrap_around(self):
+        ring = EventRing(1024)
+        cursor = ring.head
+        for index in range(100):
+            ring.write(b'%03d' % index + b'x' * 40)
+            records, cursor = ring.read(cursor)  # type: ignore[misc]
+
+            assert records == [b'%03d' % index + b'x' * 40]
+
+    def test_a_lapped_reader_lost_records(self):
+        ring = EventRing(1024)
+        cursor = ring.head
+
+        for _ in range(30):
+            ring.write(b'x' * 40)
+
+        assert ring.read(cursor) is None
+
+    def test_records_larger_than_the_ring_are_refused(self):
+        ring = EventRing(1024)
+
+        assert not ring.write(b'x' * 1024)
+        assert ring.head == 0
+
+
+class TestEventFanout:
+    def setup_method(self):
+        self.ring = EventRing(65536)
+        self.wakeup, self.relay_end = socket.socketpair(
+            socket.AF_UNIX, socket.SOCK_DGRAM
+        )
+        config = dict(_DEFAULT_CONFIG, uuid='origin')
+        self.fanout = EventFanout(config, self.ring, self.wakeup, JSONCodec())
+
+    def teardown_method(self):
+        self.wakeup.close()
+        self.relay_end.close()
+
+    def _consumer(self, **metadata):
+        consumer = self.fanout.create_consumer(_token(**metadata))
+        consumer._access = Mock(AccessCheck)
+        handler = Mock()
+        consumer.set_handler(handler)
+        return consumer, handler
+
+    def _publish(self, *records):
+        for record in records:
+            self.ring.write(record)
+        self.fanout._on_wakeup()
+
+    async def test_events_are_delivered_to_the_subscribed_consumers(self):
+        consumer, handler = self._consumer(purpose='internal')
+        other, other_handler = self._consumer(purpose='internal')
+        tenant_uuid = consumer._user.tenant_uuid
+        await consumer.bind('foo')
+        await other.bind('bar')
+        await consumer.consume()
+        await other.consume()
+
+        self._publish(_record('foo', tenant_uuid=tenant_uuid))
+
+        (message,) = handler.call_args.args
+        assert message.name == 'foo'
+        assert message.content == {'name': 'foo'}
+        other_handler.assert_not_called()
+
+    async def test_events_are_not_delivered_before_consuming(self):
+        consumer, handler = self._consumer(purpose='internal')
+        await consumer.bind('foo')
+
+        self._publish(_record('foo', tenant_uuid=consumer._user.tenant_uuid))
+
+        handler.assert_not_called()
+
+    async def test_events_of_other_tenants_are_not_delivered(self):
+        consumer, handler = self._consumer(purpose='internal')
+        await consumer.bind('foo')
+        await consumer.consume()
+
+        self._publish(_record('foo', tenant_uuid='other'))
+
+        handler.assert_not_called()
+
+    async def test_patterns(self):
+        consumer, handler = self._consumer(purpose='internal')
+        tenant_uuid = consumer._user.tenant_uuid
+        await consumer.consume()
+        await consumer.bind('call_*')
+        await consumer.bind('call_created')
+
+        self._publish(
+            _record('call_created', tenant_uuid=tenant_uuid),
+            _record('call_ended', tenant_uuid=tenant_uuid),
+            _record('other', tenant_uuid=tenant_uuid),
+        )
+        await consumer.unbind('call_*')
+        self._publish(_record('call_ended', tenant_uuid=tenant_uuid))
+
+        names = [call.args[0].name for call in handler.call_args_list]
+        assert names == ['call_created', 'call_ended']
+
+    async def test_stopped_consumers_are_removed(self):
+        consumer, handler = self._consumer(purpose='internal')
+        await consumer.bind('foo')
+        await consumer.consume()
+
+        await consumer.stop()
+        self._publish(_record('foo', tenant_uuid=consumer._user.tenant_uuid), _RESET)
+
+        handler.assert_not_called()
+        assert not self.fanout._names
+
+    async def test_lost_events_are_notified(self):
+        consumer, handler = self._consumer(purpose='internal')
+        await consumer.consume()
+
+        self._publish(_RESET)
+
+        (error,) = handler.call_args.args
+        assert isinstance(error, BusConnectionLostError)
+
+    async def test_a_lapped_worker_notifies_its_consumers(self):
+        consumer, handler = self._consumer(purpose='internal')
+        await consumer.consume()
+
+        for _ in range(2000):
+            self.ring.write(_record('foo'))
+        self.fanout._on_wakeup()
+
+        (error,) = handler.call_args.args
+        assert isinstance(error, BusConnectionLostError)
+
+    async def test_events_nobody_receives_are_not_decoded(self):
+        consumer, handler = self._consumer(purpose='internal')
+        await consumer.bind('foo')
+        await consumer.consume()
+        tenant_uuid = consumer._user.tenant_uuid
+
+        with patch('wazo_websocketd.fanout.decode_event') as decode_event:
+            self._publish(_record('bar', tenant_uuid=tenant_uuid))
+            decode_event.assert_not_called()
+
+            self._publish(_record('foo', tenant_uuid=tenant_uuid))
+            decode_event.assert_called_once()
+
+    def test_listeners_receive_the_events_of_their_names(self):
+        listener = Mock()
+        self.fanout.add_listener(listener, ['foo', 'bar'])
+
+        self._publish(_record('foo'), _record('baz'), _record('bar'), b'E{}\nnot json')
+
+        assert [call.args[0].name for call in listener.call_args_list] == [
+            'foo',
+            'bar',
+        ]
+
+    async def test_events_not_cached_are_not_decoded_for_the_last_value_cache(self):
+        last_value_cache = _cache()
+        self.fanout.add_listener(last_value_cache.put, last_value_cache.event_names)
+
+        with patch('wazo_websocketd.fanout.decode_event', wraps=decode_event) as decode:
+            self._publish(_record('bar', body={'name': 'bar', 'data': {'id': 1}}))
+            decode.assert_not_called()
+
+            self._publish(_record('agent', body={'name': 'agent', 'data': {'id': 1}}))
+            decode.assert_called_once()
+        assert len(last_value_cache) == 1
+
+
+class TestEventRelay:
+    async def test_events_are_written_and_workers_woken_up(self):
+        ring = EventRing(4096)
+        relay = EventRelay(dict(_DEFAULT_CONFIG, uuid='origin'), ring)
+        relay_end, worker_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        relay.attach(0, relay_end)
+        properties = Mock(headers={'name': 'foo', 'required_acl': b'some.acl'})
+
+        await relay._on_message(Mock(), b'{}', Mock(), properties)
+        await relay._on_message(Mock(), b'{}', Mock(), properties)
+        relay._wake_up()
+
+        records, _ = ring.read(0)  # type: ignore[misc]
+        assert records == [_record('foo', body={}), _record('foo', body={})]
+        assert worker_end.recv(64) == b'\0'
+        relay.detach(0)
+        worker_end.close()
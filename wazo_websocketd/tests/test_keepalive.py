@@ -0,0 +1,137 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+from unittest.mock import AsyncMock, Mock
+
+from ..config import _DEFAULT_CONFIG
+from ..keepalive import KeepaliveScheduler
+
+
+def _ws():
+    ws = Mock()
+    ws.pong_waiters = []
+
+    def ping():
+        waiter = asyncio.get_event_loop().create_future()
+        ws.pong_waiters.append(waiter)
+        return waiter
+
+    ws.ping = AsyncMock(side_effect=ping)
+    return ws
+
+
+async def _ticks(scheduler, count):
+    for _ in range(count):
+        scheduler.process_tick()
+        await asyncio.sleep(0)  # let the pings be sent
+
+
+class TestKeepaliveScheduler:
+    async def test_sessions_are_spread_over_the_interval(self):
+        scheduler = KeepaliveScheduler(4, 1)
+
+        entries = [scheduler.register(_ws()) for _ in range(8)]
+
+        assert sorted(entry.bucket for entry in entries) == [0, 0, 1, 1, 2, 2, 3, 3]
+
+    async def test_an_idle_session_is_pinged_once_per_interval(self):
+        scheduler = KeepaliveScheduler(2, 1)
+        entry = scheduler.register(ws := _ws())
+        entry.last_activity -= 2
+
+        await _ticks(scheduler, 2)
+
+        ws.ping.assert_awaited_once_with()
+
+    async def test_a_session_with_recent_traffic_is_not_pinged(self):
+        scheduler = KeepaliveScheduler(2, 1)
+        scheduler.register(ws := _ws())
+
+        await _ticks(scheduler, 2)
+
+        ws.ping.assert_not_awaited()
+
+    async def test_a_session_that_does_not_answer_is_closed(self):
+        scheduler = KeepaliveScheduler(4, 1)
+        entry = scheduler.register(ws := _ws())
+        entry.last_activity -= 4
+
+        await _ticks(scheduler, 2)
+
+        ws.fail_connection.assert_called_once_with(1011, 'keepalive ping timeout')
+        assert len(scheduler) == 0
+
+    async def test_a_session_that_answers_is_kept(self):
+        scheduler = KeepaliveScheduler(4, 1)
+        entry = scheduler.register(ws := _ws())
+        entry.last_activity -= 4
+
+        await _ticks(scheduler, 1)
+        (pong_waiter,) = ws.pong_waiters
+        pong_waiter.set_result(None)
+        await asyncio.sleep(0)
+        await _ticks(scheduler, 1)
+
+        ws.fail_connection.assert_not_called()
+        assert len(scheduler) == 1
+
+    async def test_a_client_that_does_not_read_does_not_delay_the_others(self):
+        scheduler = KeepaliveScheduler(4, 1)
+        stuck = scheduler.register(stuck_ws := _ws())
+        stuck_ws.ping = AsyncMock(side_effect=asyncio.Event().wait)  # full buffer
+        other = scheduler.register(other_ws := _ws())
+        scheduler._buckets[other.bucket].discard(other)
+        other.bucket = stuck.bucket
+        scheduler._buckets[other.bucket].add(other)
+        stuck.last_activity -= 4
+        other.last_activity -= 4
+
+        await _ticks(scheduler, 2)
+
+        other_ws.ping.assert_awaited_once_with()
+        stuck_ws.fail_connection.assert_called_once_with(1011, 'keepalive ping timeout')
+
+    async def test_an_unexpected_ping_error_does_not_stop_the_pings(self):
+        scheduler = KeepaliveScheduler(1, 1)
+        entry = scheduler.register(ws := _ws())
+        ping = ws.ping
+        ws.ping = AsyncMock(side_effect=RuntimeError())
+        entry.last_activity -= 2
+
+        await _ticks(scheduler, 1)
+        ws.ping = ping
+        entry.last_activity -= 2
+        await _ticks(scheduler, 1)
+
+        ping.assert_awaited_once_with()
+
+    async def test_a_timeout_longer_than_the_interval_is_honoured(self):
+        scheduler = KeepaliveScheduler(2, 4)
+        entry = scheduler.register(ws := _ws())
+        entry.last_activity -= 2
+
+        await _ticks(scheduler, 4)
+        ws.fail_connection.assert_not_called()
+        await _ticks(scheduler, 1)
+
+        ws.fail_connection.assert_called_once_with(1011, 'keepalive ping timeout')
+
+    async def test_a_dead_peer_is_reaped_within_40s_with_the_default_config(self):
+        # as with the 20s pings and 20s timeout of websockets, used previously
+        websocket: dict = _DEFAULT_CONFIG['websocket']  # type: ignore[assignment]
+        delays = []
+        for phase in range(websocket['ping_interval'] + 1):
+            scheduler = KeepaliveScheduler(
+                websocket['ping_interval'], websocket['ping_timeout']
+            )
+            entry = scheduler.register(ws := _ws())
+            await _ticks(scheduler, phase)  # the peer is active, then dies
+            elapsed = 0.0
+            while not ws.fail_connection.called:
+                entry.last_activity -= scheduler._tick
+                await _ticks(scheduler, 1)
+                elapsed += scheduler._tick
+            delays.append(elapsed)
+
+        assert max(delays) <= 40
@@ -0,0 +1,242 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import asyncio
+import os
+import signal
+import socket
+import time
+from functools import partial
+from unittest.mock import Mock
+
+import pytest
+import websockets.client
+from websockets.server import WebSocketServer, WebSocketServerProtocol
+
+from ..balancer import CountingServerProtocol, SessionCounts
+from ..process import (
+    ProcessPool,
+    WebsocketServer,
+    WorkerHeartbeats,
+    _listening,
+    _respawn_delay,
+)
+
+
+class _CrashingPool(ProcessPool):
+    @classmethod
+    def _main(cls, config, worker, *args):
+        os._exit(1)
+
+
+class _HungPool(ProcessPool):
+    @classmethod
+    def _main(cls, config, worker, *args):
+        time.sleep(60)
+
+
+class _HealthyPool(ProcessPool):
+    @classmethod
+    def _main(cls, config, worker, *args):
+        signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+        while True:
+            worker.heartbeats.beat(worker.slot)
+            time.sleep(0.05)
+
+
+class _BalancedPool(ProcessPool):
+    @classmethod
+    def _main(cls, config, worker, *args):
+        signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+        worker.channel.settimeout(0.05)
+        connections = []
+        while True:
+            worker.heartbeats.beat(worker.slot)
+            try:
+                _, fds, _, _ = socket.recv_fds(worker.channel, 1, 1)
+            except TimeoutError:
+                continue
+            for fd in fds:
+                connections.append(socket.socket(fileno=fd))
+                worker.counts.on_open(worker.slot)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def config():
+    return {
+        'process_workers': 2,
+        'worker_start_method': 'forkserver',
+        'cpu_affinity': {'enabled': False},
+        'load_balancing': 'reuse_port',
+        'bus': {'fanout': {'enabled': False}},
+        'supervisor': {
+            'heartbeat_interval': 0.1,
+            'liveness_timeout': 3,
+            'respawn_max_delay': 0.2,
+        },
+        'drain': {'window': 0},
+        'token_cache': {'enabled': False},
+        'stats_log_interval': 0,
+    }
+
+
+@pytest.fixture(autouse=True)
+def keep_cwd():
+    cwd = os.getcwd()
+    yield
+    os.chdir(cwd)
+
+
+async def _wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'timed out'
+        await asyncio.sleep(0.05)
+
+
+class TestRespawnDelay:
+    def test_first_crash_is_respawned_right_away(self):
+        assert _respawn_delay(0, 30) == 0
+
+    def test_backoff_is_exponential_and_bounded(self):
+        delays = [_respawn_delay(failures, 30) for failures in range(1, 8)]
+
+        assert delays == [1, 2, 4, 8, 16, 30, 30]
+
+
+class TestWorkerHeartbeats:
+    def test_beat(self):
+        heartbeats = WorkerHeartbeats(2)
+
+        heartbeats.beat(1)
+
+        assert heartbeats.last(0) == 0.0
+        assert 0 <= time.monotonic() - heartbeats.last(1) < 1
+        heartbeats.reset(1)
+        assert heartbeats.last(1) == 0.0
+
+
+class TestProtocolFactory:
+    async def _serve(self, protocol_class):
+        async def ws_handler(ws, path):
+            await ws.send(path)
+
+        ws_server = WebSocketServer()
+        protocol_factory = WebsocketServer._make_protocol_factory(
+            protocol_class, Mock(ws_handler=ws_handler), ws_server, None, []
+        )
+        loop = asyncio.get_running_loop()
+        create_server = partial(loop.create_server, protocol_factory, '127.0.0.1', 0)
+        async with _listening(ws_server, create_server):
+            (sock,) = ws_server.sockets
+            port = sock.getsockname()[1]
+            async with websockets.client.connect(f'ws://127.0.0.1:{port}/?a=1') as ws:
+                assert await ws.recv() == '/?a=1'
+                assert ws_server.websockets
+
+    async def test_sessions_are_served(self):
+        await self._serve(WebSocketServerProtocol)
+
+    async def test_sessions_of_a_worker_are_counted(self):
+        counts = SessionCounts(1)
+
+        await self._serve(partial(CountingServerProtocol, counts=counts, slot=0))
+
+        assert counts.closed(0) == 1
+
+
+class TestProcessPool:
+    async def test_crashed_worker_is_respawned(self, config):
+        pool = _CrashingPool(config)
+
+        async with pool:
+            await _wait_for(lambda: all(w.restarts >= 2 for w in pool._workers))
+
+        assert all(not worker.alive for worker in pool._workers)
+
+    async def test_hung_worker_is_killed(self, config):
+        pool = _HungPool(config)
+
+        async with pool:
+            worker = pool._workers[0]
+            await _wait_for(lambda: worker.process is not None)
+            first = worker.process
+            await _wait_for(lambda: worker.process is not first)
+
+            assert first and first.exitcode == -signal.SIGKILL
+            assert worker.restarts == 1
+
+    async def test_healthy_workers_are_kept(self, config):
+        pool = _HealthyPool(config)
+
+        async with pool:
+            await asyncio.sleep(1)
+
+            assert all(worker.alive for worker in pool._workers)
+            assert all(worker.restarts == 0 for worker in pool._workers)
+            assert all(value.startswith('alive(') for value in pool.status().values())
+
+    async def test_spawned_workers(self, config):
+        config['worker_start_method'] = 'spawn'
+        pool = _HealthyPool(config)
+
+        async with pool:
+            await _wait_for(lambda: all(pool._serving(w) for w in pool._workers))
+
+    def test_unknown_start_method(self, config):
+        config['worker_start_method'] = 'fork'
+
+        with pytest.raises(ValueError):
+            ProcessPool(config)
+
+    def test_tenant_affinity_requires_the_token_cache(self, config):
+        config['load_balancing'] = 'tenant_affinity'
+        config['token_cache'] = {'enabled': False}
+
+        with pytest.raises(ValueError):
+            ProcessPool(config)
+
+    async def test_rolling_restart(self, config):
+        pool = _HealthyPool(config)
+
+        async with pool:
+            await _wait_for(lambda: all(pool._serving(w) for w in pool._workers))
+            pids = {worker.process and worker.process.pid for worker in pool._workers}
+
+            pool.rolling_restart()
+            assert pool._restart_task
+            await asyncio.wait_for(pool._restart_task, 10)
+
+            assert all(pool._serving(worker) for worker in pool._workers)
+            new_pids = {
+                worker.process and worker.process.pid for worker in pool._workers
+            }
+            assert not pids & new_pids
+            assert all(worker.restarts == 0 for worker in pool._workers)
+
+    async def test_connections_go_to_the_least_loaded_worker(self, config):
+        port = _free_port()
+        config['load_balancing'] = 'least_sessions'
+        config['websocket'] = {
+            'listen': '127.0.0.1',
+            'port': port,
+            'ssl': None,
+            'resume': {'enabled': False},
+        }
+        pool = _BalancedPool(config)
+
+        async with pool:
+            await _wait_for(lambda: all(pool._serving(w) for w in pool._workers))
+            clients = [socket.create_connection(('127.0.0.1', port)) for _ in range(4)]
+            counts = pool._counts
+            await _wait_for(lambda: counts.sessions(0) + counts.sessions(1) == 4)
+
+            assert counts.sessions(0) == counts.sessions(1) == 2
+            for client in clients:
+                client.close()
@@ -2,11 +2,17 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import json
+from unittest.mock import Mock, patch
 
 import pytest
 
 from ..exception import SessionProtocolError
-from ..protocol import SessionProtocolDecoder, SessionProtocolEncoder
+from ..protocol import SessionProtocolDecoder, SessionProtocolEncoder, binary_protocol
+
+
+def _message(event):
+    raw = json.dumps(event)
+    return Mock(raw=raw, content=json.loads(raw))
 
 
 class TestProtocolEncoder:
@@ -46,9 +52,26 @@ class TestProtocolEncoder:
             },
         }
 
-        encoded = json.loads(self.encoder.encode_event(event))
+        encoded = self.encoder.encode_event(_message(event), 7)
+
+        assert encoded == json.dumps({'op': 'event', 'code': 0, 'id': 7, 'data': event})
+
+    def test_encode_events(self):
+        events = [{'name': 'foo', 'data': {}}, {'name': 'bar', 'data': {'id': 1}}]
+
+        encoded = self.encoder.encode_events([_message(e) for e in events], 9)
+
+        assert json.loads(encoded) == {
+            'op': 'events',
+            'code': 0,
+            'id': 9,
+            'data': events,
+        }
+
+    def test_encode_init_of_a_resumable_session(self):
+        encoded = json.loads(self.encoder.encode_init(3, 'abc', resumed=True))
 
-        assert encoded == {'op': 'event', 'code': 0, 'data': event}
+        assert encoded['data'] == {'version': 3, 'session_id': 'abc', 'resumed': True}
 
 
 class TestProtocolDecoder:
@@ -93,6 +116,24 @@ class TestProtocolDecoder:
 
         assert message.op == 'subscribe'
         assert message.value == 'foo'
+        assert message.filter is None
+
+    def test_decode_subscribe_with_filters(self):
+        message = self.decoder.decode(
+            '{"op": "subscribe", "data": {"event_name": "foo", "filters": '
+            '[{"path": "data.queue_id", "operator": "in", "value": [1, 2]}]}}'
+        )
+
+        assert message.value == 'foo'
+        assert message.filter({'data': {'queue_id': 2}})
+        assert not message.filter({'data': {'queue_id': 3}})
+
+    def test_decode_subscribe_with_invalid_filters(self):
+        with pytest.raises(SessionProtocolError):
+            self.decoder.decode(
+                '{"op": "subscribe", "data": {"event_name": "foo", "filters": '
+                '[{"path": "data.queue_id", "operator": "<"}]}}'
+            )
 
     def test_decode_token(self):
         token = 'bc9571dd-bc62-4044-b78f-0bfb8a1481e4'
@@ -109,3 +150,84 @@ class TestProtocolDecoder:
 
         assert message.op == 'ping'
         assert message.value == 'abcd'
+
+
+class TestBinaryProtocol:
+    @pytest.fixture(params=['msgpack', 'cbor'])
+    def protocol(self, request):
+        pytest.importorskip({'msgpack': 'msgpack', 'cbor': 'cbor2'}[request.param])
+        encoder, decoder = binary_protocol(request.param)
+        return encoder, decoder, encoder._binary_codec
+
+    def test_encode_event(self, protocol):
+        encoder, _, codec = protocol
+        event = {'name': 'foo', 'data': {'id': 1, 'mobile': False}}
+
+        encoded = encoder.encode_event(_message(event), 7)
+
+        assert codec.loads(encoded) == {
+            'op': 'event',
+            'code': 0,
+            'id': 7,
+            'data': event,
+        }
+
+    def test_encode_events(self, protocol):
+        encoder, _, codec = protocol
+        events = [{'name': 'foo', 'data': {'id': i}} for i in range(20)]
+
+        encoded = encoder.encode_events([_message(e) for e in events], 42)
+
+        assert codec.loads(encoded) == {
+            'op': 'events',
+            'code': 0,
+            'id': 42,
+            'data': events,
+        }
+
+    def test_an_event_is_encoded_once_for_all_the_sessions(self, protocol):
+        encoder, _, codec = protocol
+        message = _message({'name': 'foo', 'data': {'id': 1}})
+
+        with patch.object(codec, 'dumps', wraps=codec.dumps) as dumps:
+            first = encoder.encode_event(message, 1)
+            second = encoder.encode_event(message, 2)
+
+        assert codec.loads(second)['data'] == codec.loads(first)['data']
+        assert [call.args[0] for call in dumps.call_args_list].count(
+            message.content
+        ) == 1
+
+    def test_an_event_msgpack_cannot_encode_raises_a_value_error(self):
+        pytest.importorskip('msgpack')
+        encoder, _ = binary_protocol('msgpack')
+        message = _message({'name': 'foo', 'data': {'id': 2**64}})
+
+        with pytest.raises(ValueError):
+            encoder.encode_event(message, 1)
+
+    def test_decode_subscribe(self, protocol):
+        _, decoder, codec = protocol
+        data = codec.dumps({'op': 'subscribe', 'data': {'event_name': 'foo'}})
+
+        message = decoder.decode(data)
+
+        assert message.op == 'subscribe'
+        assert message.value == 'foo'
+
+    @pytest.mark.parametrize(
+        'payload',
+        [
+            pytest.param('{"op": "start"}', id='text frame'),
+            pytest.param(b'\xc1', id='invalid document'),
+        ],
+    )
+    def test_a_malformed_message_is_refused(self, protocol, payload):
+        _, decoder, _ = protocol
+
+        with pytest.raises(SessionProtocolError):
+            decoder.decode(payload)
+
+    def test_an_unknown_encoding_is_refused(self):
+        with pytest.raises(SessionProtocolError):
+            binary_protocol('xml')
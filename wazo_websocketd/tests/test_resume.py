@@ -0,0 +1,74 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import logging
+from unittest.mock import Mock
+
+from ..resume import ReplayBuffer, StreamRegistry, stream_slot
+
+_CONFIG = {'enabled': True, 'max_age': 30, 'max_bytes': 1024}
+
+
+def _message(size=10):
+    return Mock(raw='x' * size)
+
+
+class TestReplayBuffer:
+    def test_events_following_an_id(self):
+        buffer = ReplayBuffer(max_bytes=100, max_age=10)
+        messages = [_message() for _ in range(3)]
+        for message in messages:
+            buffer.append(message, now=0)
+
+        assert buffer.since(1) == [(2, messages[1]), (3, messages[2])]
+        assert buffer.since(3) == []
+        assert buffer.since(0) == list(enumerate(messages, 1))
+
+    def test_unknown_id(self):
+        buffer = ReplayBuffer(max_bytes=100, max_age=10)
+        buffer.append(_message(), now=0)
+
+        assert buffer.since(2) is None
+        assert buffer.since(-1) is None
+
+    def test_events_are_evicted_by_size(self):
+        buffer = ReplayBuffer(max_bytes=25, max_age=10)
+        messages = [_message() for _ in range(3)]
+        for message in messages:
+            buffer.append(message, now=0)
+
+        assert len(buffer) == 2
+        assert buffer.since(0) is None
+        assert buffer.since(1) == [(2, messages[1]), (3, messages[2])]
+
+    def test_events_are_evicted_by_age(self):
+        buffer = ReplayBuffer(max_bytes=100, max_age=10)
+        buffer.append(_message(), now=0)
+        buffer.append(_message(), now=5)
+        buffer.append(_message(), now=12)
+
+        assert len(buffer) == 2
+        assert buffer.since(0) is None
+        assert buffer.since(3) == []
+
+
+class TestStreamRegistry:
+    async def test_stream_ids_carry_the_worker_slot(self):
+        async with StreamRegistry(_CONFIG, slot=3) as streams:
+            stream = streams.create('user', Mock())
+
+        assert stream_slot(stream.id) == 3
+
+    async def test_stream_ids_without_worker(self):
+        async with StreamRegistry(_CONFIG) as streams:
+            stream = streams.create('user', Mock())
+
+        assert stream_slot(stream.id) is None
+
+    async def test_a_stream_of_another_worker_is_not_resumed(self, caplog):
+        caplog.set_level(logging.INFO)
+        async with StreamRegistry(_CONFIG, slot=0) as streams:
+            resumed = streams.resume('1.abcdef', 'user', 0)
+
+        assert resumed is None
+        assert 'it belongs to worker 1, not 0' in caplog.text
@@ -1,25 +1,61 @@
 # Copyright 2016-2026 The Wazo Authors  (see the AUTHORS file)
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from unittest.mock import Mock
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
+from websockets.exceptions import ConnectionClosedError
 
-from ..exception import NoTokenError
-from ..session import Session, _extract_token_id
+from ..bus import BusMessage
+from ..exception import (
+    AdmissionRejectedError,
+    BusConnectionError,
+    BusConnectionLostError,
+    NoTokenError,
+)
+from ..protocol import SessionProtocolEncoder, _Message, binary_protocol
+from ..resume import StreamRegistry
+from ..session import Session, SessionFactory, _extract_token_id
 
-_CONFIG = {'websocket': {'ping_interval': 30}}
+_CONFIG = {
+    'websocket': {
+        'batch_max_events': 3,
+        'batch_max_bytes': 1024,
+        'batch_flush_interval': 0.01,
+        'max_queued_bytes': 1024,
+    }
+}
 
 
-def _make_session():
+_RESUME_CONFIG = {'enabled': True, 'max_age': 30, 'max_bytes': 1024}
+
+
+def _make_session(
+    authenticator=None,
+    bus_service=None,
+    ws=None,
+    path='/',
+    encoder=None,
+    streams=None,
+    last_value_cache=None,
+    admission=None,
+):
+    if streams is None:
+        streams = StreamRegistry(dict(_RESUME_CONFIG, enabled=False))
     return Session(
         _CONFIG,
+        authenticator or Mock(),
+        bus_service or Mock(),
+        encoder or Mock(),
         Mock(),
         Mock(),
-        Mock(),
-        Mock(),
-        Mock(),
-        '/',
+        streams,
+        last_value_cache or Mock(enabled=False),
+        ws or Mock(),
+        path,
+        admission,
     )
 
 
@@ -37,6 +73,360 @@ class TestSessionUserIdentity:
         assert session.user_identity() == ('user-uuid-1234', 'tenant-uuid-5678')
 
 
+async def _wait_forever():
+    await asyncio.Event().wait()
+
+
+class TestSessionRun:
+    @pytest.fixture(autouse=True)
+    def master_tenant(self):
+        with patch('wazo_websocketd.session.MasterTenantProxy') as proxy:
+            proxy.has_master_tenant.return_value = True
+            yield
+
+    def setup_method(self):
+        self.consumer = Mock(start=AsyncMock(), stop=AsyncMock())
+        self.authenticator = Mock(
+            get_token=AsyncMock(return_value={'metadata': {'uuid': 'user-uuid'}})
+        )
+        self.ws = Mock(
+            recv=AsyncMock(side_effect=_wait_forever),
+            send=AsyncMock(),
+            close=AsyncMock(),
+        )
+        self.admission = Mock()
+        self.session = _make_session(
+            self.authenticator,
+            Mock(create_consumer=AsyncMock(return_value=self.consumer)),
+            self.ws,
+            '/?token=abcdef',
+            admission=self.admission,
+        )
+
+    async def test_the_handshake_slot_is_released_once_initialized(self):
+        run = asyncio.create_task(self.session.run())
+        await asyncio.sleep(0.01)
+
+        self.admission.handshake_done.assert_called_once_with()
+        run.cancel()
+        await asyncio.gather(run, return_exceptions=True)
+
+    async def test_the_session_is_closed_when_the_bus_connection_is_lost(self):
+        run = asyncio.create_task(self.session.run())
+        await asyncio.sleep(0.01)
+
+        (handler,), _ = self.consumer.set_handler.call_args
+        handler(BusConnectionLostError())
+        await run
+
+        self.ws.close.assert_awaited_once_with(1011, 'bus connection lost')
+        self.authenticator.schedule_check.return_value.cancel.assert_called_once()
+        self.consumer.stop.assert_awaited_once()
+
+    async def test_the_consumer_is_stopped_when_it_fails_to_start(self):
+        self.consumer.start.side_effect = BusConnectionError
+
+        await self.session.run()
+
+        self.ws.close.assert_awaited_once_with(1011, 'bus connection error')
+        self.consumer.stop.assert_awaited_once()
+        self.consumer.set_handler.assert_not_called()
+
+    async def test_a_v1_session_is_closed_when_events_would_be_lost(self):
+        self.session._max_queued_bytes = 20
+        run = asyncio.create_task(self.session.run())
+        await asyncio.sleep(0.01)
+        self.session._started = True
+
+        (handler,), _ = self.consumer.set_handler.call_args
+        for name in 'abc':
+            handler(_message(name))
+        await run
+
+        self.ws.close.assert_awaited_once_with(1011, 'events lost')
+        raw_events = [call.args[0] for call in self.ws.send.await_args_list[1:]]
+        assert raw_events == []
+
+
+class TestSessionFactory:
+    async def test_rejected_connections_are_asked_to_retry_later(self):
+        admission = Mock(admit=AsyncMock(side_effect=AdmissionRejectedError('full')))
+        config = dict(_CONFIG, admission={'retry_max_delay': 1000})
+        factory = SessionFactory(
+            config, Mock(), Mock(), Mock(), Mock(), Mock(), Mock(), Mock(), admission
+        )
+        ws = Mock(close=AsyncMock(), request_headers={})
+
+        await factory.ws_handler(ws, '/')
+
+        code, reason = ws.close.await_args.args
+        assert code == 1013
+        assert reason.startswith('reconnect after ')
+
+
+class _Connection:
+    def __init__(self):
+        self.lost: asyncio.Future = asyncio.get_event_loop().create_future()
+        self.ws = Mock(
+            recv=AsyncMock(side_effect=self._recv),
+            send=AsyncMock(),
+            close=AsyncMock(),
+        )
+
+    async def _recv(self):
+        await self.lost
+
+    def lose(self):
+        self.lost.set_exception(ConnectionClosedError(None, None))
+
+    def sent(self):
+        return [json.loads(call.args[0]) for call in self.ws.send.await_args_list]
+
+
+class TestSessionResume:
+    @pytest.fixture(autouse=True)
+    def master_tenant(self):
+        with patch('wazo_websocketd.session.MasterTenantProxy') as proxy:
+            proxy.has_master_tenant.return_value = True
+            yield
+
+    def setup_method(self):
+        self.consumer = Mock(start=AsyncMock(), stop=AsyncMock(), consume=AsyncMock())
+        self.bus_service = Mock(create_consumer=AsyncMock(return_value=self.consumer))
+        self.authenticator = Mock(
+            get_token=AsyncMock(return_value={'metadata': {'uuid': 'user-uuid'}})
+        )
+        self.streams = StreamRegistry(_RESUME_CONFIG)
+
+    async def _connect(self, query=''):
+        connection = _Connection()
+        session = _make_session(
+            self.authenticator,
+            self.bus_service,
+            connection.ws,
+            f'/?token=abcdef&version=2{query}',
+            SessionProtocolEncoder(),
+            self.streams,
+        )
+        task = asyncio.create_task(session.run())
+        await asyncio.sleep(0.01)
+        return connection, session, task
+
+    def _deliver(self, name):
+        (handler,), _ = self.consumer.set_handler.call_args
+        handler(_message(name))
+
+    async def test_missed_events_are_replayed_when_the_session_is_resumed(self):
+        connection, session, task = await self._connect()
+        session._started = True
+        self._deliver('a')
+        self._deliver('b')
+        await asyncio.sleep(0.01)
+        init, event_a, event_b = connection.sent()
+        session_id = init['data']['session_id']
+        assert (event_a['id'], event_b['id']) == (1, 2)
+
+        connection.lose()
+        await task
+        self.consumer.stop.assert_not_awaited()
+        self._deliver('c')
+
+        query = f'&session_id={session_id}&last_event_id=1'
+        connection, _, task = await self._connect(query)
+
+        assert connection.sent() == [
+            {
+                'op': 'init',
+                'code': 0,
+                'data': {'version': 2, 'session_id': session_id, 'resumed': True},
+            },
+            {'op': 'event', 'code': 0, 'id': 2, 'data': {'name': 'b'}},
+            {'op': 'event', 'code': 0, 'id': 3, 'data': {'name': 'c'}},
+        ]
+        self.bus_service.create_consumer.assert_awaited_once()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.consumer.stop.assert_awaited_once()
+
+    async def test_unknown_session_starts_a_new_stream(self):
+        connection, _, task = await self._connect('&session_id=x&last_event_id=3')
+
+        (init,) = connection.sent()
+        assert init['data']['resumed'] is False
+        assert init['data']['session_id'] != 'x'
+        self.bus_service.create_consumer.assert_awaited_once()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def test_detached_stream_expires(self):
+        self.streams = StreamRegistry(dict(_RESUME_CONFIG, max_age=0.01))
+        connection, _, task = await self._connect()
+
+        connection.lose()
+        await task
+        await asyncio.sleep(0.05)
+
+        self.consumer.stop.assert_awaited_once()
+        assert len(self.streams) == 0
+
+
+def _message(name):
+    raw = json.dumps({'name': name})
+    return BusMessage(name, {}, None, json.loads(raw), raw)
+
+
+class TestSessionSnapshot:
+    def setup_method(self):
+        self.ws = Mock(send=AsyncMock())
+        self.cache = Mock(enabled=True)
+        self.session = _make_session(
+            ws=self.ws, encoder=SessionProtocolEncoder(), last_value_cache=self.cache
+        )
+        self.session._consumer = Mock(bind=AsyncMock(), consume=AsyncMock())
+        self.session._protocol_version = 2
+        self.session._initialized = True
+
+    def _events(self):
+        sent = [json.loads(call.args[0]) for call in self.ws.send.await_args_list]
+        return [msg['data']['name'] for msg in sent if msg['op'] == 'event']
+
+    async def test_cached_events_are_sent_when_the_session_starts(self):
+        a, b = _message('a'), _message('b')
+        self.cache.snapshot.side_effect = [[a], [a, b]]
+
+        await self.session._do_ws_subscribe(_Message('subscribe', 'a'))
+        await self.session._do_ws_subscribe(_Message('subscribe', '*'))
+        await asyncio.sleep(0.01)
+        assert self._events() == []
+
+        await self.session._do_ws_start(_Message('start', None))
+        await asyncio.sleep(0.01)
+
+        assert self._events() == ['a', 'b']
+        self.cache.snapshot.assert_called_with('*', self.session._consumer, None)
+        self.session._consumer.consume.assert_awaited_once()
+
+    async def test_events_received_while_starting_are_sent(self):
+        self.cache.snapshot.return_value = [_message('a')]
+        self.session._consumer.consume.side_effect = lambda: (
+            self.session._on_bus_message(_message('b'))
+        )
+
+        await self.session._do_ws_subscribe(_Message('subscribe', 'a'))
+        await self.session._do_ws_start(_Message('start', None))
+        await asyncio.sleep(0.01)
+
+        sent = [json.loads(call.args[0]) for call in self.ws.send.await_args_list]
+        assert [msg['op'] for msg in sent] == ['subscribe', 'start', 'event', 'event']
+        assert self._events() == ['a', 'b']
+
+    async def test_cached_events_are_sent_at_once_when_started(self):
+        self.session._started = True
+        self.cache.snapshot.return_value = [_message('a')]
+
+        await self.session._do_ws_subscribe(_Message('subscribe', 'a'))
+        await asyncio.sleep(0.01)
+
+        assert self._events() == ['a']
+
+
+class TestSessionTransmit:
+    def setup_method(self):
+        self.ws = Mock(send=AsyncMock())
+        self.session = _make_session(ws=self.ws, encoder=SessionProtocolEncoder())
+        self.session._started = True
+        self.session._initialized = True
+
+    def _sent(self):
+        return [json.loads(call.args[0]) for call in self.ws.send.await_args_list]
+
+    async def _drain(self):
+        if self.session._transmit_task:
+            await self.session._transmit_task
+
+    async def test_events_are_sent_one_by_one_with_protocol_v2(self):
+        self.session._protocol_version = 2
+
+        for name in ('a', 'b'):
+            self.session._on_bus_message(_message(name))
+        await self._drain()
+
+        assert self._sent() == [
+            {'op': 'event', 'code': 0, 'id': 1, 'data': {'name': 'a'}},
+            {'op': 'event', 'code': 0, 'id': 2, 'data': {'name': 'b'}},
+        ]
+
+    async def test_events_are_batched_with_protocol_v3(self):
+        self.session._protocol_version = 3
+
+        for name in ('a', 'b', 'c', 'd', 'e'):
+            self.session._on_bus_message(_message(name))
+        await self._drain()
+
+        assert self._sent() == [
+            {'op': 'events', 'code': 0, 'id': 3, 'data': [{'name': n} for n in 'abc']},
+            {'op': 'events', 'code': 0, 'id': 5, 'data': [{'name': n} for n in 'de']},
+        ]
+
+    async def test_overflowing_events_are_dropped_and_announced(self):
+        self.session._protocol_version = 2
+        self.session._max_queued_bytes = 60
+
+        # each event is 13 bytes long: only the last 4 are kept
+        for name in 'abcdefgh':
+            self.session._on_bus_message(_message(name))
+        await self._drain()
+
+        assert self._sent() == [
+            {'op': 'gap', 'code': 0, 'data': {'first_id': 1, 'last_id': 4}},
+            {'op': 'event', 'code': 0, 'id': 5, 'data': {'name': 'e'}},
+            {'op': 'event', 'code': 0, 'id': 6, 'data': {'name': 'f'}},
+            {'op': 'event', 'code': 0, 'id': 7, 'data': {'name': 'g'}},
+            {'op': 'event', 'code': 0, 'id': 8, 'data': {'name': 'h'}},
+        ]
+
+    async def test_a_batch_stops_at_a_gap(self):
+        self.session._protocol_version = 3
+        for event_id, name in ((1, 'a'), (2, 'b'), (5, 'e')):
+            self.session._enqueue(event_id, _message(name))
+        self.session._schedule_transmit()
+        await self._drain()
+
+        assert self._sent() == [
+            {'op': 'events', 'code': 0, 'id': 2, 'data': [{'name': n} for n in 'ab']},
+            {'op': 'gap', 'code': 0, 'data': {'first_id': 3, 'last_id': 4}},
+            {'op': 'events', 'code': 0, 'id': 5, 'data': [{'name': 'e'}]},
+        ]
+
+    @pytest.mark.parametrize('version', [2, 3])
+    async def test_events_that_cannot_be_encoded_are_dropped(self, version):
+        msgpack = pytest.importorskip('msgpack')
+        self.session._protocol_encoder, _ = binary_protocol('msgpack')
+        self.session._protocol_version = version
+        raw = json.dumps({'name': 'big', 'id': 2**64})
+        large = BusMessage('big', {}, None, json.loads(raw), raw)
+
+        for message in (_message('a'), large, _message('c')):
+            self.session._on_bus_message(message)
+        await self._drain()
+
+        sent = [msgpack.unpackb(call.args[0]) for call in self.ws.send.await_args_list]
+        assert [(msg['op'], msg.get('id')) for msg in sent] == [
+            ('event', 1),
+            ('gap', None),
+            ('event', 3),
+        ]
+        assert sent[1]['data'] == {'first_id': 2, 'last_id': 2}
+
+    async def test_events_are_not_sent_before_the_session_starts(self):
+        self.session._started = False
+
+        self.session._on_bus_message(_message('a'))
+        await self._drain()
+
+        self.ws.send.assert_not_awaited()
+
+
 class TestExtractTokenID:
     def setup_method(self):
         self.path = '/'
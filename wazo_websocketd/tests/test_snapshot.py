@@ -0,0 +1,121 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from ..bus import BusMessage
+from ..codec import JSONCodec
+from ..snapshot import LastValueCache
+from ..subscription import compile_filter
+
+TENANT = 'tenant-1'
+
+
+def _cache(**lvc):
+    lvc_config = {
+        'enabled': True,
+        'max_entries': 10,
+        'max_age': 60,
+        'events': {'presence': 'data.uuid', 'agent': 'data.id'},
+        **lvc,
+    }
+    config = {
+        'last_value_cache': lvc_config,
+        'bus': {'exchange_name': 'wazo-headers'},
+        'uuid': 'origin',
+    }
+    return LastValueCache(config, JSONCodec())
+
+
+def _event(name, tenant_uuid=TENANT, **data):
+    content = {'name': name, 'data': data}
+    headers = {'name': name, 'tenant_uuid': tenant_uuid, 'required_acl': 'acl'}
+    return BusMessage(name, headers, 'acl', content, json.dumps(content))
+
+
+class TestLastValueCache:
+    def setup_method(self):
+        self.cache = _cache()
+        self.consumer = Mock(can_receive=Mock(return_value=True))
+
+    async def test_the_last_event_of_each_entity_is_kept(self):
+        first, second, other = (
+            _event('presence', uuid='a', state='away'),
+            _event('presence', uuid='a', state='available'),
+            _event('presence', uuid='b', state='away'),
+        )
+        for event in (first, second, other):
+            self.cache.put(event)
+
+        snapshot = self.cache.snapshot('presence', self.consumer)
+
+        assert sorted(snapshot, key=id) == sorted([second, other], key=id)
+
+    async def test_entities_are_scoped_by_tenant(self):
+        self.cache.put(_event('presence', uuid='a'))
+        self.cache.put(_event('presence', tenant_uuid='tenant-2', uuid='a'))
+
+        assert len(self.cache) == 2
+
+    async def test_events_not_configured_or_without_key_are_ignored(self):
+        self.cache.put(_event('call_created', uuid='a'))
+        self.cache.put(_event('agent', uuid='a'))
+
+        assert len(self.cache) == 0
+
+    async def test_snapshot_is_checked_against_the_consumer(self):
+        allowed, denied = _event('presence', uuid='a'), _event('presence', uuid='b')
+        self.cache.put(allowed)
+        self.cache.put(denied)
+        self.consumer.can_receive.side_effect = lambda message: message is allowed
+
+        assert self.cache.snapshot('presence', self.consumer) == [allowed]
+
+    async def test_snapshot_of_a_pattern_with_a_filter(self):
+        presence, agent = _event('presence', uuid='a'), _event('agent', id=1)
+        self.cache.put(presence)
+        self.cache.put(agent)
+        event_filter = compile_filter([{'path': 'data.id', 'value': 1}])
+
+        assert self.cache.snapshot('*', self.consumer, event_filter) == [agent]
+
+    async def test_only_stars_are_wildcards(self):
+        self.cache.put(_event('presence', uuid='a'))
+        self.cache.put(_event('agent', id=1))
+
+        assert self.cache.snapshot('agen?', self.consumer) == []
+        assert self.cache.snapshot('[ap]*', self.consumer) == []
+        assert len(self.cache.snapshot('*en*', self.consumer)) == 2
+
+    async def test_received_events_are_decoded_like_the_bus_events(self):
+        content = json.dumps({'name': 'presence', 'data': {'uuid': 'a'}})
+        properties = Mock(headers={'name': 'presence', 'required_acl': b'acl'})
+
+        await self.cache._on_message(Mock(), content.encode(), Mock(), properties)
+        await self.cache._on_message(Mock(), b'{', Mock(), properties)
+
+        (message,) = self.cache.snapshot('presence', self.consumer)
+        assert message.acl == 'acl'
+        assert message.raw == content
+
+    async def test_least_recently_updated_entries_are_evicted(self):
+        self.cache = _cache(max_entries=2)
+        for uuid in 'abc':
+            self.cache.put(_event('presence', uuid=uuid))
+        self.cache.put(_event('presence', uuid='b', state='away'))
+        self.cache.put(_event('presence', uuid='d'))
+
+        snapshot = self.cache.snapshot('presence', self.consumer)
+
+        assert sorted(e.content['data']['uuid'] for e in snapshot) == ['b', 'd']
+
+    @pytest.mark.parametrize('enabled, events', [(False, None), (True, {})])
+    def test_disabled(self, enabled, events):
+        cache = _cache(
+            enabled=enabled, **({} if events is None else {'events': events})
+        )
+
+        assert not cache.enabled
@@ -0,0 +1,176 @@
+# Copyright 2026 The Wazo Authors  (see the AUTHORS file)
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import pytest
+
+from ..subscription import PatternTrie, Subscriptions, compile_filter
+
+QUEUE_12 = [{'path': 'data.queue_id', 'operator': '==', 'value': 12}]
+LINES = [{'path': 'data.line_id', 'operator': 'in', 'value': [1, 2]}]
+
+
+def _condition(operator, value):
+    return [{'path': 'data.id', 'operator': operator, 'value': value}]
+
+
+class TestCompileFilter:
+    def test_identical_filters_are_shared(self):
+        assert compile_filter(QUEUE_12) is compile_filter([dict(QUEUE_12[0])])
+
+    @pytest.mark.parametrize(
+        ('content', 'expected'),
+        [
+            ({'data': {'queue_id': 12}}, True),
+            ({'data': {'queue_id': 13}}, False),
+            ({'data': {}}, False),
+            ({'data': 'queue_id'}, False),
+            ({}, False),
+        ],
+    )
+    def test_equality(self, content, expected):
+        assert compile_filter(QUEUE_12)(content) is expected
+
+    @pytest.mark.parametrize(
+        ('value', 'content', 'expected'),
+        [
+            (1, 1, True),
+            (1, 1.0, True),
+            (True, True, True),
+            (1, True, False),
+            (True, 1, False),
+            (True, 1.0, False),
+            (0, False, False),
+            (False, 0, False),
+        ],
+    )
+    def test_booleans_are_not_numbers(self, value, content, expected):
+        data = {'data': {'id': content}}
+
+        assert compile_filter(_condition('==', value))(data) is expected
+        assert compile_filter(_condition('!=', value))(data) is not expected
+        assert compile_filter(_condition('in', [value]))(data) is expected
+
+    def test_membership(self):
+        event_filter = compile_filter(LINES)
+
+        assert event_filter({'data': {'line_id': 2}})
+        assert not event_filter({'data': {'line_id': 3}})
+        assert not event_filter({'data': {'line_id': [1]}})
+
+    def test_all_conditions_must_match(self):
+        event_filter = compile_filter(QUEUE_12 + LINES)
+
+        assert event_filter({'data': {'queue_id': 12, 'line_id': 1}})
+        assert not event_filter({'data': {'queue_id': 12, 'line_id': 3}})
+
+    @pytest.mark.parametrize(
+        'conditions',
+        [
+            [],
+            {'path': 'data.id'},
+            ['data.id'],
+            [{'operator': '==', 'value': 1}],
+            [{'path': 'data.id', 'operator': '>', 'value': 1}],
+            [{'path': 'data.id', 'operator': 'in', 'value': 1}],
+            [{'path': 'data.id', 'operator': 'in', 'value': [[1]]}],
+            [{'path': 'data.id', 'operator': '==', 'value': {'a': 1}}],
+        ],
+    )
+    def test_malformed_filters_are_refused(self, conditions):
+        with pytest.raises(ValueError):
+            compile_filter(conditions)
+
+
+class TestSubscriptions:
+    def setup_method(self):
+        self.subscriptions = Subscriptions()
+
+    def test_unfiltered_subscription_accepts_everything(self):
+        self.subscriptions.add('foo', compile_filter(QUEUE_12))
+        self.subscriptions.add('foo')
+
+        assert self.subscriptions.accepts('foo', {})
+        assert not self.subscriptions.accepts('bar', {})
+
+    def test_any_filter_of_a_subscription_may_match(self):
+        self.subscriptions.add('foo', compile_filter(QUEUE_12))
+        self.subscriptions.add('foo', compile_filter(LINES))
+
+        assert self.subscriptions.accepts('foo', {'data': {'queue_id': 12}})
+        assert self.subscriptions.accepts('foo', {'data': {'line_id': 1}})
+        assert not self.subscriptions.accepts('foo', {'data': {'line_id': 3}})
+
+    def test_wildcard_subscription(self):
+        self.subscriptions.add('*', compile_filter(QUEUE_12))
+
+        assert self.subscriptions.accepts('foo', {'data': {'queue_id': 12}})
+        assert not self.subscriptions.accepts('foo', {'data': {'queue_id': 1}})
+
+    def test_removed_subscription(self):
+        self.subscriptions.add('foo')
+        self.subscriptions.remove('foo')
+
+        assert 'foo' not in self.subscriptions
+        assert not self.subscriptions.accepts('foo', {})
+
+    @pytest.mark.parametrize(
+        ('pattern', 'name', 'expected'),
+        [
+            ('*', 'call_created', True),
+            ('call_*', 'call_created', True),
+            ('call_*', 'call_', True),
+            ('call_*', 'chatd_message', False),
+            ('call_*', 'call', False),
+            ('*_updated', 'call_updated', True),
+            ('*_updated', 'call_created', False),
+            ('call_*_updated', 'call_dtmf_updated', True),
+            ('call_*_updated', 'call_updated', False),
+        ],
+    )
+    def test_pattern_subscription(self, pattern, name, expected):
+        self.subscriptions.add(pattern)
+
+        assert self.subscriptions.accepts(name, {}) is expected
+
+    def test_pattern_and_exact_name_sharing_a_prefix(self):
+        self.subscriptions.add('ac')
+        self.subscriptions.add('a*', compile_filter(QUEUE_12))
+
+        assert self.subscriptions.accepts('ac', {})
+        assert not self.subscriptions.accepts('axc', {})
+        assert self.subscriptions.accepts('axc', {'data': {'queue_id': 12}})
+
+    def test_removed_pattern(self):
+        self.subscriptions.add('call_*')
+        self.subscriptions.add('call_*_updated')
+        assert self.subscriptions.accepts('call_created', {})
+
+        self.subscriptions.remove('call_*')
+
+        assert self.subscriptions.has_patterns()
+        assert not self.subscriptions.accepts('call_created', {})
+        assert self.subscriptions.accepts('call_held_updated', {})
+
+        self.subscriptions.remove('call_*_updated')
+
+        assert not self.subscriptions.has_patterns()
+
+
+class TestPatternTrie:
+    def test_the_matching_patterns_are_returned(self):
+        trie = PatternTrie()
+        for pattern in ('call_*', '*_updated', 'chatd_*'):
+            trie.add(pattern)
+
+        assert trie.match('call_updated') == {'call_*', '*_updated'}
+        assert trie.match('chatd_message') == {'chatd_*'}
+        assert not trie.match('user_created')
+
+    def test_a_removed_pattern_no_longer_matches(self):
+        trie = PatternTrie()
+        trie.add('call_*')
+
+        trie.remove('call_*')
+
+        assert not trie
+        assert not trie.match('call_created')